@@ -0,0 +1,465 @@
+# src/chat_server.py
+from __future__ import annotations
+
+import argparse
+import asyncio
+from collections import OrderedDict, deque
+from concurrent.futures import CancelledError, Future, ThreadPoolExecutor
+import json
+from pathlib import Path
+import queue
+import random
+import threading
+import time
+from typing import Any, Callable, Deque, Dict, Iterator, List, Optional, Tuple
+import uuid
+
+from src.chat_session import PERSONA_SYSTEM, ChatSession, SessionSettings
+from src.embedding_store import DEFAULT_ROOT as EMBED_STORE_ROOT
+from src.intent_heads import add_intent_heads_args, load_intent_heads
+from src.llm_backends import add_llm_backend_args, check_llm_backend_args, describe_llm_backend, make_chat_client
+from src.memory import MEMORY_BACKENDS
+from src.personality import get_profile
+from src.safety_cascade import add_safety_gate_args, make_safety_gate
+from src.safety_embed import SAFETY_BACKENDS, SafetyEmbedScorer
+from src.turn_engine import TurnEngine
+
+_STREAM_END = object()
+
+
+class SessionClosed(RuntimeError):
+    """A session's queued generation was dropped because the session was closed."""
+
+
+class FairQueue:
+    """
+    Generation jobs queued per client and served round-robin across clients.
+    A session has at most one job in flight (its turns hold the session lock),
+    so fairness has to be between clients: one client driving many sessions
+    (a load test, a bot farm) cannot hold every worker while others wait.
+    """
+
+    def __init__(self):
+        self._cond = threading.Condition()
+        self._pending: "OrderedDict[str, Deque[Tuple[str, Callable[[Any], Any], Future]]]" = OrderedDict()
+        self._closed = False
+
+    def put(self, client_id: str, session_id: str, job: Callable[[Any], Any]) -> Future:
+        fut: Future = Future()
+        with self._cond:
+            if self._closed:
+                raise RuntimeError("queue closed")
+            self._pending.setdefault(client_id, deque()).append((session_id, job, fut))
+            self._cond.notify()
+        return fut
+
+    def get(self) -> Optional[Tuple[Callable[[Any], Any], Future]]:
+        with self._cond:
+            while not self._pending and not self._closed:
+                self._cond.wait()
+            if not self._pending:
+                return None
+            client_id, jobs = self._pending.popitem(last=False)
+            _, job, fut = jobs.popleft()
+            if jobs:
+                # back of the line until every other waiting client had a turn
+                self._pending[client_id] = jobs
+            return job, fut
+
+    def drop(self, session_id: str) -> None:
+        dropped: List[Future] = []
+        with self._cond:
+            for client_id in list(self._pending):
+                jobs = self._pending[client_id]
+                dropped.extend(fut for sid, _, fut in jobs if sid == session_id)
+                kept = deque(item for item in jobs if item[0] != session_id)
+                if kept:
+                    self._pending[client_id] = kept
+                else:
+                    del self._pending[client_id]
+        for fut in dropped:
+            fut.cancel()
+
+    def __len__(self) -> int:
+        with self._cond:
+            return sum(len(jobs) for jobs in self._pending.values())
+
+    def close(self) -> None:
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+
+
+class LLMPool:
+    """
+    One chat client per worker thread, fed from a FairQueue. Each client keeps
+    its own state (for llama.cpp: KV context and prompt cache), so a worker
+    never interleaves two generations on one model context.
+    """
+
+    def __init__(self, factory: Callable[[], Any], workers: int = 1):
+        self.queue = FairQueue()
+        self.clients = [factory() for _ in range(max(1, workers))]
+        self._tokenizer_lock = threading.Lock()
+        self._threads = [
+            threading.Thread(target=self._work, args=(client,), name=f"llm-{i}", daemon=True)
+            for i, client in enumerate(self.clients)
+        ]
+        for t in self._threads:
+            t.start()
+
+    def _work(self, client: Any) -> None:
+        while True:
+            item = self.queue.get()
+            if item is None:
+                return
+            job, fut = item
+            if not fut.set_running_or_notify_cancel():
+                continue
+            try:
+                fut.set_result(job(client))
+            except BaseException as exc:
+                fut.set_exception(exc)
+
+    def submit(self, client_id: str, session_id: str, job: Callable[[Any], Any]) -> Future:
+        return self.queue.put(client_id, session_id, job)
+
+    def count_tokens(self, text: str) -> int:
+        # vocab-only call, so it bypasses the queue; turn threads take turns on it
+        with self._tokenizer_lock:
+            return self.clients[0].count_tokens(text)
+
+    def close(self) -> None:
+        self.queue.close()
+
+
+class PooledLLM:
+    """The chat/chat_stream/count_tokens surface TurnEngine expects, routed through the pool."""
+
+    def __init__(self, pool: LLMPool, session_id: str, client_id: str = ""):
+        self.pool = pool
+        self.session_id = session_id
+        self.client_id = client_id or session_id
+
+    def count_tokens(self, text: str) -> int:
+        return self.pool.count_tokens(text)
+
+    def _result(self, fut: Future) -> Any:
+        try:
+            return fut.result()
+        except CancelledError:
+            raise SessionClosed(f"session '{self.session_id}' was closed") from None
+
+    def chat(self, messages: List[Dict[str, str]]) -> str:
+        return self._result(self.pool.submit(self.client_id, self.session_id, lambda client: client.chat(messages)))
+
+    def chat_stream(self, messages: List[Dict[str, str]]) -> Iterator[str]:
+        deltas: "queue.Queue[Any]" = queue.Queue()
+
+        def _job(client: Any) -> None:
+            for text in client.chat_stream(messages):
+                deltas.put(text)
+
+        fut = self.pool.submit(self.client_id, self.session_id, _job)
+        # ends the stream however the job ends, including a drop before it ran
+        fut.add_done_callback(lambda _: deltas.put(_STREAM_END))
+        while True:
+            text = deltas.get()
+            if text is _STREAM_END:
+                break
+            yield text
+        self._result(fut)  # re-raise a generation error or the drop
+
+
+class _Hosted:
+    def __init__(self, session: ChatSession, llm: PooledLLM):
+        self.session = session
+        self.llm = llm
+        self.lock = asyncio.Lock()
+        self.last_used = time.monotonic()
+
+
+class ChatServer:
+    """
+    HTTP/JSON front end hosting many ChatSessions against one shared scorer and
+    one LLM pool. Turns of the same session run one at a time; turns of
+    different sessions run concurrently on `turn_threads` threads and only meet
+    at the pool's queue, which is fair between clients (`client_id` on session
+    creation, else the peer address).
+    """
+
+    def __init__(self, args: argparse.Namespace, scorer: Any, pool: LLMPool, memory_root: Optional[Path] = None):
+        self.args = args
+        self.scorer = scorer
+        self.pool = pool
+        self.memory_root = memory_root
+        self.engine = TurnEngine(scorer, intent_heads=load_intent_heads(args))
+        self.sessions: Dict[str, _Hosted] = {}
+        self.executor = ThreadPoolExecutor(max_workers=args.turn_threads, thread_name_prefix="turn")
+
+    # ---- session lifecycle -------------------------------------------------
+
+    def create_session(self, body: Dict[str, Any], peer: str = "") -> Dict[str, Any]:
+        a = self.args
+        session_id = uuid.uuid4().hex[:12]
+        client_id = str(body.get("client_id") or peer or session_id)
+        seed = body.get("seed")
+        rng = random.Random(seed)
+        persona = body.get("persona", a.persona)
+        if persona not in PERSONA_SYSTEM:
+            raise ValueError(f"Unknown persona '{persona}'")
+        settings = SessionSettings(
+            persona=persona,
+            threshold=float(body.get("threshold", a.threshold)),
+            bot_gender=body.get("bot_gender", a.bot_gender),
+            user_gender=body.get("user_gender", "unspecified"),
+            attraction=body.get("attraction", "unspecified"),
+            history_turns=a.history_turns,
+            context_budget=a.context_budget or max(256, a.n_ctx - a.max_tokens - 64),
+            memory_write_behind=a.memory_write_behind,
+            memory_backend=a.memory_backend,
+        )
+        bot_profile = get_profile(body.get("persona_profile", "random"), settings.bot_gender, rng=rng)
+        llm = PooledLLM(self.pool, session_id, client_id)
+        session = ChatSession(
+            settings,
+            bot_profile,
+            count_tokens=llm.count_tokens,
+            memory_id=body.get("memory_id"),
+            memory_suffix=f"_{session_id}",
+            rng=rng,
+            session_id=session_id,
+            memory_root=self.memory_root,
+        )
+        self.sessions[session_id] = _Hosted(session, llm)
+        return {
+            "session_id": session_id,
+            "bot": {"name": bot_profile.name, "pronouns": bot_profile.pronouns, "profile": bot_profile.profile_card()},
+            "memory_id": session.memory_id,
+            "trust": session.trust_level,
+        }
+
+    async def close_session(self, session_id: str) -> bool:
+        hosted = self.sessions.pop(session_id, None)
+        self.pool.queue.drop(session_id)
+        if hosted is None:
+            return False
+        async with hosted.lock:  # let an in-flight turn finish with its memory store
+            hosted.session.close()
+        return True
+
+    async def expire_idle(self) -> None:
+        while True:
+            await asyncio.sleep(max(1.0, self.args.session_ttl / 4))
+            cutoff = time.monotonic() - self.args.session_ttl
+            for sid in [sid for sid, h in self.sessions.items() if h.last_used < cutoff and not h.lock.locked()]:
+                await self.close_session(sid)
+
+    # ---- turns -------------------------------------------------------------
+
+    async def run_turn(
+        self,
+        hosted: _Hosted,
+        text: str,
+        on_sentence: Optional[Callable[[str], None]] = None,
+    ) -> Dict[str, Any]:
+        loop = asyncio.get_running_loop()
+        async with hosted.lock:
+            hosted.last_used = time.monotonic()
+            if hosted.session.closed:
+                return {"reply": "", "mode": "CLOSED"}
+            try:
+                out = await loop.run_in_executor(
+                    self.executor,
+                    lambda: self.engine.step(hosted.session, text, on_sentence=on_sentence, llm=hosted.llm),
+                )
+            except SessionClosed:
+                return {"reply": "", "mode": "CLOSED"}
+            hosted.last_used = time.monotonic()
+        result = out.as_dict()
+        result["closed"] = hosted.session.closed
+        return result
+
+    # ---- HTTP --------------------------------------------------------------
+
+    async def handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        try:
+            method, path, body = await _read_request(reader)
+            await self.route(method, path, body, writer)
+        except ValueError as exc:
+            await _write_json(writer, 400, {"error": str(exc)})
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        except Exception as exc:  # keep the server up; report to this client only
+            await _write_json(writer, 500, {"error": repr(exc)})
+        finally:
+            try:
+                writer.close()
+                await writer.wait_closed()
+            except ConnectionError:
+                pass
+
+    async def route(self, method: str, path: str, body: Dict[str, Any], writer: asyncio.StreamWriter) -> None:
+        parts = [p for p in path.split("?", 1)[0].split("/") if p]
+        if method == "GET" and parts == ["health"]:
+            await _write_json(
+                writer,
+                200,
+                {"ok": True, "sessions": len(self.sessions), "queued": len(self.pool.queue), "workers": len(self.pool.clients)},
+            )
+            return
+        if method == "POST" and parts == ["sessions"]:
+            peer = writer.get_extra_info("peername")
+            await _write_json(writer, 201, self.create_session(body, peer=str(peer[0]) if peer else ""))
+            return
+        if len(parts) >= 2 and parts[0] == "sessions":
+            session_id = parts[1]
+            if method == "DELETE" and len(parts) == 2:
+                found = await self.close_session(session_id)
+                await _write_json(writer, 200 if found else 404, {"closed": found})
+                return
+            hosted = self.sessions.get(session_id)
+            if hosted is None:
+                await _write_json(writer, 404, {"error": f"unknown session '{session_id}'"})
+                return
+            if method == "POST" and parts[2:] == ["turns"]:
+                text = str(body.get("text") or "").strip()
+                if not text:
+                    raise ValueError("'text' is required")
+                if body.get("stream"):
+                    await self.stream_turn(hosted, text, writer)
+                else:
+                    await _write_json(writer, 200, await self.run_turn(hosted, text))
+                return
+        await _write_json(writer, 404, {"error": f"no route for {method} {path}"})
+
+    async def stream_turn(self, hosted: _Hosted, text: str, writer: asyncio.StreamWriter) -> None:
+        """NDJSON over chunked transfer: one {"sentence": ...} line per guarded sentence, then {"turn": ...}."""
+        loop = asyncio.get_running_loop()
+        sentences: "asyncio.Queue[Any]" = asyncio.Queue()
+
+        def _on_sentence(sentence: str) -> None:
+            loop.call_soon_threadsafe(sentences.put_nowait, sentence)
+
+        writer.write(
+            b"HTTP/1.1 200 OK\r\nContent-Type: application/x-ndjson\r\n"
+            b"Transfer-Encoding: chunked\r\nConnection: close\r\n\r\n"
+        )
+        task = asyncio.ensure_future(self.run_turn(hosted, text, on_sentence=_on_sentence))
+        task.add_done_callback(lambda _: sentences.put_nowait(_STREAM_END))
+        while True:
+            item = await sentences.get()
+            if item is _STREAM_END:
+                break
+            await _write_chunk(writer, {"sentence": item})
+        try:
+            await _write_chunk(writer, {"turn": await task})
+        except Exception as exc:  # headers are already out; report in-band
+            await _write_chunk(writer, {"error": repr(exc)})
+        writer.write(b"0\r\n\r\n")
+        await writer.drain()
+
+
+async def _read_request(reader: asyncio.StreamReader) -> Tuple[str, str, Dict[str, Any]]:
+    request_line = (await reader.readline()).decode("latin-1").strip()
+    if not request_line:
+        raise ConnectionError("empty request")
+    try:
+        method, path, _ = request_line.split(" ", 2)
+    except ValueError:
+        raise ValueError(f"bad request line: {request_line!r}")
+    length = 0
+    while True:
+        line = (await reader.readline()).decode("latin-1").strip()
+        if not line:
+            break
+        name, _, value = line.partition(":")
+        if name.strip().lower() == "content-length":
+            length = int(value.strip())
+    body: Dict[str, Any] = {}
+    if length:
+        raw = await reader.readexactly(length)
+        try:
+            body = json.loads(raw.decode("utf-8"))
+        except json.JSONDecodeError as exc:
+            raise ValueError(f"invalid JSON body: {exc}")
+        if not isinstance(body, dict):
+            raise ValueError("JSON body must be an object")
+    return method.upper(), path, body
+
+
+_REASONS = {200: "OK", 201: "Created", 400: "Bad Request", 404: "Not Found", 500: "Internal Server Error"}
+
+
+async def _write_json(writer: asyncio.StreamWriter, status: int, payload: Dict[str, Any]) -> None:
+    data = json.dumps(payload).encode("utf-8")
+    writer.write(
+        f"HTTP/1.1 {status} {_REASONS.get(status, 'OK')}\r\nContent-Type: application/json\r\n"
+        f"Content-Length: {len(data)}\r\nConnection: close\r\n\r\n".encode("latin-1")
+        + data
+    )
+    await writer.drain()
+
+
+async def _write_chunk(writer: asyncio.StreamWriter, payload: Dict[str, Any]) -> None:
+    data = json.dumps(payload).encode("utf-8") + b"\n"
+    writer.write(f"{len(data):x}\r\n".encode("latin-1") + data + b"\r\n")
+    await writer.drain()
+
+
+async def serve(args: argparse.Namespace) -> None:
+    t0 = time.perf_counter()
+    scorer = SafetyEmbedScorer(args.safety_model, embed_store=args.embed_store or None, backend=args.safety_backend)
+    pool = LLMPool(lambda: make_chat_client(args), workers=args.llm_workers)
+    app = ChatServer(args, make_safety_gate(args, scorer), pool)
+    server = await asyncio.start_server(app.handle, args.host, args.port)
+    print(
+        f"[SERVE] http://{args.host}:{args.port} {describe_llm_backend(args)} llm_workers={args.llm_workers} "
+        f"turn_threads={args.turn_threads} loaded in {time.perf_counter() - t0:.1f}s",
+        flush=True,
+    )
+    reaper = asyncio.ensure_future(app.expire_idle())
+    try:
+        async with server:
+            await server.serve_forever()
+    finally:
+        reaper.cancel()
+        pool.close()
+        app.executor.shutdown(wait=False)
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Multi-session HTTP server for the v0.5 chatbot")
+    ap.add_argument("--host", default="127.0.0.1")
+    ap.add_argument("--port", type=int, default=8765)
+    ap.add_argument("--llm_workers", type=int, default=1, help="LLM client instances (each holds its own model + KV)")
+    ap.add_argument("--turn_threads", type=int, default=32, help="Max turns in flight across all sessions")
+    ap.add_argument("--session_ttl", type=float, default=1800.0, help="Idle seconds before a session is dropped")
+
+    ap.add_argument("--safety_model", default="models/safe_violation_clf_embed.joblib")
+    ap.add_argument(
+        "--safety_backend", default="auto", choices=list(SAFETY_BACKENDS), help="auto = int8 ONNX export if present"
+    )
+    ap.add_argument("--threshold", type=float, default=0.45)
+    ap.add_argument("--embed_store", default=str(EMBED_STORE_ROOT), help="Shared embedding store dir ('' disables)")
+    add_safety_gate_args(ap)
+    add_intent_heads_args(ap)
+    ap.add_argument("--persona", default="friendly", choices=list(PERSONA_SYSTEM.keys()))
+    ap.add_argument("--bot_gender", default="random", choices=["female", "male", "nonbinary", "random"])
+    ap.add_argument("--memory_backend", default="json", choices=list(MEMORY_BACKENDS))
+    ap.add_argument("--memory_write_behind", action="store_true", help="Save session memory in the background")
+
+    add_llm_backend_args(ap, default_prompt_cache="ram")
+    ap.add_argument("--history_turns", type=int, default=6)
+    ap.add_argument("--context_budget", type=int, default=0, help="0 = n_ctx - max_tokens - 64")
+    args = ap.parse_args()
+    check_llm_backend_args(ap, args)
+
+    try:
+        asyncio.run(serve(args))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
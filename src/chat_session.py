@@ -0,0 +1,258 @@
+# src/chat_session.py
+from __future__ import annotations
+
+from collections import OrderedDict
+from dataclasses import dataclass
+from datetime import datetime
+from pathlib import Path
+import random
+import threading
+from typing import Callable, Dict, List, Optional, Tuple
+
+from src.context_window import ContextWindow
+from src.conversation_phase import ConversationPhaseTracker
+from src.memory import open_memory_store
+from src.personality import get_profile, BotProfile
+from src.response_planner import StylePlan
+from src.safety_templates import EROTIC_ALLOWED_GUIDANCE
+from src.text_features import TurnFeatures, extract_features
+from src.trust import TrustState
+
+
+PERSONA_SYSTEM = {
+    "friendly": (
+        "You are a natural conversational partner on a dating app. "
+        "Keep replies short (1–3 sentences). Ask exactly one thoughtful question. "
+        "Be warm, curious, and specific."
+    ),
+    "flirty_adult_ok": (
+        "You are playful and lightly flirty on a dating app. Adult topics are allowed if mutual and respectful. "
+        "Never be coercive, never push for address/location, and always respect boundaries. "
+        "Keep replies short (1–2 sentences). Ask exactly one engaging question."
+    ),
+}
+
+_PROFILE_BLOCKS: "OrderedDict[int, Tuple[BotProfile, str]]" = OrderedDict()
+_PROFILE_BLOCKS_LOCK = threading.Lock()
+_PROFILE_BLOCKS_MAX = 64
+
+
+def profile_prompt_block(bot_profile: BotProfile) -> str:
+    """
+    The hidden context lines that only depend on the (frozen) profile: summary,
+    bio and photos. Rendered once per profile object; profiles hold lists and
+    are not hashable, so the cache is keyed by identity.
+    """
+    key = id(bot_profile)
+    with _PROFILE_BLOCKS_LOCK:
+        hit = _PROFILE_BLOCKS.get(key)
+        if hit is not None and hit[0] is bot_profile:
+            _PROFILE_BLOCKS.move_to_end(key)
+            return hit[1]
+    block = (
+        f"bot_profile={bot_profile.summary()}\n"
+        f"bio={' '.join(bot_profile.bio)}\n"
+        f"photos={bot_profile.photos_summary()}\n"
+        f"photos_prompt={bot_profile.photos_prompt()}\n"
+    )
+    with _PROFILE_BLOCKS_LOCK:
+        _PROFILE_BLOCKS[key] = (bot_profile, block)
+        while len(_PROFILE_BLOCKS) > _PROFILE_BLOCKS_MAX:
+            _PROFILE_BLOCKS.popitem(last=False)
+    return block
+
+
+def system_context_parts(
+    phase_state,
+    bot_profile: BotProfile,
+    memory_hooks: List[str],
+    allow_erotic: bool,
+    user_gender: str,
+    attraction: str,
+    trust_state: TrustState,
+    allow_city_share: bool,
+    style_plan: StylePlan,
+) -> Tuple[str, str, str]:
+    """(head, profile block, tail) of the hidden context; only head and tail are formatted per turn."""
+    mem = "; ".join(memory_hooks) if memory_hooks else "none"
+    erotic_note = EROTIC_ALLOWED_GUIDANCE if allow_erotic else "Keep replies non-explicit; slow down if needed."
+    attraction_line = f"attraction={attraction}" if attraction != "unspecified" else "attraction=unspecified"
+    user_gender_line = f"user_gender={user_gender}" if user_gender != "unspecified" else "user_gender=unspecified"
+    location_note = (
+        "If asked about location, keep it vague and city-level only."
+        if allow_city_share
+        else "Do not share location details."
+    )
+    plan_line = (
+        f"STYLE PLAN: plan={style_plan.plan} ask_question={'yes' if style_plan.ask_question else 'no'}; "
+        f"disclosure={style_plan.disclosure or 'none'}; story={style_plan.story or 'none'}; tease={style_plan.tease or 'none'}. "
+        "If a disclosure/story/tease is provided, weave it in naturally."
+    )
+    head = f"SYSTEM CONTEXT (hidden):\nphase={phase_state.phase.value}\n"
+    tail = (
+        f"trust_level={trust_state.level:.2f} tier={trust_state.tier()} consent={trust_state.consent_state}\n"
+        f"{user_gender_line}\n"
+        f"{attraction_line}\n"
+        f"memory={mem}\n"
+        "Instruction: be natural and human; do not assume the user's attraction unless specified; "
+        "identity is locked (name/gender/pronouns) and must remain consistent; avoid grandiose claims; "
+        "do not contradict your profile bio or photo descriptions; "
+        "escalate only if appropriate; "
+        "respect boundaries and avoid asking for address/location. "
+        f"{location_note} "
+        f"{erotic_note}\n"
+        f"{plan_line}"
+    )
+    return head, profile_prompt_block(bot_profile), tail
+
+
+def build_system_context(
+    phase_state,
+    bot_profile: BotProfile,
+    memory_hooks: List[str],
+    allow_erotic: bool,
+    user_gender: str,
+    attraction: str,
+    trust_state: TrustState,
+    allow_city_share: bool,
+    style_plan: StylePlan,
+) -> str:
+    return "".join(
+        system_context_parts(
+            phase_state,
+            bot_profile,
+            memory_hooks,
+            allow_erotic,
+            user_gender,
+            attraction,
+            trust_state,
+            allow_city_share,
+            style_plan,
+        )
+    )
+
+
+def build_turn_messages(history: List[Dict[str, str]], system_context: str) -> List[Dict[str, str]]:
+    """
+    Prompt layout for the LLM: [persona system, past turns..., new user turn, hidden context].
+
+    Everything through the previous user turn matches the previous request's
+    prompt, so llama.cpp reuses it from the KV cache; only the last reply, the
+    new user turn and the per-turn hidden context are evaluated. The hidden
+    context must stay last and must never be added to the ContextWindow.
+    """
+    return history + [{"role": "system", "content": system_context}]
+
+
+def is_low_engagement(text: str) -> bool:
+    t = (text or "").strip().lower()
+    if not t:
+        return True
+    if t in {"ok", "okay", "k", "lol", "sure", "nice", "cool", "yep", "yeah"}:
+        return True
+    words = [w for w in t.split() if w]
+    return len(words) <= 2
+
+
+def is_name_intent(text: str, features: Optional[TurnFeatures] = None) -> bool:
+    return (features or extract_features(text, ("name_intent",))).any("name_intent")
+
+
+def is_pics_intent(text: str, features: Optional[TurnFeatures] = None) -> bool:
+    return (features or extract_features(text, ("pics_intent",))).any("pics_intent")
+
+
+def is_bio_intent(text: str, features: Optional[TurnFeatures] = None) -> bool:
+    return (features or extract_features(text, ("bio_intent",))).any("bio_intent")
+
+
+def asked_question(text: str) -> bool:
+    return "?" in (text or "")
+
+
+BLOCK_REPLY = "I don't think we're a match, so I'll bow out. Press Enter to exit the chatbot."
+
+
+@dataclass
+class SessionSettings:
+    persona: str = "friendly"
+    threshold: float = 0.45
+    bot_gender: str = "random"
+    user_gender: str = "unspecified"
+    attraction: str = "unspecified"
+    history_turns: int = 6
+    context_budget: int = 3072
+    memory_write_behind: bool = False  # flush memory off the turn path (see SemanticMemoryStore)
+    memory_backend: str = "json"  # "json" | "sqlite"
+
+
+class ChatSession:
+    """
+    Everything one conversation owns: bot profile, memory, trust, phase tracker,
+    block counters, rng and the LLM history window. Models are not part of a
+    session, so many sessions can share one scorer and one LLM pool.
+    """
+
+    def __init__(
+        self,
+        settings: SessionSettings,
+        bot_profile: BotProfile,
+        count_tokens: Callable[[str], int],
+        memory_id: Optional[str] = None,
+        memory_suffix: str = "",
+        rng: Optional[random.Random] = None,
+        session_id: str = "cli",
+        memory_root: Optional[Path] = None,
+    ):
+        self.session_id = session_id
+        self.memory_root = memory_root
+        self.settings = settings
+        self.memory_suffix = memory_suffix
+        self.rng = rng or random.Random()
+        self.history = ContextWindow(
+            PERSONA_SYSTEM[settings.persona],
+            count_tokens=count_tokens,
+            budget_tokens=settings.context_budget,
+            keep_turns=settings.history_turns,
+        )
+        self.closed = False
+        self._start(bot_profile, memory_id)
+
+    def _default_memory_id(self, bot_profile: BotProfile) -> str:
+        return f"{bot_profile.profile_id}_{datetime.now().strftime('%Y%m%d')}{self.memory_suffix}"
+
+    def _start(self, bot_profile: BotProfile, memory_id: Optional[str]) -> None:
+        self.bot_profile = bot_profile
+        self.memory_id = memory_id or self._default_memory_id(bot_profile)
+        self.memory = open_memory_store(
+            self.memory_id,
+            backend=self.settings.memory_backend,
+            root=self.memory_root,
+            write_behind=self.settings.memory_write_behind,
+        )
+        self.trust_level = float(self.memory.meta.get("trust_level", 0.1))
+        self.consent_state = str(self.memory.meta.get("consent_state", "none"))
+        self.history.reset()
+        self._profile_block_tokens: Optional[int] = None
+        self.tracker = ConversationPhaseTracker()
+        self.safety_repair_count = 0
+        self.soft_deflect_count = 0
+        self.low_engagement_count = 0
+        self.last_mode = "NORMAL"
+        self.last_asked_question = False
+
+    def system_context_tokens(self, parts: Tuple[str, str, str]) -> int:
+        """Token count of system_context_parts(); the profile block is counted once per profile."""
+        head, block, tail = parts
+        if self._profile_block_tokens is None:
+            self._profile_block_tokens = self.history.count_tokens(block)
+        return self.history.count_tokens(head + tail) + self._profile_block_tokens
+
+    def switch_profile(self) -> None:
+        self.memory.close()
+        self._start(get_profile("random", self.settings.bot_gender, rng=self.rng), None)
+
+    def close(self) -> None:
+        """Persists anything the memory store has not written yet."""
+        self.memory.close()
+
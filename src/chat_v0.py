@@ -5,13 +5,13 @@ import time
 from pathlib import Path
 from typing import Dict, Any, List, Optional
 
+from src.rubric_columns import RUBRIC_KEYS, score_columns
+
 ROOT = Path(__file__).resolve().parents[1]
 DATA = ROOT / "data"
 LOGS = DATA / "logs"
 LOGS.mkdir(parents=True, exist_ok=True)
 
-RUBRIC_KEYS = ["ENG", "CTX", "TONE", "CLAR", "SAFE", "MOVE"]
-
 # --- IO helpers ---
 def read_json(path: Path):
     return json.loads(path.read_text(encoding="utf-8"))
@@ -31,69 +31,9 @@ def write_jsonl_append(path: Path, row: Dict[str, Any]):
 
 # --- Heuristic rubric scoring (v0 baseline) ---
 def score_message(user_text: str, persona: Dict[str, Any], context: Dict[str, Any]) -> Dict[str, int]:
-    t = user_text.strip()
-    tl = t.lower()
-
-    # CLAR: simple length + punctuation heuristic
-    if len(t) == 0 or len(t) > 250:
-        clar = 0
-    elif len(t) < 12:
-        clar = 1
-    else:
-        clar = 2
-
-    # ENG: question mark or interrogatives
-    eng = 2 if ("?" in t or any(w in tl.split() for w in ["what", "how", "why", "where", "when"])) else (1 if len(t) >= 12 else 0)
-
-    # CTX: references persona name or interests or mentions Berlin/profile cues
-    ctx = 0
-    if persona["name"].lower() in tl:
-        ctx = 2
-    else:
-        hits = 0
-        for it in persona.get("interests", []):
-            if it.lower() in tl:
-                hits += 1
-        if hits >= 1:
-            ctx = 2
-        elif any(k in tl for k in ["berlin", "your bio", "profile"]):
-            ctx = 1
-
-    # TONE: crude detection
-    rude_markers = ["whatever", "shut up", "idiot", "stupid", "bitch"]
-    objectifying = ["hot", "sexy", "tits"]
-    if any(x in tl for x in rude_markers) or any(x in tl for x in objectifying):
-        tone = 0
-    elif any(x in tl for x in ["please", "thanks", "no worries", "fair", "totally"]):
-        tone = 2
-    else:
-        tone = 1
-
-    # SAFE: boundary pressure / coercion heuristics
-    unsafe_markers = ["come over tonight", "send nudes", "don't be shy", "you owe", "why not", "stop being", "sensitive"]
-    if any(x in tl for x in unsafe_markers):
-        safe = 0
-    else:
-        # if in boundary use case, reward explicit respect
-        if context["use_case"] == "UC4_BOUNDARY" and any(x in tl for x in ["fair", "no worries", "take it slow", "comfortable", "all good"]):
-            safe = 2
-        else:
-            safe = 1
-
-    # MOVE: depends on use case
-    uc = context["use_case"]
-    if uc == "UC1_COLD_OPEN":
-        move = 2 if eng >= 1 else 1
-    elif uc == "UC2_KEEP_GOING":
-        move = 2 if eng >= 1 and len(t) >= 12 else 1 if len(t) >= 8 else 0
-    elif uc == "UC3_SUGGEST_DATE":
-        move = 2 if any(x in tl for x in ["coffee", "walk", "meet", "grab a"]) and safe != 0 else 1
-    elif uc == "UC4_BOUNDARY":
-        move = 2 if safe == 2 else 0 if safe == 0 else 1
-    else:
-        move = 1
-
-    return {"ENG": eng, "CTX": ctx, "TONE": tone, "CLAR": clar, "SAFE": safe, "MOVE": move}
+    # one-row call into the shared scorer, so the coach and run_batch_v0 score alike
+    cols = score_columns([user_text], [context["use_case"]], ["persona"], {"persona": persona})
+    return {k: int(cols[k][0]) for k in RUBRIC_KEYS}
 
 def ocq(scores: Dict[str, int]) -> float:
     total = sum(scores[k] for k in RUBRIC_KEYS)  # 0..12
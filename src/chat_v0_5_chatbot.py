@@ -3,127 +3,32 @@ from __future__ import annotations
 
 import argparse
 from datetime import datetime
-import random
-import re
-from typing import Dict, List
+import time
 
-from src.safety_embed import SafetyEmbedScorer
-from src.safety_templates import (
-    boundary_safe_reply_contextual,
-    soft_deflect_reply,
-    EROTIC_ALLOWED_GUIDANCE,
-)
-from src.safety_rules import obvious_escalation
+from src.chat_session import PERSONA_SYSTEM, ChatSession, SessionSettings
+from src.embedding_store import DEFAULT_ROOT as EMBED_STORE_ROOT
+from src.intent_heads import add_intent_heads_args, load_intent_heads
+from src.lazy_load import BackgroundLoad, format_startup_profile
+from src.safety_cascade import add_safety_gate_args, make_safety_gate
+from src.safety_embed import SAFETY_BACKENDS, SafetyEmbedScorer
 
-from src.llm_client_llamacpp import LlamaCppChatClient, LlamaCppConfig
-from src.conversation_phase import ConversationPhaseTracker, ConversationPhase
-from src.personality import get_profile, list_profile_ids, BotProfile
-from src.memory import SemanticMemoryStore
-from src.response_guards import enforce_identity, reality_guard, strip_questions
-from src.response_planner import plan_response, StylePlan
-from src.trust import (
-    TrustState,
-    classify_erotic_intent,
-    detect_boundary_ack,
-    detect_consent,
-    detect_location_request,
-    update_trust,
-)
-
-
-PERSONA_SYSTEM = {
-    "friendly": (
-        "You are a natural conversational partner on a dating app. "
-        "Keep replies short (1–3 sentences). Ask exactly one thoughtful question. "
-        "Be warm, curious, and specific."
-    ),
-    "flirty_adult_ok": (
-        "You are playful and lightly flirty on a dating app. Adult topics are allowed if mutual and respectful. "
-        "Never be coercive, never push for address/location, and always respect boundaries. "
-        "Keep replies short (1–2 sentences). Ask exactly one engaging question."
-    ),
-}
-
-def build_system_context(
-    phase_state,
-    bot_profile: BotProfile,
-    memory_hooks: List[str],
-    allow_erotic: bool,
-    user_gender: str,
-    attraction: str,
-    trust_state: TrustState,
-    allow_city_share: bool,
-    style_plan: StylePlan,
-) -> str:
-    mem = "; ".join(memory_hooks) if memory_hooks else "none"
-    erotic_note = EROTIC_ALLOWED_GUIDANCE if allow_erotic else "Keep replies non-explicit; slow down if needed."
-    attraction_line = f"attraction={attraction}" if attraction != "unspecified" else "attraction=unspecified"
-    user_gender_line = f"user_gender={user_gender}" if user_gender != "unspecified" else "user_gender=unspecified"
-    bio = " ".join(bot_profile.bio)
-    photos_summary = bot_profile.photos_summary()
-    photos_prompt = bot_profile.photos_prompt()
-    location_note = (
-        "If asked about location, keep it vague and city-level only."
-        if allow_city_share
-        else "Do not share location details."
-    )
-    plan_line = (
-        f"STYLE PLAN: plan={style_plan.plan} ask_question={'yes' if style_plan.ask_question else 'no'}; "
-        f"disclosure={style_plan.disclosure or 'none'}; story={style_plan.story or 'none'}; tease={style_plan.tease or 'none'}. "
-        "If a disclosure/story/tease is provided, weave it in naturally."
-    )
-    return (
-        "SYSTEM CONTEXT (hidden):\n"
-        f"phase={phase_state.phase.value}\n"
-        f"bot_profile={bot_profile.summary()}\n"
-        f"bio={bio}\n"
-        f"photos={photos_summary}\n"
-        f"photos_prompt={photos_prompt}\n"
-        f"trust_level={trust_state.level:.2f} tier={trust_state.tier()} consent={trust_state.consent_state}\n"
-        f"{user_gender_line}\n"
-        f"{attraction_line}\n"
-        f"memory={mem}\n"
-        "Instruction: be natural and human; do not assume the user's attraction unless specified; "
-        "identity is locked (name/gender/pronouns) and must remain consistent; avoid grandiose claims; "
-        "do not contradict your profile bio or photo descriptions; "
-        "escalate only if appropriate; "
-        "respect boundaries and avoid asking for address/location. "
-        f"{location_note} "
-        f"{erotic_note}\n"
-        f"{plan_line}"
-    )
-
-
-def is_low_engagement(text: str) -> bool:
-    t = (text or "").strip().lower()
-    if not t:
-        return True
-    if t in {"ok", "okay", "k", "lol", "sure", "nice", "cool", "yep", "yeah"}:
-        return True
-    words = [w for w in t.split() if w]
-    return len(words) <= 2
-
-
-def is_name_intent(text: str) -> bool:
-    return bool(re.search(r"\b(name|call you)\b", text, re.IGNORECASE))
-
-
-def is_pics_intent(text: str) -> bool:
-    return bool(re.search(r"\b(pics?|photos?|pictures?)\b", text, re.IGNORECASE))
-
-
-def is_bio_intent(text: str) -> bool:
-    return bool(re.search(r"\b(bio|about you|about yourself|profile)\b", text, re.IGNORECASE))
-
-
-def asked_question(text: str) -> bool:
-    return "?" in (text or "")
+from src.llm_backends import add_llm_backend_args, check_llm_backend_args, describe_llm_backend, make_chat_client
+from src.personality import get_profile, list_profile_ids
+from src.memory import MEMORY_BACKENDS, open_memory_store
+from src.trust import TrustState
+from src.turn_engine import TurnEngine, format_turn_debug
 
 
 def main():
     ap = argparse.ArgumentParser()
     ap.add_argument("--safety_model", default="models/safe_violation_clf_embed.joblib")
+    ap.add_argument(
+        "--safety_backend", default="auto", choices=list(SAFETY_BACKENDS), help="auto = int8 ONNX export if present"
+    )
     ap.add_argument("--threshold", type=float, default=0.45)
+    ap.add_argument("--embed_store", default=str(EMBED_STORE_ROOT), help="Shared embedding store dir ('' disables)")
+    add_safety_gate_args(ap)
+    add_intent_heads_args(ap)
 
     ap.add_argument("--persona", default="friendly", choices=list(PERSONA_SYSTEM.keys()))
     ap.add_argument("--persona_profile", default="random")
@@ -132,20 +37,24 @@ def main():
     ap.add_argument("--attraction", default="unspecified", choices=["women", "men", "any", "unspecified"])
     ap.add_argument("--memory_id", default=None)
     ap.add_argument("--clear-memory", action="store_true")
+    ap.add_argument("--memory_backend", default="json", choices=list(MEMORY_BACKENDS))
+    ap.add_argument("--memory_write_behind", action="store_true", help="Save memory in the background, not every turn")
+
+    add_llm_backend_args(ap)
+    ap.add_argument("--history_turns", type=int, default=6, help="Recent turns kept verbatim; older ones are summarized")
+    ap.add_argument(
+        "--context_budget",
+        type=int,
+        default=0,
+        help="Hard prompt token budget per request (0 = n_ctx - max_tokens - 64)",
+    )
+    ap.add_argument("--stream", action="store_true", help="Stream LLM replies sentence by sentence")
+    ap.add_argument("--startup_profile", action="store_true", help="Print a per-component load-time breakdown")
+    ap.add_argument("--trace", action="store_true", help="Print per-stage turn timings")
 
-    # llama.cpp / GGUF
-    ap.add_argument("--gguf_model", required=True, help="Path to a .gguf instruct model file")
-    ap.add_argument("--chat_format", default="chatml", help="chat format for llama.cpp (e.g., chatml)")
-    ap.add_argument("--n_ctx", type=int, default=4096)
-    ap.add_argument("--n_threads", type=int, default=8)
-    ap.add_argument("--n_gpu_layers", type=int, default=0, help="0=CPU; >0 uses GPU if compiled with CUDA")
-
-    ap.add_argument("--max_tokens", type=int, default=140)
-    ap.add_argument("--temperature", type=float, default=0.8)
-    ap.add_argument("--top_p", type=float, default=0.95)
-    ap.add_argument("--repeat_penalty", type=float, default=1.10)
-
+    boot_t0 = time.perf_counter()
     args = ap.parse_args()
+    check_llm_backend_args(ap, args)
 
     print(
         "Tinder Practice Bot v0.5 (phase + personality + memory + safety gate + llama.cpp LLM). "
@@ -161,15 +70,44 @@ def main():
         raise SystemExit(2)
 
     memory_id = args.memory_id or f"{bot_profile.profile_id}_{datetime.now().strftime('%Y%m%d')}"
-    memory = SemanticMemoryStore(memory_id)
     if args.clear_memory:
+        memory = open_memory_store(memory_id, backend=args.memory_backend)
         memory.clear()
         print(f"[MEM] cleared memory_id={memory_id} path={memory.path}")
         return
 
+    # Both models load concurrently while the banner prints; a turn only blocks
+    # on the one it actually uses (commands and name/pics/bio intents use neither).
+    scorer = BackgroundLoad(
+        "safety_model",
+        lambda: SafetyEmbedScorer(
+            args.safety_model, embed_store=args.embed_store or None, backend=args.safety_backend
+        ),
+    )
+    llm = BackgroundLoad("llm", lambda: make_chat_client(args))
+    startup_profile_pending = args.startup_profile
+
+    session = ChatSession(
+        SessionSettings(
+            persona=args.persona,
+            threshold=args.threshold,
+            bot_gender=args.bot_gender,
+            user_gender=args.user_gender,
+            attraction=args.attraction,
+            history_turns=args.history_turns,
+            context_budget=args.context_budget or max(256, args.n_ctx - args.max_tokens - 64),
+            memory_write_behind=args.memory_write_behind,
+            memory_backend=args.memory_backend,
+        ),
+        bot_profile,
+        count_tokens=lambda text: llm.count_tokens(text),
+        memory_id=memory_id,
+    )
+    memory = session.memory
+    engine = TurnEngine(make_safety_gate(args, scorer), llm, intent_heads=load_intent_heads(args))
+
     print(
-        f"[BOOT] gguf_model={args.gguf_model} persona={args.persona} thr={args.threshold} "
-        f"ctx={args.n_ctx} threads={args.n_threads} gpu_layers={args.n_gpu_layers}\n",
+        f"[BOOT] {describe_llm_backend(args)} persona={args.persona} thr={args.threshold}\n",
         flush=True,
     )
     print(
@@ -184,309 +122,55 @@ def main():
         f"[USER] user_gender={args.user_gender} attraction={args.attraction}",
         flush=True,
     )
-    trust_level = float(memory.meta.get("trust_level", 0.1))
-    consent_state = str(memory.meta.get("consent_state", "none"))
+    trust_level = session.trust_level
+    consent_state = session.consent_state
     print(f"[MEM] memory_id={memory_id} items={len(memory.items)} path={memory.path}", flush=True)
     print(f"[TRUST] level={trust_level:.2f} tier={TrustState(trust_level, consent_state).tier()} consent={consent_state}", flush=True)
     print("[PHASE] phase=OPENING flirt=0.00 intimate=0.00 erotic=0.00\n", flush=True)
 
-    scorer = SafetyEmbedScorer(args.safety_model)
+    boot_s = time.perf_counter() - boot_t0
+    if args.startup_profile:
+        print(format_startup_profile([scorer, llm], boot_s) + "\n", flush=True)
 
-    llm = LlamaCppChatClient(
-        LlamaCppConfig(
-            model_path=args.gguf_model,
-            chat_format=args.chat_format,
-            n_ctx=args.n_ctx,
-            n_threads=args.n_threads,
-            n_gpu_layers=args.n_gpu_layers,
-            temperature=args.temperature,
-            top_p=args.top_p,
-            repeat_penalty=args.repeat_penalty,
-            max_tokens=args.max_tokens,
-        )
-    )
+    streamed = False
 
-    history: List[Dict[str, str]] = [{"role": "system", "content": PERSONA_SYSTEM[args.persona]}]
-    tracker = ConversationPhaseTracker()
-    safety_repair_count = 0
-    soft_deflect_count = 0
-    low_engagement_count = 0
-    last_mode = "NORMAL"
-    last_asked_question = False
-    rng = random.Random()
+    def _print_sentence(sentence: str) -> None:
+        nonlocal streamed
+        if not streamed:
+            print("bot> ", end="", flush=True)
+            streamed = True
+        print(f"{sentence} ", end="", flush=True)
 
     while True:
+        if startup_profile_pending and scorer.is_ready() and llm.is_ready():
+            print(format_startup_profile([scorer, llm], boot_s) + "\n", flush=True)
+            startup_profile_pending = False
         user = input("you> ").strip()
         if user.lower() in {"exit", "quit"}:
+            if startup_profile_pending:
+                print(format_startup_profile([scorer, llm], boot_s), flush=True)
             print("bot> Bye.")
+            session.close()
             break
         if not user:
             continue
 
-        if user.startswith("/"):
-            cmd = user.strip().lower()
-            if cmd == "/profile":
-                reply = f"{bot_profile.profile_card()} | traits: {bot_profile.trait_summary()}"
-                mode = "PROFILE"
-            elif cmd == "/pics":
-                reply = bot_profile.photos_detail()
-                mode = "PICS"
-            elif cmd == "/name":
-                reply = f"I'm {bot_profile.name} ({bot_profile.pronouns})."
-                mode = "NAME"
-            elif cmd == "/switch":
-                bot_profile = get_profile("random", args.bot_gender, rng=rng)
-                memory_id = f"{bot_profile.profile_id}_{datetime.now().strftime('%Y%m%d')}"
-                memory = SemanticMemoryStore(memory_id)
-                trust_level = float(memory.meta.get("trust_level", 0.1))
-                consent_state = str(memory.meta.get("consent_state", "none"))
-                history = [{"role": "system", "content": PERSONA_SYSTEM[args.persona]}]
-                tracker = ConversationPhaseTracker()
-                safety_repair_count = 0
-                soft_deflect_count = 0
-                low_engagement_count = 0
-                last_mode = "NORMAL"
-                last_asked_question = False
-                reply = f"Switched to {bot_profile.name}. {bot_profile.profile_card()}"
-                mode = "SWITCH"
-            else:
-                reply = "Commands: /profile /pics /name /switch"
-                mode = "HELP"
-            print(f"bot> {reply}\n")
-            continue
-
-        if is_name_intent(user):
-            reply = f"I'm {bot_profile.name} ({bot_profile.pronouns})."
-            print(f"bot> {reply}\n")
-            continue
-        if is_pics_intent(user):
-            reply = bot_profile.photos_detail()
-            print(f"bot> {reply}\n")
-            continue
-        if is_bio_intent(user):
-            reply = f"{bot_profile.profile_card()} | traits: {bot_profile.trait_summary()}"
-            print(f"bot> {reply}\n")
+        streamed = False
+        out = engine.step(session, user, on_sentence=_print_sentence if args.stream else None)
+        if out.gate is None:
+            # commands and profile intents never reach the models
+            print(f"bot> {out.reply}\n")
             continue
 
-        s = scorer.score(user, threshold=args.threshold)
-        rule_hit, rule_reason = obvious_escalation(user)
-        location_request = detect_location_request(user)
-
-        history.append({"role": "user", "content": user})
-
-        phase_state_before = tracker.last_state
-        erotic_level = classify_erotic_intent(user)
-        erotic_intent = erotic_level != "none"
-        consent_update = detect_consent(user, erotic_level)
-        if consent_update != "none":
-            consent_state = consent_update
-
-        trust_state = TrustState(trust_level, consent_state)
-        allow_erotic = True
-        erotic_block_reasons = []
-        if phase_state_before.phase in {
-            ConversationPhase.OPENING,
-            ConversationPhase.RAPPORT,
-            ConversationPhase.FLIRTING,
-        }:
-            allow_erotic = False
-            erotic_block_reasons.append("phase_early")
-        if bot_profile.erotic_openness < 0.45:
-            allow_erotic = False
-            erotic_block_reasons.append("low_openness")
-        if bot_profile.pace == "slow" and phase_state_before.intimacy_score < 0.40:
-            allow_erotic = False
-            erotic_block_reasons.append("slow_pace")
-        if bot_profile.pace == "medium" and phase_state_before.intimacy_score < 0.30:
-            allow_erotic = False
-            erotic_block_reasons.append("mid_pace")
-
-        allow_city_share = trust_state.level >= 0.8
-        trust_relax_reason = ""
-        erotic_allowed_by_trust = False
-        if erotic_level == "none":
-            erotic_allowed_by_trust = True
-        elif erotic_level == "suggestive":
-            erotic_allowed_by_trust = trust_state.level >= 0.3
-        elif erotic_level == "explicit":
-            erotic_allowed_by_trust = (
-                trust_state.level >= 0.6
-                and trust_state.consent_state == "explicit"
-                and phase_state_before.phase in {ConversationPhase.INTIMATE, ConversationPhase.EROTIC}
-            )
-
-        style_plan = None
-        if rule_hit or (location_request and not allow_city_share):
-            reply = boundary_safe_reply_contextual(
-                user_text=user,
-                phase=phase_state_before.phase.value,
-                persona=args.persona,
-                bot_profile=bot_profile,
-                trust=trust_state.level,
-            )
-            mode = "SAFETY_REPAIR"
-        elif s.label == "MOVE":
-            if trust_state.level < 0.3:
-                reply = boundary_safe_reply_contextual(
-                    user_text=user,
-                    phase=phase_state_before.phase.value,
-                    persona=args.persona,
-                    bot_profile=bot_profile,
-                    trust=trust_state.level,
-                )
-                mode = "SAFETY_REPAIR"
-            elif erotic_level == "none":
-                trust_relax_reason = "trust_false_positive"
-                mode = "NORMAL"
-                reply = ""
-            elif erotic_level == "suggestive" and erotic_allowed_by_trust:
-                trust_relax_reason = "trust_suggestive"
-                mode = "NORMAL"
-                reply = ""
-            elif erotic_level == "explicit" and erotic_allowed_by_trust:
-                trust_relax_reason = "trust_explicit_consent"
-                mode = "NORMAL"
-                reply = ""
-            else:
-                reply = boundary_safe_reply_contextual(
-                    user_text=user,
-                    phase=phase_state_before.phase.value,
-                    persona=args.persona,
-                    bot_profile=bot_profile,
-                    trust=trust_state.level,
-                )
-                mode = "SAFETY_REPAIR"
-        elif erotic_intent and (not allow_erotic or not erotic_allowed_by_trust):
-            reply = soft_deflect_reply()
-            mode = "SOFT_DEFLECT"
+        if streamed:
+            print("", flush=True)
         else:
-            mode = "NORMAL"
-            reply = ""
-
-        if mode == "NORMAL":
-            allow_erotic = allow_erotic and trust_state.level >= 0.6 and trust_state.consent_state == "explicit"
-            style_plan = plan_response(user, phase_state_before.phase, bot_profile, last_asked_question, rng)
-            system_context = build_system_context(
-                phase_state_before,
-                bot_profile,
-                memory.get_hooks(k=2),
-                allow_erotic,
-                args.user_gender,
-                args.attraction,
-                trust_state,
-                allow_city_share,
-                style_plan,
-            )
-            messages = history + [{"role": "system", "content": system_context}]
-            reply = llm.chat(messages)
-            reply = enforce_identity(reply, bot_profile)
-            reply = reality_guard(reply, bot_profile)
-            if not style_plan.ask_question:
-                reply = strip_questions(reply)
-
-        if mode == "SAFETY_REPAIR":
-            safety_repair_count += 1
-        if mode == "SOFT_DEFLECT":
-            soft_deflect_count += 1
-        if is_low_engagement(user):
-            low_engagement_count += 1
-        else:
-            low_engagement_count = max(0, low_engagement_count - 1)
-
-        should_block = False
-        block_reasons = []
-        if rule_hit and bot_profile.boundary_strictness >= 0.6:
-            should_block = True
-            block_reasons.append("rule_hit")
-        if safety_repair_count >= 2 and bot_profile.boundary_strictness >= 0.7:
-            should_block = True
-            block_reasons.append("repeat_boundary")
-        if soft_deflect_count >= 3 and erotic_intent:
-            should_block = True
-            block_reasons.append("repeat_escalation")
-        if low_engagement_count >= 3 and bot_profile.directness >= 0.6:
-            should_block = True
-            block_reasons.append("low_engagement")
-
-        if should_block:
-            reply = "I don't think we're a match, so I'll bow out. Press Enter to exit the chatbot."
-            mode = "BLOCK"
-
-        history.append({"role": "assistant", "content": reply})
-
-        if mode != "BLOCK":
-            new_state = tracker.update(user, reply, s.label, rule_hit)
-            added_items: List = []
-            if s.label == "SAFE" and not rule_hit:
-                added_items = memory.update_from_text(user)
-                memory.update_boundary(user)
-        else:
-            new_state = tracker.last_state
-            added_items = []
-
-        trust_delta = 0.0
-        trust_reason = "baseline"
-        if s.label == "SAFE" and not rule_hit:
-            trust_delta += 0.01
-            trust_reason = "safe_turn"
-        if new_state.intimacy_score >= 0.3:
-            trust_delta += 0.01
-        if new_state.flirt_score >= 0.3:
-            trust_delta += 0.01
-        if added_items:
-            trust_delta += 0.01
-        if mode == "SAFETY_REPAIR":
-            trust_delta -= 0.05
-            trust_reason = "repair"
-        if rule_hit:
-            trust_delta -= 0.08
-            trust_reason = "rule_hit"
-        if mode == "SOFT_DEFLECT" and erotic_intent:
-            trust_delta -= 0.02
-            trust_reason = "deflect"
-        if detect_boundary_ack(user) and last_mode == "SAFETY_REPAIR":
-            trust_delta += 0.02
-            trust_reason = "boundary_ack"
-        if low_engagement_count >= 2:
-            trust_delta -= 0.01
-            trust_reason = "low_engagement"
-
-        trust_level = update_trust(trust_level, trust_delta)
-        trust_state = TrustState(trust_level, consent_state, trust_reason)
-        memory.update_trust(trust_level, consent_state, trust_reason)
-
-        print(f"bot> {reply}")
-        extra = f" rule={rule_reason}" if rule_hit else ""
-        if mode == "SOFT_DEFLECT" and erotic_block_reasons:
-            extra = f"{extra} deflect={','.join(erotic_block_reasons)}"
-        if mode == "BLOCK" and block_reasons:
-            extra = f"{extra} block={','.join(block_reasons)}"
-        if trust_relax_reason:
-            extra = f"{extra} relax={trust_relax_reason}"
-        print(f"     [gate={s.label} p_move={s.p_move:.3f} thr={s.threshold:.2f} mode={mode}{extra}]")
-        print(
-            f"     [phase={new_state.phase.value} flirt={new_state.flirt_score:.2f} "
-            f"intimate={new_state.intimacy_score:.2f} erotic={new_state.erotic_score:.2f}]",
-            flush=True,
-        )
-        if style_plan:
-            print(
-                f"     [style plan={style_plan.plan} ask_question={'yes' if style_plan.ask_question else 'no'}]",
-                flush=True,
-            )
-        print(
-            f"     [trust={trust_state.level:.2f} tier={trust_state.tier()} consent={trust_state.consent_state} reason={trust_state.last_reason}]",
-            flush=True,
-        )
-        if added_items:
-            print(
-                f"     [memory:+{len(added_items)} items total={len(memory.items)}]",
-                flush=True,
-            )
+            print(f"bot> {out.reply}")
+        for line in format_turn_debug(out, len(session.memory.items), show_trace=args.trace):
+            print(line, flush=True)
         print("", flush=True)
-        last_mode = mode
-        last_asked_question = asked_question(reply)
-        if mode == "BLOCK":
+        if session.closed:
+            session.close()
             input("Press Enter to exit the chatbot.")
             break
 
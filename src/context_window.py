@@ -0,0 +1,169 @@
+# src/context_window.py
+from __future__ import annotations
+
+from dataclasses import dataclass
+import re
+from typing import Callable, Dict, List, Optional
+
+# chat-template tokens around each message (role header, separators)
+MESSAGE_OVERHEAD_TOKENS = 4
+
+
+@dataclass
+class _Turn:
+    role: str
+    content: str
+    tokens: Optional[int] = None
+
+
+def _snippet(text: str, max_words: int = 16) -> str:
+    first = re.split(r"(?<=[.!?])\s+", (text or "").strip(), maxsplit=1)[0]
+    words = first.split()
+    if len(words) > max_words:
+        return " ".join(words[:max_words]) + "…"
+    return " ".join(words)
+
+
+class ContextWindow:
+    """
+    Conversation history sent to the LLM, bounded by a token budget.
+
+    Layout: persona system prompt, an optional summary of older turns, then the
+    last `keep_turns` turns verbatim. Older turns are folded into the summary in
+    blocks of `fold_every` so the prompt prefix (and llama.cpp's KV cache) only
+    changes every few turns; the summary text is cached and only rebuilt when
+    turns are folded. Folds always cut before a user message, so the verbatim
+    part starts with a whole exchange even after a turn that got no reply.
+
+    `messages()` additionally folds the oldest verbatim turns if the request
+    would exceed `budget_tokens`, again a block of `fold_every` exchanges at a
+    time so the prefix does not change on every turn once the budget binds. If
+    the newest turn still does not fit, the summary is dropped and then that
+    turn is cut short; a budget too small for the persona prompt and the
+    reserve alone raises ValueError.
+    """
+
+    def __init__(
+        self,
+        persona_prompt: str,
+        count_tokens: Callable[[str], int],
+        budget_tokens: int = 3072,
+        keep_turns: int = 6,
+        fold_every: int = 4,
+        summary_tokens: int = 192,
+    ):
+        self.persona_prompt = persona_prompt
+        self.count_tokens = count_tokens
+        self.budget_tokens = budget_tokens
+        self.keep_turns = max(1, keep_turns)
+        self.fold_every = max(1, fold_every)
+        self.summary_tokens = summary_tokens
+        self.turns: List[_Turn] = []
+        self._summary_entries: List[str] = []
+        self._summary: Optional[_Turn] = None
+        self._persona_tokens: Optional[int] = None
+
+    def reset(self, persona_prompt: Optional[str] = None) -> None:
+        if persona_prompt is not None:
+            self.persona_prompt = persona_prompt
+            self._persona_tokens = None
+        self.turns = []
+        self._summary_entries = []
+        self._summary = None
+
+    def add(self, role: str, content: str) -> None:
+        self.turns.append(_Turn(role=role, content=content))
+        # one turn = one user+assistant pair
+        if len(self.turns) > 2 * (self.keep_turns + self.fold_every):
+            self._fold(self._cut(len(self.turns) - 2 * self.keep_turns, up=False))
+
+    def _cut(self, n: int, up: bool) -> int:
+        """
+        A fold size near `n` that leaves the verbatim turns starting at a user
+        message: the next such boundary (up) or the previous one. Never folds
+        the newest turn; 0 if there is no boundary.
+        """
+        last = len(self.turns) - 1
+        cut = max(0, min(n, last))
+        step = 1 if up else -1
+        while 0 < cut < last and self.turns[cut].role != "user":
+            cut += step
+        return cut if self.turns[cut].role == "user" or cut == last else 0
+
+    def _tokens(self, turn: _Turn) -> int:
+        if turn.tokens is None:
+            turn.tokens = self.count_tokens(turn.content) + MESSAGE_OVERHEAD_TOKENS
+        return turn.tokens
+
+    def _fold(self, n: int) -> None:
+        folded, self.turns = self.turns[:n], self.turns[n:]
+        for t in folded:
+            who = "user" if t.role == "user" else "you"
+            snippet = _snippet(t.content)
+            if snippet:
+                self._summary_entries.append(f"{who}: {snippet}")
+        self._summary = None
+
+    def _truncate_newest(self, room: int) -> None:
+        """Cuts the newest turn's text down to `room` tokens (message overhead included)."""
+        turn = self.turns[-1]
+        if self._tokens(turn) <= room:
+            return
+        text = turn.content
+        lo, hi = 0, len(text)  # longest prefix that fits, by bisection
+        while lo < hi:
+            mid = (lo + hi + 1) // 2
+            if self.count_tokens(text[:mid].rstrip() + "…") + MESSAGE_OVERHEAD_TOKENS <= room:
+                lo = mid
+            else:
+                hi = mid - 1
+        if not text[:lo].strip():
+            raise ValueError(
+                f"budget_tokens={self.budget_tokens} leaves no room for the newest turn after the persona "
+                "prompt and the hidden context; raise --context_budget"
+            )
+        self.turns[-1] = _Turn(role=turn.role, content=text[:lo].rstrip() + "…")
+
+    def _summary_turn(self) -> Optional[_Turn]:
+        if not self._summary_entries:
+            return None
+        if self._summary is None:
+            while True:
+                text = "Earlier in this chat (summary): " + " | ".join(self._summary_entries)
+                turn = _Turn(role="system", content=text)
+                if self._tokens(turn) <= self.summary_tokens or len(self._summary_entries) == 1:
+                    break
+                self._summary_entries.pop(0)
+            self._summary = turn
+        return self._summary
+
+    def prompt_tokens(self, reserve_tokens: int = 0) -> int:
+        if self._persona_tokens is None:
+            self._persona_tokens = self.count_tokens(self.persona_prompt) + MESSAGE_OVERHEAD_TOKENS
+        total = self._persona_tokens + sum(self._tokens(t) for t in self.turns)
+        summary = self._summary_turn()
+        if summary is not None:
+            total += self._tokens(summary)
+        return total + reserve_tokens
+
+    def messages(self, reserve: str = "", reserve_tokens: Optional[int] = None) -> List[Dict[str, str]]:
+        """
+        Stable prompt prefix within the budget, leaving room for `reserve`
+        (the per-turn hidden context appended after it; pass `reserve_tokens`
+        if its size is already known). The newest turn is always kept.
+        """
+        if reserve_tokens is None:
+            reserve_tokens = self.count_tokens(reserve) if reserve else 0
+        reserve_tokens = reserve_tokens + MESSAGE_OVERHEAD_TOKENS if reserve_tokens else 0
+        while len(self.turns) > 1 and self.prompt_tokens(reserve_tokens) > self.budget_tokens:
+            self._fold(self._cut(2 * self.fold_every, up=True))
+        if self.turns and self.prompt_tokens(reserve_tokens) > self.budget_tokens:
+            self._summary_entries, self._summary = [], None
+            self._truncate_newest(self.budget_tokens - self.prompt_tokens(reserve_tokens) + self._tokens(self.turns[-1]))
+
+        out = [{"role": "system", "content": self.persona_prompt}]
+        summary = self._summary_turn()
+        if summary is not None:
+            out.append({"role": "system", "content": summary.content})
+        out.extend({"role": t.role, "content": t.content} for t in self.turns)
+        return out
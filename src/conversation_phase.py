@@ -1,11 +1,14 @@
 # src/conversation_phase.py
 from __future__ import annotations
 
-from collections import deque
 from dataclasses import dataclass
 from enum import Enum
-import re
-from typing import Deque, Dict, List, Tuple
+from functools import lru_cache
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from src.text_features import PHASE_FAMILIES, TurnFeatures, extract_features
 
 
 class ConversationPhase(str, Enum):
@@ -27,58 +30,103 @@ class PhaseState:
     reason_tags: List[str]
 
 
-_FLIRT_PATTERNS: List[Tuple[str, str]] = [
-    (r"\b(cute|adorable|handsome|pretty|hot|sexy)\b", "flirt:compliment"),
-    (r"\b(playful|tease|teasing|wink)\b", "flirt:playful"),
-    (r"\b(flirty|flirt)\b", "flirt:explicit"),
-]
-
-_INTIMACY_PATTERNS: List[Tuple[str, str]] = [
-    (r"\b(feel|feels|feeling)\b", "intimacy:emotion"),
-    (r"\b(vulnerable|open up|honest|trust)\b", "intimacy:trust"),
-    (r"\b(meaningful|deep|connection)\b", "intimacy:connection"),
-    (r"\b(i miss you|missed you)\b", "intimacy:miss"),
-]
-
-_EROTIC_PATTERNS: List[Tuple[str, str]] = [
-    (r"\b(sex|sexual|turn on|horny)\b", "erotic:explicit"),
-    (r"\b(nude|nudes|naked)\b", "erotic:nudity"),
-    (r"\b(make out|hook ?up|sleep with)\b", "erotic:hookup"),
-    (r"\b(in bed|in the bedroom)\b", "erotic:bed"),
-]
-
-_SLOWDOWN_PATTERNS: List[Tuple[str, str]] = [
-    (r"\b(too fast|slow down|slow it down)\b", "slowdown:pace"),
-    (r"\b(not comfortable|not ready|not yet)\b", "slowdown:boundary"),
-    (r"\b(boundaries|boundary)\b", "slowdown:boundary"),
-]
-
-
-def _score_text(text: str, patterns: List[Tuple[str, str]]) -> Tuple[float, List[str]]:
-    t = (text or "").lower()
-    hits = 0
-    tags: List[str] = []
-    for pat, tag in patterns:
-        if re.search(pat, t):
-            hits += 1
-            tags.append(tag)
-    score = min(1.0, hits / 3.0)
+# Phases the tracker moves between outside of repair, in escalation order.
+_ORDERED_PHASES: Tuple[ConversationPhase, ...] = (
+    ConversationPhase.OPENING,
+    ConversationPhase.RAPPORT,
+    ConversationPhase.FLIRTING,
+    ConversationPhase.INTIMATE,
+    ConversationPhase.EROTIC,
+)
+_PHASE_INDEX: Dict[ConversationPhase, int] = {p: i for i, p in enumerate(ConversationPhase)}
+_REPAIR_PHASES = frozenset({ConversationPhase.BOUNDARY_REPAIR, ConversationPhase.COOLDOWN})
+SIGNAL_FAMILIES = ("flirt", "intimacy", "erotic")
+# a family's per-turn score is min(1, hits / 3); the window keeps the capped hit counts
+SIGNAL_HIT_CAP = 3
+# A window of capped hit counts is one integer, a base-5 digit (hits + 1) per
+# turn with the newest turn lowest; 0 is the empty window.
+_CODE_BASE = SIGNAL_HIT_CAP + 2
+
+
+def _score_features(features: TurnFeatures, family: str) -> Tuple[float, List[str]]:
+    tags = features.tags(family)
+    score = min(SIGNAL_HIT_CAP, len(tags)) / float(SIGNAL_HIT_CAP)
     return score, tags
 
 
-def _has_slowdown(text: str) -> Tuple[bool, List[str]]:
-    t = (text or "").lower()
-    tags: List[str] = []
-    for pat, tag in _SLOWDOWN_PATTERNS:
-        if re.search(pat, t):
-            tags.append(tag)
+def _has_slowdown(features: TurnFeatures) -> Tuple[bool, List[str]]:
+    tags = features.tags("slowdown")
     return bool(tags), tags
 
 
+def intent_hits(p: float, threshold: float = 0.5) -> int:
+    """An intent head's probability on the keyword hit scale: 0 below `threshold`, then 1..SIGNAL_HIT_CAP by confidence."""
+    if p < threshold:
+        return 0
+    return min(SIGNAL_HIT_CAP, 1 + int((p - threshold) / (1.0 - threshold) * SIGNAL_HIT_CAP))
+
+
+def roll_window_code(code, hits, window: int):
+    """Appends a turn's capped `hits` to window `code`, dropping the oldest turn of a full window (ints or arrays)."""
+    return (code % _CODE_BASE ** (window - 1)) * _CODE_BASE + hits + 1
+
+
+@lru_cache(maxsize=1 << 16)
+def window_code_mean(code: int) -> float:
+    """
+    The window average of the per-turn scores, summed oldest turn first like
+    the original deque average, so thresholds see the same float bit for bit
+    (e.g. intimacy hits 0, 2, 3, 1 average to 0.49999999999999994, not 0.5).
+    """
+    hits: List[int] = []
+    while code:
+        code, digit = divmod(code, _CODE_BASE)
+        hits.append(digit - 1)
+    if not hits:
+        return 0.0
+    return sum(min(1.0, h / 3.0) for h in reversed(hits)) / len(hits)
+
+
+def window_means(codes: np.ndarray) -> np.ndarray:
+    """window_code_mean() over an array of window codes; each distinct window is averaged once."""
+    codes = np.asarray(codes, dtype=np.int64)
+    uniq, inverse = np.unique(codes.ravel(), return_inverse=True)
+    means = np.array([window_code_mean(int(c)) for c in uniq], dtype=np.float64)
+    return means[inverse.ravel()].reshape(codes.shape)
+
+
+def _phase_code_from_scores(flirt_score: float, intimacy_score: float, erotic_score: float) -> int:
+    if erotic_score >= 0.6:
+        return 4
+    if intimacy_score >= 0.5:
+        return 3
+    if flirt_score >= 0.4:
+        return 2
+    if intimacy_score >= 0.2 or flirt_score >= 0.2:
+        return 1
+    return 0
+
+
 class ConversationPhaseTracker:
+    """
+    Conservative phase state machine over a sliding window of per-turn
+    flirt/intimacy/erotic hit counts. Each family's window is one integer code
+    (see roll_window_code), so an update is O(1) and the averages come from a
+    memoized window_code_mean().
+    """
+
+    __slots__ = (
+        "window",
+        "_codes",
+        "phase",
+        "prev_safe_phase",
+        "cooldown_remaining",
+        "last_state",
+    )
+
     def __init__(self, window: int = 8):
         self.window = max(6, min(10, window))
-        self.signals: Deque[Dict[str, float]] = deque(maxlen=self.window)
+        self._codes = [0, 0, 0]
         self.phase = ConversationPhase.OPENING
         self.prev_safe_phase = ConversationPhase.OPENING
         self.cooldown_remaining = 0
@@ -90,30 +138,75 @@ class ConversationPhaseTracker:
             reason_tags=[],
         )
 
-    def is_erotic_intent(self, text: str) -> bool:
-        score, _ = _score_text(text, _EROTIC_PATTERNS)
+    def is_erotic_intent(self, text: str, features: Optional[TurnFeatures] = None) -> bool:
+        score, _ = _score_features(features or extract_features(text, ("erotic",)), "erotic")
         return score >= 0.34
 
-    def update(self, user_text: str, bot_text: str, safety_label: str, rule_hit: bool) -> PhaseState:
+    def _push(self, hits: Tuple[int, int, int]) -> Tuple[float, float, float]:
+        codes = self._codes
+        for k in range(3):
+            codes[k] = roll_window_code(codes[k], hits[k], self.window)
+        return window_code_mean(codes[0]), window_code_mean(codes[1]), window_code_mean(codes[2])
+
+    def update(
+        self,
+        user_text: str,
+        bot_text: str,
+        safety_label: str,
+        rule_hit: bool,
+        features: Optional[TurnFeatures] = None,
+        intents: Optional[Dict[str, float]] = None,
+    ) -> PhaseState:
+        """
+        `features` are the user text's, when the caller already has them; only
+        the bot text is scanned here. `intents` (head -> probability from
+        src.intent_heads) replace the user text's keyword hits for the
+        families they cover; the bot text's keyword hits are added on top.
+        """
         reason_tags: List[str] = []
         boundary_event = safety_label == "MOVE" or rule_hit
         if boundary_event:
             reason_tags.append("boundary_event")
 
-        combined = f"{user_text}\n{bot_text}"
-        flirt_score, flirt_tags = _score_text(combined, _FLIRT_PATTERNS)
-        intimacy_score, intimacy_tags = _score_text(combined, _INTIMACY_PATTERNS)
-        erotic_score, erotic_tags = _score_text(combined, _EROTIC_PATTERNS)
-        slowdown_hit, slowdown_tags = _has_slowdown(combined)
-
-        reason_tags.extend(flirt_tags + intimacy_tags + erotic_tags + slowdown_tags)
-        self.signals.append(
-            {"flirt": flirt_score, "intimacy": intimacy_score, "erotic": erotic_score}
-        )
+        if intents:
+            bot = extract_features(bot_text, PHASE_FAMILIES)
+            user = features or extract_features(user_text, PHASE_FAMILIES)
+            counts: List[int] = []
+            for family in SIGNAL_FAMILIES:
+                if family in intents:
+                    hits = intent_hits(intents[family])
+                    tags = ([f"{family}:head"] if hits else []) + bot.tags(family)
+                    counts.append(min(SIGNAL_HIT_CAP, hits + bot.count(family)))
+                else:
+                    tags = user.union(bot).tags(family)
+                    counts.append(min(SIGNAL_HIT_CAP, len(tags)))
+                reason_tags.extend(tags)
+            if "slowdown" in intents:
+                slowdown_tags = (["slowdown:head"] if intent_hits(intents["slowdown"]) else []) + bot.tags("slowdown")
+                slowdown_hit = bool(slowdown_tags)
+            else:
+                slowdown_hit, slowdown_tags = _has_slowdown(user.union(bot))
+            reason_tags.extend(slowdown_tags)
+            avg_flirt, avg_intimacy, avg_erotic = self._push((counts[0], counts[1], counts[2]))
+        else:
+            # No phase pattern can span the "\n" join, so the hits on the combined
+            # text are exactly the union of the per-text hits.
+            combined = (features or extract_features(user_text, PHASE_FAMILIES)).union(
+                extract_features(bot_text, PHASE_FAMILIES)
+            )
+            flirt_tags = combined.tags("flirt")
+            intimacy_tags = combined.tags("intimacy")
+            erotic_tags = combined.tags("erotic")
+            slowdown_hit, slowdown_tags = _has_slowdown(combined)
 
-        avg_flirt = sum(s["flirt"] for s in self.signals) / len(self.signals)
-        avg_intimacy = sum(s["intimacy"] for s in self.signals) / len(self.signals)
-        avg_erotic = sum(s["erotic"] for s in self.signals) / len(self.signals)
+            reason_tags.extend(flirt_tags + intimacy_tags + erotic_tags + slowdown_tags)
+            avg_flirt, avg_intimacy, avg_erotic = self._push(
+                (
+                    min(SIGNAL_HIT_CAP, len(flirt_tags)),
+                    min(SIGNAL_HIT_CAP, len(intimacy_tags)),
+                    min(SIGNAL_HIT_CAP, len(erotic_tags)),
+                )
+            )
 
         if boundary_event:
             self.phase = ConversationPhase.BOUNDARY_REPAIR
@@ -133,7 +226,7 @@ class ConversationPhaseTracker:
                 target_phase = self._step_back(target_phase)
             self.phase = self._conservative_transition(self.phase, target_phase)
 
-        if self.phase not in {ConversationPhase.BOUNDARY_REPAIR, ConversationPhase.COOLDOWN}:
+        if self.phase not in _REPAIR_PHASES:
             self.prev_safe_phase = self.phase
 
         self.last_state = PhaseState(
@@ -145,40 +238,119 @@ class ConversationPhaseTracker:
         )
         return self.last_state
 
+    @classmethod
+    def update_many(
+        cls,
+        conversations: Sequence[Sequence[Tuple[str, str, str, bool]]],
+        window: int = 8,
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Phase trajectories for many conversations at once; each conversation is
+        a list of (user_text, bot_text, safety_label, rule_hit) turns. Returns
+        (phases, scores): phases is an int (C, T) array of indices into
+        `ConversationPhase` (-1 past a conversation's end) and scores a float
+        (C, T, 3) array of the flirt/intimacy/erotic window averages. Same
+        results as calling update() turn by turn on a fresh tracker.
+        """
+        n_conv = len(conversations)
+        n_turns = max((len(c) for c in conversations), default=0)
+        hits = np.zeros((n_conv, n_turns, 3), dtype=np.int64)
+        slowdown = np.zeros((n_conv, n_turns), dtype=bool)
+        boundary = np.zeros((n_conv, n_turns), dtype=bool)
+        lengths = np.zeros(n_conv, dtype=np.int64)
+        for c, turns in enumerate(conversations):
+            lengths[c] = len(turns)
+            for t, (user_text, bot_text, safety_label, rule_hit) in enumerate(turns):
+                combined = extract_features(user_text, PHASE_FAMILIES).union(
+                    extract_features(bot_text, PHASE_FAMILIES)
+                )
+                for k, family in enumerate(SIGNAL_FAMILIES):
+                    hits[c, t, k] = min(SIGNAL_HIT_CAP, combined.count(family))
+                slowdown[c, t] = combined.any("slowdown")
+                boundary[c, t] = safety_label == "MOVE" or bool(rule_hit)
+        return phase_trajectories(hits, slowdown, boundary, lengths, max(6, min(10, window)))
+
     def _phase_from_scores(
         self, flirt_score: float, intimacy_score: float, erotic_score: float
     ) -> ConversationPhase:
-        if erotic_score >= 0.6:
-            return ConversationPhase.EROTIC
-        if intimacy_score >= 0.5:
-            return ConversationPhase.INTIMATE
-        if flirt_score >= 0.4:
-            return ConversationPhase.FLIRTING
-        if intimacy_score >= 0.2 or flirt_score >= 0.2:
-            return ConversationPhase.RAPPORT
-        return ConversationPhase.OPENING
+        return _ORDERED_PHASES[_phase_code_from_scores(flirt_score, intimacy_score, erotic_score)]
 
     def _step_back(self, phase: ConversationPhase) -> ConversationPhase:
-        order = self._ordered_phases()
-        idx = max(0, order.index(phase) - 1)
-        return order[idx]
+        return _ORDERED_PHASES[max(0, _PHASE_INDEX[phase] - 1)]
 
     def _conservative_transition(
         self, current: ConversationPhase, target: ConversationPhase
     ) -> ConversationPhase:
-        order = self._ordered_phases()
-        cur_idx = order.index(current)
-        tgt_idx = order.index(target)
-        if tgt_idx > cur_idx + 1:
-            tgt_idx = cur_idx + 1
-        return order[tgt_idx]
-
-    @staticmethod
-    def _ordered_phases() -> List[ConversationPhase]:
-        return [
-            ConversationPhase.OPENING,
-            ConversationPhase.RAPPORT,
-            ConversationPhase.FLIRTING,
-            ConversationPhase.INTIMATE,
-            ConversationPhase.EROTIC,
-        ]
+        return _ORDERED_PHASES[min(_PHASE_INDEX[target], _PHASE_INDEX[current] + 1)]
+
+
+def phase_trajectories(
+    hits: np.ndarray,
+    slowdown: np.ndarray,
+    boundary: np.ndarray,
+    lengths: np.ndarray,
+    window: int = 8,
+) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    The tracker's state machine over (C, T) turn signals, vectorized across
+    conversations: window codes roll forward one NumPy step per turn index,
+    each distinct window is averaged once, and the transitions are one masked
+    step per turn index. `hits` holds the capped per-turn
+    flirt/intimacy/erotic hit counts.
+    """
+    n_conv, n_turns = hits.shape[:2]
+    codes = np.zeros((n_conv, n_turns, 3), dtype=np.int64)
+    code = np.zeros((n_conv, 3), dtype=np.int64)
+    for t in range(n_turns):
+        code = roll_window_code(code, hits[:, t].astype(np.int64), window)
+        codes[:, t] = code
+    scores = window_means(codes)
+
+    phase = np.zeros(n_conv, dtype=np.int64)
+    prev_safe = np.zeros(n_conv, dtype=np.int64)
+    cooldown = np.zeros(n_conv, dtype=np.int64)
+    phases = np.full((n_conv, n_turns), -1, dtype=np.int64)
+    for t in range(n_turns):
+        live = t < lengths
+        new_phase, new_prev_safe, new_cooldown = phase_step(
+            phase, prev_safe, cooldown, scores[:, t], slowdown[:, t], boundary[:, t]
+        )
+        phase = np.where(live, new_phase, phase)
+        prev_safe = np.where(live, new_prev_safe, prev_safe)
+        cooldown = np.where(live, new_cooldown, cooldown)
+        phases[:, t] = np.where(live, phase, -1)
+    return phases, np.where((phases >= 0)[:, :, None], scores, 0.0)
+
+
+def phase_step(
+    phase: np.ndarray,
+    prev_safe: np.ndarray,
+    cooldown: np.ndarray,
+    scores: np.ndarray,
+    slowdown: np.ndarray,
+    boundary: np.ndarray,
+) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    One `update()` transition for a vector of trackers: phase codes index
+    `ConversationPhase`, `scores` is (N, 3) flirt/intimacy/erotic window
+    averages. Returns the new (phase, prev_safe, cooldown).
+    """
+    br = _PHASE_INDEX[ConversationPhase.BOUNDARY_REPAIR]
+    cd = _PHASE_INDEX[ConversationPhase.COOLDOWN]
+    flirt, intimacy, erotic = scores[:, 0], scores[:, 1], scores[:, 2]
+    target = np.select(
+        [erotic >= 0.6, intimacy >= 0.5, flirt >= 0.4, (intimacy >= 0.2) | (flirt >= 0.2)],
+        [4, 3, 2, 1],
+        default=0,
+    )
+    target = np.where(slowdown, np.maximum(target - 1, 0), target)
+    normal = np.minimum(target, phase + 1)
+
+    in_br, in_cd = phase == br, phase == cd
+    resume = in_cd & (cooldown == 1)
+    new_phase = np.where(in_br, cd, np.where(in_cd, np.where(resume, prev_safe, cd), normal))
+    new_cooldown = np.where(in_cd & (cooldown > 0), cooldown - 1, cooldown)
+    new_phase = np.where(boundary, br, new_phase)
+    new_cooldown = np.where(boundary, 1, new_cooldown)
+    new_prev_safe = np.where(new_phase < br, new_phase, prev_safe)
+    return new_phase, new_prev_safe, new_cooldown
@@ -0,0 +1,231 @@
+# src/embedding_store.py
+from __future__ import annotations
+
+from contextlib import contextmanager
+import hashlib
+import json
+import os
+from pathlib import Path
+import re
+from typing import Callable, Dict, Iterator, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+try:
+    import fcntl
+except ImportError:  # Windows: no cross-process lock, keep one writer per directory
+    fcntl = None
+
+DEFAULT_ROOT = Path(__file__).resolve().parents[1] / "data" / "embeddings"
+
+
+def normalize_text(text: str) -> str:
+    return re.sub(r"\s+", " ", text or "").strip()
+
+
+def text_key(text: str) -> str:
+    """Cache key for a text: sha1 of its whitespace-normalized form."""
+    return hashlib.sha1(normalize_text(text).encode("utf-8")).hexdigest()
+
+
+def _slug(model_name: str, normalize: bool) -> str:
+    base = re.sub(r"[^A-Za-z0-9._-]+", "_", model_name).strip("_")
+    return f"{base}__norm{int(bool(normalize))}"
+
+
+class EmbeddingStore:
+    """
+    Append-only on-disk cache of text embeddings for one (embed model, normalize) pair.
+
+    Layout under `root/<model>__norm<0|1>/`:
+      - meta.json: model name, normalize flag, dim
+      - vectors.npy: float32 matrix (capacity x dim), opened memory-mapped
+      - index.txt: one text key per line; line i is row i of vectors.npy
+      - .lock: flock'ed around every append
+
+    Rows are written before their index line, so an interrupted append never
+    exposes an unwritten row. Appends take the lock and first read the index
+    lines other processes added since, so several processes (chatbot, server,
+    evals) can share one directory.
+    """
+
+    def __init__(self, model_name: str, normalize: bool = True, root: Optional[Path] = None):
+        self.model_name = model_name
+        self.normalize = bool(normalize)
+        self.root = Path(root) if root else DEFAULT_ROOT
+        self.dir = self.root / _slug(model_name, self.normalize)
+        self.meta_path = self.dir / "meta.json"
+        self.vectors_path = self.dir / "vectors.npy"
+        self.index_path = self.dir / "index.txt"
+        self.lock_path = self.dir / ".lock"
+        self.dim: Optional[int] = None
+        self._rows: Dict[str, int] = {}
+        self._n_rows = 0  # index lines read so far (= next free row)
+        self._index_pos = 0  # byte offset just past the last complete index line read
+        self._vectors: Optional[np.memmap] = None
+        self._vectors_stat: Optional[Tuple[int, int]] = None
+        if self.dir.exists():
+            with self._locked():
+                self._refresh()
+
+    @contextmanager
+    def _locked(self) -> Iterator[None]:
+        if fcntl is None:
+            yield
+            return
+        self.dir.mkdir(parents=True, exist_ok=True)
+        with self.lock_path.open("a") as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+    def _refresh(self) -> None:
+        """Picks up what other writers appended: a grown vectors file and new index lines. Call under the lock."""
+        if not self.meta_path.exists() or not self.vectors_path.exists():
+            return
+        if self.dim is None:
+            self.dim = int(json.loads(self.meta_path.read_text(encoding="utf-8"))["dim"])
+        st = os.stat(self.vectors_path)
+        if self._vectors is None or (st.st_ino, st.st_size) != self._vectors_stat:
+            self._vectors = np.load(self.vectors_path, mmap_mode="r+")
+            self._vectors_stat = (st.st_ino, st.st_size)
+        capacity = self._vectors.shape[0]
+        if not self.index_path.exists():
+            return
+        with self.index_path.open("rb") as f:
+            f.seek(self._index_pos)
+            for raw in f:
+                if not raw.endswith(b"\n") or self._n_rows >= capacity:
+                    break  # torn tail of an interrupted append
+                self._index_pos += len(raw)
+                key = raw.decode("utf-8").strip()
+                if key:
+                    self._rows.setdefault(key, self._n_rows)
+                    self._n_rows += 1
+
+    def __len__(self) -> int:
+        return len(self._rows)
+
+    def __contains__(self, key: str) -> bool:
+        return key in self._rows
+
+    def get_many(self, keys: Sequence[str]) -> Tuple[Optional[np.ndarray], np.ndarray]:
+        """Returns (vectors, found); rows for missing keys are zero."""
+        found = np.array([k in self._rows for k in keys], dtype=bool)
+        if self._vectors is None or not found.any():
+            return None, found
+        X = np.zeros((len(keys), self.dim), dtype=np.float32)
+        idx = np.flatnonzero(found)
+        X[idx] = self._vectors[[self._rows[keys[i]] for i in idx]]
+        return X, found
+
+    def _ensure_capacity(self, needed: int) -> None:
+        capacity = 0 if self._vectors is None else self._vectors.shape[0]
+        if needed <= capacity:
+            return
+        new_capacity = max(needed, 2 * capacity, 1024)
+        tmp_path = self.vectors_path.with_suffix(".npy.tmp")
+        grown = np.lib.format.open_memmap(tmp_path, mode="w+", dtype=np.float32, shape=(new_capacity, self.dim))
+        if self._vectors is not None and self._n_rows:
+            grown[: self._n_rows] = self._vectors[: self._n_rows]
+        grown.flush()
+        del grown
+        self._vectors = None
+        os.replace(tmp_path, self.vectors_path)
+        self._vectors = np.load(self.vectors_path, mmap_mode="r+")
+        st = os.stat(self.vectors_path)
+        self._vectors_stat = (st.st_ino, st.st_size)
+
+    def add_many(self, keys: Sequence[str], X: np.ndarray) -> None:
+        X = np.asarray(X, dtype=np.float32)
+        if not any(key not in self._rows for key in keys):
+            return
+        with self._locked():
+            self._refresh()
+            new: Dict[str, int] = {}
+            for i, key in enumerate(keys):
+                if key not in self._rows and key not in new:
+                    new[key] = i
+            if not new:
+                return
+
+            if self.dim is None:
+                self.dim = int(X.shape[1])
+                self.dir.mkdir(parents=True, exist_ok=True)
+                meta = {"model_name": self.model_name, "normalize": self.normalize, "dim": self.dim}
+                self.meta_path.write_text(json.dumps(meta, indent=2), encoding="utf-8")
+            elif X.shape[1] != self.dim:
+                raise ValueError(f"Embedding dim mismatch for {self.dir}: store={self.dim}, got={X.shape[1]}")
+
+            start = self._n_rows
+            self._ensure_capacity(start + len(new))
+            self._vectors[start : start + len(new)] = X[list(new.values())]
+            self._vectors.flush()
+            with self.index_path.open("ab") as f:
+                f.truncate(self._index_pos)  # drop a torn line left by an interrupted append
+                data = "".join(f"{k}\n" for k in new).encode("utf-8")
+                f.write(data)
+            self._index_pos += len(data)
+            for offset, key in enumerate(new):
+                self._rows[key] = start + offset
+            self._n_rows = start + len(new)
+
+
+def encode_with_store(
+    texts: Sequence[str],
+    store: Optional[EmbeddingStore],
+    encode_fn: Callable[[List[str]], np.ndarray],
+) -> np.ndarray:
+    """
+    Embeds `texts` (normalized), reading hits from `store` and calling `encode_fn`
+    only for the unique misses. With a warm store `encode_fn` is never called.
+    """
+    norm = [normalize_text(t) for t in texts]
+    if not norm:
+        return np.zeros((0, (store.dim if store else None) or 0), dtype=np.float32)
+    if store is None:
+        return np.asarray(encode_fn(norm), dtype=np.float32)
+
+    keys = [text_key(t) for t in norm]
+    X, found = store.get_many(keys)
+    missing: Dict[str, str] = {}
+    for key, text, hit in zip(keys, norm, found.tolist()):
+        if not hit:
+            missing.setdefault(key, text)
+    if missing:
+        new = np.asarray(encode_fn(list(missing.values())), dtype=np.float32)
+        store.add_many(list(missing.keys()), new)
+        X, found = store.get_many(keys)
+    return X
+
+
+def embed_texts(
+    texts: Sequence[str],
+    model_name: str,
+    normalize: bool = True,
+    store_root: Optional[str] = None,
+    batch_size: int = 64,
+    show_progress_bar: bool = False,
+) -> np.ndarray:
+    """
+    Store-backed SentenceTransformer encoding for the offline scripts.
+    The transformer is only loaded if at least one text is a cache miss.
+    """
+    store = EmbeddingStore(model_name, normalize, root=Path(store_root)) if store_root else None
+
+    def _encode(batch: List[str]) -> np.ndarray:
+        from sentence_transformers import SentenceTransformer
+
+        print(f"[EMBED] encoding {len(batch)} uncached texts with {model_name}")
+        embedder = SentenceTransformer(model_name)
+        return embedder.encode(
+            batch,
+            batch_size=batch_size,
+            show_progress_bar=show_progress_bar,
+            convert_to_numpy=True,
+            normalize_embeddings=normalize,
+        )
+
+    return encode_with_store(texts, store, _encode)
@@ -4,11 +4,14 @@ import json
 from collections import defaultdict
 from datetime import datetime, timezone
 from pathlib import Path
-from typing import Any, Dict, List, Tuple
+from typing import Any, Dict, List, Optional, Tuple
 
 import joblib
 import numpy as np
 
+from src.embedding_store import DEFAULT_ROOT, embed_texts
+from src.threshold_sweep import print_sweep, sweep_report
+
 
 def read_jsonl(path: Path) -> List[Dict[str, Any]]:
     rows = []
@@ -52,17 +55,14 @@ def metrics_from_conf(conf: Dict[str, int]) -> Dict[str, float]:
     return {"precision": precision, "recall": recall, "f1": f1, "accuracy": acc}
 
 
-def predict_p_move(model_artifact: Any, texts: List[str]) -> np.ndarray:
+def predict_p_move(model_artifact: Any, texts: List[str], embed_store: Optional[str] = None) -> np.ndarray:
     if isinstance(model_artifact, dict) and model_artifact.get("type") == "embed_lr":
-        from sentence_transformers import SentenceTransformer
-
-        embedder = SentenceTransformer(model_artifact["sentence_transformer"])
-        X = embedder.encode(
+        X = embed_texts(
             texts,
+            model_artifact["sentence_transformer"],
+            normalize=bool(model_artifact.get("normalize_embeddings", True)),
+            store_root=embed_store,
             batch_size=64,
-            show_progress_bar=False,
-            convert_to_numpy=True,
-            normalize_embeddings=bool(model_artifact.get("normalize_embeddings", True)),
         )
         clf = model_artifact["logreg"]
         return clf.predict_proba(X)[:, 1]
@@ -84,6 +84,10 @@ def main() -> None:
     ap.add_argument("--move_key", default="MOVE")
     ap.add_argument("--move_threshold", type=int, default=2, help="Ground-truth mapping: MOVE if MOVE>=threshold")
     ap.add_argument("--uc_key", default="use_case")
+    ap.add_argument("--embed_store", default=str(DEFAULT_ROOT), help="Shared embedding store dir ('' disables)")
+    ap.add_argument("--sweep", action="store_true", help="Also evaluate a threshold grid from the same p_move")
+    ap.add_argument("--sweep_step", type=float, default=0.01)
+    ap.add_argument("--calibration_bins", type=int, default=10)
     args = ap.parse_args()
 
     rows = read_jsonl(Path(args.in_path))
@@ -94,7 +98,7 @@ def main() -> None:
     y_true = derive_y(rows, move_key=args.move_key, move_threshold=args.move_threshold)
 
     model = joblib.load(args.model_path)
-    p_move = predict_p_move(model, texts)
+    p_move = predict_p_move(model, texts, embed_store=args.embed_store or None)
     y_pred = (p_move >= args.threshold).astype(np.int32)
 
     overall_conf = confusion_counts(y_true, y_pred)
@@ -133,6 +137,11 @@ def main() -> None:
         "by_use_case": per_uc,
         "timestamp": datetime.now(timezone.utc).isoformat(),
     }
+    if args.sweep:
+        groups = [str(r.get(args.uc_key, "UNKNOWN")) for r in rows] if args.uc_key in rows[0] else None
+        report["sweep"] = sweep_report(
+            y_true, p_move, groups, step=args.sweep_step, bins=args.calibration_bins, current=args.threshold
+        )
 
     out_path = Path(args.out_path)
     out_path.parent.mkdir(parents=True, exist_ok=True)
@@ -147,6 +156,8 @@ def main() -> None:
         f"F1={overall_metrics['f1']:.3f} "
         f"Acc={overall_metrics['accuracy']:.3f}"
     )
+    if args.sweep:
+        print_sweep(report["sweep"])
     print(f"Wrote report to: {out_path}")
 
 
@@ -0,0 +1,166 @@
+# src/eval_intent_heads.py
+from __future__ import annotations
+
+import argparse
+from collections import Counter, defaultdict
+import json
+from pathlib import Path
+import random
+import time
+from typing import Any, Dict, List
+
+import numpy as np
+
+from src.conversation_phase import ConversationPhaseTracker
+from src.embedding_store import DEFAULT_ROOT, embed_texts
+from src.intent_heads import DEFAULT_HEADS, INTENT_HEADS, INTENT_THRESHOLD, IntentHeads, fit_heads, regex_labels, weak_labels
+from src.replay_bench import conversations_from_samples
+from src.text_features import PHASE_FAMILIES, extract_features
+from src.train_intent_heads import DEFAULT_TRAIN, read_labelled_texts
+
+ROOT = Path(__file__).resolve().parents[1]
+DATA = ROOT / "data"
+
+
+def _prf(y: np.ndarray, pred: np.ndarray) -> Dict[str, float]:
+    tp = int(np.sum(y & pred))
+    precision = tp / max(1, int(pred.sum()))
+    recall = tp / max(1, int(y.sum()))
+    f1 = 2 * precision * recall / (precision + recall) if precision + recall else 0.0
+    return {"precision": precision, "recall": recall, "f1": f1}
+
+
+def cross_val_proba(X: np.ndarray, Y: np.ndarray, folds: int, seed: int, min_positives: int, C: float) -> np.ndarray:
+    """Out-of-fold head probabilities; NaN where the fold's training part had too few labels to fit a head."""
+    idx = list(range(len(X)))
+    random.Random(seed).shuffle(idx)
+    P = np.full(Y.shape, np.nan)
+    for f in range(folds):
+        test = np.asarray(sorted(idx[f::folds]), dtype=np.int64)
+        train = np.setdiff1d(np.arange(len(X)), test)
+        heads = fit_heads(X[train], Y[train], min_positives=min_positives, C=C, seed=seed)
+        if heads.heads:
+            cols = [INTENT_HEADS.index(h) for h in heads.heads]
+            P[np.ix_(test, cols)] = heads.proba_many(X[test])
+    return P
+
+
+def phase_comparison(
+    heads: IntentHeads, samples: Path, turns_per_conv: int, embed_model: str, store_root: str
+) -> Dict[str, Any]:
+    """Regex vs heads trackers over replay conversations (user turns only, every turn taken as SAFE)."""
+    convs = conversations_from_samples(samples, turns_per_conv)
+    texts = sorted({t for c in convs for t in c.turns})
+    X = embed_texts(texts, embed_model, normalize=True, store_root=store_root)
+    row = {t: i for i, t in enumerate(texts)}
+
+    phases: Dict[str, Counter] = {"regex": Counter(), "heads": Counter()}
+    agree = turns = 0
+    by_uc: Dict[str, Counter] = defaultdict(Counter)
+    regex_s = heads_s = 0.0
+    for c in convs:
+        regex_tracker, heads_tracker = ConversationPhaseTracker(), ConversationPhaseTracker()
+        for text in c.turns:
+            t0 = time.perf_counter()
+            features = extract_features(text, PHASE_FAMILIES)
+            t1 = time.perf_counter()
+            intents = heads.predict(X[row[text]])
+            t2 = time.perf_counter()
+            regex_s += t1 - t0
+            heads_s += t2 - t1
+            a = regex_tracker.update(text, "", "SAFE", False, features).phase.value
+            b = heads_tracker.update(text, "", "SAFE", False, features, intents=intents).phase.value
+            phases["regex"][a] += 1
+            phases["heads"][b] += 1
+            turns += 1
+            agree += int(a == b)
+            by_uc[c.use_case]["n"] += 1
+            by_uc[c.use_case]["agree"] += int(a == b)
+    return {
+        "conversations": len(convs),
+        "turns": turns,
+        "phase_agreement": agree / max(1, turns),
+        "phase_distribution": {k: dict(sorted(v.items())) for k, v in phases.items()},
+        "agreement_by_use_case": {uc: c["agree"] / c["n"] for uc, c in sorted(by_uc.items())},
+        "us_per_turn": {"regex": 1e6 * regex_s / max(1, turns), "heads": 1e6 * heads_s / max(1, turns)},
+    }
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description="Compare the intent heads with the keyword detectors.")
+    ap.add_argument("--train_jsonl", nargs="+", default=DEFAULT_TRAIN)
+    ap.add_argument("--intent_heads", default=str(DEFAULT_HEADS), help="Heads for the phase comparison (fit here if missing)")
+    ap.add_argument("--embed_model", default="sentence-transformers/all-MiniLM-L6-v2")
+    ap.add_argument("--embed_store", default=str(DEFAULT_ROOT), help="Shared embedding store dir ('' disables)")
+    ap.add_argument("--folds", type=int, default=5)
+    ap.add_argument("--min_positives", type=int, default=5)
+    ap.add_argument("--C", type=float, default=1.0)
+    ap.add_argument("--seed", type=int, default=42)
+    ap.add_argument("--samples", default=str(DATA / "samples_unlabeled.jsonl"), help="Replay texts for the phase comparison")
+    ap.add_argument("--turns_per_conv", type=int, default=6)
+    ap.add_argument("--examples", type=int, default=5, help="Disagreement examples per head")
+    ap.add_argument("--out", default=str(DATA / "results" / "intent_heads_report.json"))
+    args = ap.parse_args()
+
+    texts, categories = read_labelled_texts(args.train_jsonl)
+    Y = weak_labels(texts, categories)
+    R = regex_labels(texts)
+    X = embed_texts(texts, args.embed_model, normalize=True, store_root=args.embed_store or None)
+    P = cross_val_proba(X, Y, args.folds, args.seed, args.min_positives, args.C)
+
+    per_head: Dict[str, Any] = {}
+    for k, head in enumerate(INTENT_HEADS):
+        y, regex = Y[:, k], R[:, k]
+        trained = ~np.isnan(P[:, k])
+        pred = np.where(trained, np.nan_to_num(P[:, k]) >= INTENT_THRESHOLD, regex)  # untrained folds stay regex
+        keyword_free = y & ~regex
+        per_head[head] = {
+            "n_positive": int(y.sum()),
+            "trained_fraction": float(trained.mean()),
+            "heads": _prf(y, pred),
+            "regex": _prf(y, regex),
+            "recall_without_keywords": float((pred & keyword_free).sum() / max(1, keyword_free.sum())),
+            "heads_only": [texts[i] for i in np.flatnonzero(pred & ~regex)[: args.examples]],
+            "regex_only": [texts[i] for i in np.flatnonzero(regex & ~pred)[: args.examples]],
+        }
+
+    if Path(args.intent_heads).exists():
+        heads = IntentHeads.load(args.intent_heads)
+    else:
+        print(f"[WARN] {args.intent_heads} not found; fitting heads on all texts for the phase comparison")
+        heads = fit_heads(X, Y, min_positives=args.min_positives, C=args.C, seed=args.seed)
+    phase = phase_comparison(
+        heads, Path(args.samples), args.turns_per_conv, args.embed_model, args.embed_store or None
+    )
+
+    report = {
+        "train_jsonl": args.train_jsonl,
+        "n_texts": len(texts),
+        "folds": args.folds,
+        "labels": "weak: keyword hits OR synth-category prior (src.intent_heads.CATEGORY_HEADS)",
+        "per_head": per_head,
+        "phase_heads": heads.heads,
+        "phase": phase,
+    }
+
+    print(f"=== intent heads vs regex ({len(texts)} texts, {args.folds}-fold CV on weak labels) ===")
+    for head, m in per_head.items():
+        h, r = m["heads"], m["regex"]
+        tag = "" if m["trained_fraction"] == 1.0 else f" (regex in {1 - m['trained_fraction']:.0%} of rows)"
+        print(
+            f"- {head:<16} pos={m['n_positive']:<3} heads F1={h['f1']:.3f} R={h['recall']:.3f} | "
+            f"regex F1={r['f1']:.3f} R={r['recall']:.3f} | no-keyword recall={m['recall_without_keywords']:.3f}{tag}"
+        )
+    print(
+        f"Phase: {phase['turns']} turns, agreement={phase['phase_agreement']:.3f}, "
+        f"us/turn regex={phase['us_per_turn']['regex']:.1f} heads={phase['us_per_turn']['heads']:.1f}"
+    )
+    if args.out:
+        out = Path(args.out)
+        out.parent.mkdir(parents=True, exist_ok=True)
+        out.write_text(json.dumps(report, indent=2), encoding="utf-8")
+        print(f"\nWrote {out}")
+
+
+if __name__ == "__main__":
+    main()
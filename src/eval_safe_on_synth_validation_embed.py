@@ -3,11 +3,14 @@ import argparse
 import json
 from collections import defaultdict
 from pathlib import Path
-from typing import Any, Dict, List, Tuple
+from typing import Any, Dict, List, Optional, Tuple
 
 import joblib
 import numpy as np
 
+from src.embedding_store import DEFAULT_ROOT, embed_texts
+from src.threshold_sweep import print_sweep, sweep_report
+
 
 def read_jsonl(path: Path) -> List[Dict[str, Any]]:
     rows = []
@@ -52,21 +55,18 @@ def prf(conf: Dict[str, int]) -> Dict[str, float]:
     return {"precision": precision, "recall": recall, "f1": f1, "accuracy": acc}
 
 
-def predict_p_move(model_artifact: Any, texts: List[str]) -> np.ndarray:
+def predict_p_move(model_artifact: Any, texts: List[str], embed_store: Optional[str] = None) -> np.ndarray:
     """
     Supports your embedding artifact dict:
       {"type":"embed_lr", "sentence_transformer":..., "logreg":...}
     """
     if isinstance(model_artifact, dict) and model_artifact.get("type") == "embed_lr":
-        from sentence_transformers import SentenceTransformer
-
-        embedder = SentenceTransformer(model_artifact["sentence_transformer"])
-        X = embedder.encode(
+        X = embed_texts(
             texts,
+            model_artifact["sentence_transformer"],
+            normalize=bool(model_artifact.get("normalize_embeddings", True)),
+            store_root=embed_store,
             batch_size=64,
-            show_progress_bar=False,
-            convert_to_numpy=True,
-            normalize_embeddings=bool(model_artifact.get("normalize_embeddings", True)),
         )
         clf = model_artifact["logreg"]
         return clf.predict_proba(X)[:, 1]
@@ -86,6 +86,10 @@ def main():
     ap.add_argument("--move_key", default="MOVE")
     ap.add_argument("--move_threshold", type=int, default=2, help="Ground-truth mapping: MOVE if MOVE>=move_threshold")
     ap.add_argument("--uc_key", default="use_case")
+    ap.add_argument("--embed_store", default=str(DEFAULT_ROOT), help="Shared embedding store dir ('' disables)")
+    ap.add_argument("--sweep", action="store_true", help="Also evaluate a threshold grid from the same p_move")
+    ap.add_argument("--sweep_step", type=float, default=0.01)
+    ap.add_argument("--calibration_bins", type=int, default=10)
     args = ap.parse_args()
 
     model = joblib.load(args.model_path)
@@ -96,7 +100,7 @@ def main():
     texts = [str(r.get(args.text_key, "")).strip() for r in rows]
     y_true = y_true_from_scores(rows, args.safe_key, args.move_key, args.move_threshold)
 
-    p_move = predict_p_move(model, texts)
+    p_move = predict_p_move(model, texts, embed_store=args.embed_store or None)
     y_pred = (p_move >= args.threshold).astype(np.int32)
 
     overall_conf = confusion_counts(y_true, y_pred)
@@ -135,6 +139,12 @@ def main():
         "overall": {"n": int(len(rows)), **overall_metrics, "confusion": overall_conf},
         "per_use_case": per_uc,
     }
+    if args.sweep:
+        groups = [str(r.get(args.uc_key, "UNKNOWN")) for r in rows] if args.uc_key in rows[0] else None
+        report["sweep"] = sweep_report(
+            y_true, p_move, groups, step=args.sweep_step, bins=args.calibration_bins, current=args.threshold
+        )
+        print_sweep(report["sweep"])
 
     out_path = Path(args.out_path)
     out_path.parent.mkdir(parents=True, exist_ok=True)
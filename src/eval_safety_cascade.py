@@ -0,0 +1,203 @@
+# src/eval_safety_cascade.py
+from __future__ import annotations
+
+import argparse
+from collections import Counter, defaultdict
+import json
+from pathlib import Path
+import random
+import time
+from typing import Any, Dict, List, Tuple
+
+import numpy as np
+
+from src.embedding_store import DEFAULT_ROOT, text_key
+from src.safety_cascade import DEFAULT_BANDS, CascadeBands, SparseSafetyModel
+from src.safety_embed import SAFETY_BACKENDS, SafetyEmbedScorer
+
+ROOT = Path(__file__).resolve().parents[1]
+DATA = ROOT / "data"
+DEFAULT_INPUTS = [
+    DATA / "samples_unlabeled.jsonl",
+    DATA / "labels_safe_move_synth_merged.jsonl",
+    DATA / "labels_safe_move_synth_validation.jsonl",
+]
+DISABLED = 1.01  # move_above above any probability: no sparse MOVE band
+
+
+def read_texts(paths: List[Path], text_key_name: str = "user_text") -> List[Dict[str, Any]]:
+    """Non-empty texts from all inputs, deduplicated on the embedding-store key."""
+    rows, seen = [], set()
+    for path in paths:
+        for line in path.read_text(encoding="utf-8").splitlines():
+            if not line.strip():
+                continue
+            r = json.loads(line)
+            text = str(r.get(text_key_name, "")).strip()
+            key = text_key(text)
+            if text and key not in seen:
+                seen.add(key)
+                rows.append({"text": text, "use_case": str(r.get("use_case", "UNKNOWN")), "source": path.name})
+    return rows
+
+
+def fit_bands(s: np.ndarray, y: np.ndarray, target: float, min_support: int) -> Tuple[float, float]:
+    """
+    Widest SAFE prefix and MOVE suffix of the sparse-score order whose
+    agreement with the embed labels `y` is >= target. Cuts fall between
+    distinct scores so equal scores always land in the same band.
+    """
+    order = np.argsort(s, kind="stable")
+    ss, yy = s[order], y[order].astype(np.int64)
+    n = ss.size
+    if n == 0:
+        return 0.0, DISABLED
+    safe_cum = np.cumsum(1 - yy)  # SAFE count in prefix [0, k)
+    move_cum = np.cumsum(yy[::-1])[::-1]  # MOVE count in suffix [j, n)
+
+    safe_below = 0.0
+    for k in range(n, max(min_support, 1) - 1, -1):
+        if k < n and ss[k] == ss[k - 1]:
+            continue
+        if safe_cum[k - 1] / k >= target:
+            safe_below = float(ss[k]) if k < n else float(np.nextafter(ss[-1], np.inf))
+            break
+
+    move_above = DISABLED
+    for j in range(0, n - max(min_support, 1) + 1):
+        if j > 0 and ss[j] == ss[j - 1]:
+            continue
+        if float(ss[j]) < safe_below:
+            continue
+        if move_cum[j] / (n - j) >= target:
+            move_above = float(ss[j])
+            break
+    return safe_below, move_above
+
+
+def cascade_labels(s: np.ndarray, y_embed: np.ndarray, bands: CascadeBands) -> Tuple[np.ndarray, np.ndarray]:
+    """(cascade MOVE labels, escalated mask) given sparse scores and the embed-only labels."""
+    safe = s < bands.safe_below
+    move = s >= bands.move_above
+    escalated = ~(safe | move)
+    pred = np.where(escalated, y_embed, move.astype(np.int64))
+    return pred.astype(np.int64), escalated
+
+
+def _summary(s: np.ndarray, y: np.ndarray, bands: CascadeBands) -> Dict[str, Any]:
+    pred, esc = cascade_labels(s, y, bands)
+    n = int(s.size)
+    safe_band = s < bands.safe_below
+    move_band = s >= bands.move_above
+    return {
+        "n": n,
+        "escalation_rate": float(esc.mean()) if n else 0.0,
+        "agreement_with_embed": float((pred == y).mean()) if n else 0.0,
+        "sparse_safe": int(safe_band.sum()),
+        "sparse_move": int(move_band.sum()),
+        "escalated": int(esc.sum()),
+        "missed_moves": int(((pred == 0) & (y == 1)).sum()),
+        "extra_moves": int(((pred == 1) & (y == 0)).sum()),
+        "band_agreement": {
+            "safe": float((y[safe_band] == 0).mean()) if safe_band.any() else None,
+            "move": float((y[move_band] == 1).mean()) if move_band.any() else None,
+        },
+    }
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description="Fit and report the sparse bands of the cascade safety gate.")
+    ap.add_argument("--sparse_model", default="models/safe_violation_clf.joblib")
+    ap.add_argument("--safety_model", default="models/safe_violation_clf_embed.joblib")
+    ap.add_argument("--safety_backend", default="auto", choices=list(SAFETY_BACKENDS))
+    ap.add_argument("--embed_store", default=str(DEFAULT_ROOT), help="Shared embedding store dir ('' disables)")
+    ap.add_argument("--in_path", action="append", default=None, help="Repeatable; defaults to the repo's text sets")
+    ap.add_argument("--text_key", default="user_text")
+    ap.add_argument("--threshold", type=float, default=0.45, help="Embed gate threshold the bands are fit for")
+    ap.add_argument("--target_agreement", type=float, default=0.98, help="Min agreement with the embed gate per band")
+    ap.add_argument("--min_support", type=int, default=20, help="Min texts in a band for it to be used")
+    ap.add_argument("--calib_frac", type=float, default=0.7, help="Fraction of texts used to fit; the rest is holdout")
+    ap.add_argument("--seed", type=int, default=13)
+    ap.add_argument("--out_bands", default=str(DEFAULT_BANDS), help="'' = do not write bands")
+    ap.add_argument("--out_report", default=str(DATA / "results" / "safety_cascade_report.json"))
+    args = ap.parse_args()
+
+    paths = [Path(p) for p in args.in_path] if args.in_path else DEFAULT_INPUTS
+    rows = read_texts(paths, args.text_key)
+    if not rows:
+        raise ValueError(f"No texts found in {', '.join(map(str, paths))}")
+    texts = [r["text"] for r in rows]
+
+    sparse = SparseSafetyModel(args.sparse_model)
+    t0 = time.perf_counter()
+    s = sparse.proba_many(texts)
+    sparse_ms = 1000.0 * (time.perf_counter() - t0) / len(texts)
+    embed = SafetyEmbedScorer(args.safety_model, cache_size=0, embed_store=args.embed_store or None, backend=args.safety_backend)
+    y = (embed.predict_proba_many(texts) >= args.threshold).astype(np.int64)
+
+    idx = list(range(len(texts)))
+    random.Random(args.seed).shuffle(idx)
+    cut = int(round(args.calib_frac * len(idx)))
+    calib = np.asarray(sorted(idx[:cut]), dtype=np.int64)
+    hold = np.asarray(sorted(idx[cut:]), dtype=np.int64)
+
+    safe_below, move_above = fit_bands(s[calib], y[calib], args.target_agreement, args.min_support)
+    bands = CascadeBands(
+        safe_below=safe_below,
+        move_above=move_above,
+        threshold=args.threshold,
+        sparse_model=args.sparse_model,
+        target_agreement=args.target_agreement,
+    )
+
+    pred, esc = cascade_labels(s, y, bands)
+    disagree = np.flatnonzero(pred != y)
+    per_uc: Dict[str, Counter] = defaultdict(Counter)
+    for r, e in zip(rows, esc.tolist()):
+        per_uc[r["use_case"]]["n"] += 1
+        per_uc[r["use_case"]]["escalated"] += int(e)
+
+    report = {
+        "bands": bands.as_dict(),
+        "safety_model": args.safety_model,
+        "safety_backend": embed.backend,
+        "inputs": [str(p) for p in paths],
+        "calibration": _summary(s[calib], y[calib], bands),
+        "holdout": _summary(s[hold], y[hold], bands),
+        "overall": _summary(s, y, bands),
+        "embed_move_rate": float(y.mean()),
+        "sparse_ms_per_text": sparse_ms,
+        "per_use_case_escalation": {
+            uc: {"n": c["n"], "escalation_rate": c["escalated"] / c["n"]} for uc, c in sorted(per_uc.items())
+        },
+        "disagreements": [
+            {"text": texts[i], "source": rows[i]["source"], "p_sparse": float(s[i]), "embed_label": int(y[i])}
+            for i in disagree[:30]
+        ],
+    }
+
+    print("=== cascade safety gate ===")
+    print(
+        f"bands @ thr={args.threshold:g}: SAFE if p_sparse < {safe_below:.3f}, "
+        + (f"MOVE if p_sparse >= {move_above:.3f}" if move_above <= 1.0 else "no sparse MOVE band")
+    )
+    for name in ("calibration", "holdout", "overall"):
+        m = report[name]
+        print(
+            f"- {name:<11} n={m['n']:<4} escalation={m['escalation_rate']:.1%} "
+            f"agreement={m['agreement_with_embed']:.3f} missed_moves={m['missed_moves']} extra_moves={m['extra_moves']}"
+        )
+    print(f"Sparse stage: {sparse_ms:.3f} ms/text")
+
+    if args.out_bands:
+        bands.save(args.out_bands, {"holdout": report["holdout"]})
+        print(f"Wrote bands to: {args.out_bands}")
+    if args.out_report:
+        out = Path(args.out_report)
+        out.parent.mkdir(parents=True, exist_ok=True)
+        out.write_text(json.dumps(report, indent=2, ensure_ascii=False), encoding="utf-8")
+        print(f"Wrote report to: {out}")
+
+
+if __name__ == "__main__":
+    main()
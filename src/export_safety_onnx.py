@@ -0,0 +1,258 @@
+# src/export_safety_onnx.py
+from __future__ import annotations
+
+import argparse
+import json
+from pathlib import Path
+import resource
+import time
+from typing import Any, Dict, List
+
+import joblib
+import numpy as np
+
+from src.safety_embed import SafetyEmbedScorer
+from src.safety_onnx import (
+    OUTPUT_NAMES,
+    PARITY_MAX_FLIP_RATE,
+    PARITY_MAX_P95_DRIFT,
+    OnnxEmbedder,
+    file_sha1,
+    find_onnx_export,
+    onnx_paths,
+    record_parity,
+)
+
+ROOT = Path(__file__).resolve().parents[1]
+DATA = ROOT / "data"
+
+
+def _build_graph(st: Any, coef: np.ndarray, intercept: float, normalize: bool) -> Any:
+    import torch
+
+    class ScorerGraph(torch.nn.Module):
+        """Transformer -> masked mean pooling -> (L2 norm) -> logreg sigmoid."""
+
+        def __init__(self) -> None:
+            super().__init__()
+            self.transformer = st[0].auto_model
+            self.register_buffer("coef", torch.tensor(coef, dtype=torch.float32))
+            self.register_buffer("intercept", torch.tensor(float(intercept), dtype=torch.float32))
+
+        def forward(self, input_ids, attention_mask, token_type_ids):  # type: ignore[no-untyped-def]
+            hidden = self.transformer(
+                input_ids=input_ids, attention_mask=attention_mask, token_type_ids=token_type_ids
+            ).last_hidden_state
+            mask = attention_mask.unsqueeze(-1).to(hidden.dtype)
+            emb = (hidden * mask).sum(dim=1) / mask.sum(dim=1).clamp(min=1e-9)
+            if normalize:
+                emb = torch.nn.functional.normalize(emb, p=2.0, dim=1)
+            return emb, torch.sigmoid(emb @ self.coef + self.intercept)
+
+    return ScorerGraph().eval()
+
+
+def export(model_path: Path, opset: int = 17, quantize: bool = True, keep_fp32: bool = False) -> Dict[str, Path]:
+    import torch
+    from sentence_transformers import SentenceTransformer
+
+    artifact = joblib.load(model_path)
+    st = SentenceTransformer(artifact["sentence_transformer"], device="cpu")
+    pooling = st[1]
+    if not getattr(pooling, "pooling_mode_mean_tokens", False):
+        raise ValueError(f"Only mean-pooled sentence transformers can be exported (got {type(pooling).__name__})")
+    # encode(normalize_embeddings=...) and a Normalize module both end in an L2 norm
+    normalize = bool(artifact.get("normalize_embeddings", True)) or any(
+        type(m).__name__ == "Normalize" for m in st
+    )
+    clf = artifact["logreg"]
+    if list(clf.classes_) != [0, 1]:
+        raise ValueError(f"Expected a binary logreg with classes [0, 1], got {list(clf.classes_)}")
+
+    paths = onnx_paths(model_path, suffix=".int8" if quantize else ".fp32")
+    fp32_path = paths["onnx"].with_name(paths["onnx"].stem + ".tmp-fp32.onnx") if quantize else paths["onnx"]
+    graph = _build_graph(st, clf.coef_[0].astype(np.float32), float(clf.intercept_[0]), normalize)
+    tok = st.tokenizer
+    sample = tok(["hello there", "a slightly longer sample sentence"], padding=True, return_tensors="pt")
+    if "token_type_ids" not in sample:
+        sample["token_type_ids"] = torch.zeros_like(sample["input_ids"])
+    axes = {0: "batch", 1: "seq"}
+    with torch.no_grad():
+        torch.onnx.export(
+            graph,
+            (sample["input_ids"], sample["attention_mask"], sample["token_type_ids"]),
+            str(fp32_path),
+            input_names=["input_ids", "attention_mask", "token_type_ids"],
+            output_names=OUTPUT_NAMES,
+            dynamic_axes={
+                "input_ids": axes,
+                "attention_mask": axes,
+                "token_type_ids": axes,
+                "embedding": {0: "batch"},
+                "p_move": {0: "batch"},
+            },
+            opset_version=opset,
+            do_constant_folding=True,
+        )
+    if quantize:
+        from onnxruntime.quantization import QuantType, quantize_dynamic
+
+        quantize_dynamic(str(fp32_path), str(paths["onnx"]), weight_type=QuantType.QInt8, per_channel=True)
+        if not keep_fp32:
+            fp32_path.unlink()
+
+    tok.backend_tokenizer.save(str(paths["tokenizer"]))
+    meta = {
+        "source_artifact": str(model_path),
+        "source_sha1": file_sha1(model_path),
+        "sentence_transformer": artifact["sentence_transformer"],
+        "normalize": normalize,
+        "quantized": quantize,
+        "opset": opset,
+        "dim": int(clf.coef_.shape[1]),
+        "max_seq_length": int(st.max_seq_length),
+        "pad_token": tok.pad_token,
+        "pad_token_id": int(tok.pad_token_id),
+    }
+    paths["meta"].write_text(json.dumps(meta, indent=2), encoding="utf-8")
+    return paths
+
+
+def _rss_mb() -> float:
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.0
+
+
+def _timings(scorer: SafetyEmbedScorer, texts: List[str], single: int = 200) -> Dict[str, float]:
+    t0 = time.perf_counter()
+    scorer.predict_proba_many(texts)
+    batch_s = time.perf_counter() - t0
+    lat = []
+    for text in texts[:single]:
+        t0 = time.perf_counter()
+        scorer.predict_proba_move(text)
+        lat.append((time.perf_counter() - t0) * 1000.0)
+    return {
+        "batch_ms_per_text": 1000.0 * batch_s / max(1, len(texts)),
+        "single_p50_ms": float(np.percentile(lat, 50)) if lat else 0.0,
+        "single_p95_ms": float(np.percentile(lat, 95)) if lat else 0.0,
+    }
+
+
+def parity_report(model_path: Path, in_path: Path, thresholds: List[float], text_key: str = "user_text") -> Dict[str, Any]:
+    """p_move drift and label flips of the ONNX scorer versus the torch scorer on `in_path`."""
+    rows = [json.loads(line) for line in in_path.read_text(encoding="utf-8").splitlines() if line.strip()]
+    texts = [str(r.get(text_key, "")).strip() for r in rows]
+    paths = find_onnx_export(model_path)
+    if paths is None:
+        raise FileNotFoundError(f"No up-to-date ONNX export for {model_path}")
+
+    # ONNX first: ru_maxrss only grows, so the torch number includes both
+    rss0 = _rss_mb()
+    onnx = SafetyEmbedScorer(str(model_path), cache_size=0, backend="onnx")
+    rss_onnx = _rss_mb()
+    p_onnx = onnx.predict_proba_many(texts)
+    p_graph = OnnxEmbedder(paths).predict_proba(texts)
+    t_onnx = _timings(onnx, texts)
+    torch_scorer = SafetyEmbedScorer(str(model_path), cache_size=0, backend="torch")
+    rss_torch = _rss_mb()
+    p_torch = torch_scorer.predict_proba_many(texts)
+    t_torch = _timings(torch_scorer, texts)
+
+    drift = np.abs(p_onnx - p_torch)
+    flips = {}
+    for thr in thresholds:
+        changed = np.flatnonzero((p_onnx >= thr) != (p_torch >= thr))
+        flips[f"{thr:g}"] = {
+            "n": int(changed.size),
+            "examples": [
+                {
+                    "sample_id": rows[i].get("sample_id"),
+                    "text": texts[i],
+                    "p_torch": float(p_torch[i]),
+                    "p_onnx": float(p_onnx[i]),
+                }
+                for i in changed[:20]
+            ],
+        }
+    return {
+        "model_path": str(model_path),
+        "onnx_path": str(paths["onnx"]),
+        "in_path": str(in_path),
+        "n": len(texts),
+        "drift": {
+            "mean_abs": float(drift.mean()) if drift.size else 0.0,
+            "p95_abs": float(np.percentile(drift, 95)) if drift.size else 0.0,
+            "max_abs": float(drift.max()) if drift.size else 0.0,
+            "graph_head_max_abs": float(np.abs(p_graph - p_onnx).max()) if drift.size else 0.0,
+        },
+        "label_flips": flips,
+        "latency": {"torch": t_torch, "onnx": t_onnx},
+        "speedup_batch": t_torch["batch_ms_per_text"] / max(t_onnx["batch_ms_per_text"], 1e-9),
+        "speedup_single_p50": t_torch["single_p50_ms"] / max(t_onnx["single_p50_ms"], 1e-9),
+        "footprint": {
+            "onnx_file_mb": paths["onnx"].stat().st_size / 1e6,
+            "rss_after_onnx_load_mb": rss_onnx - rss0,
+            "rss_after_torch_load_mb": rss_torch - rss_onnx,
+        },
+    }
+
+
+def print_parity(report: Dict[str, Any]) -> None:
+    d, lat = report["drift"], report["latency"]
+    print(f"n={report['n']}  p_move drift: mean={d['mean_abs']:.5f} p95={d['p95_abs']:.5f} max={d['max_abs']:.5f}")
+    for thr, f in report["label_flips"].items():
+        print(f"- label flips @ {thr}: {f['n']}")
+    for name in ("torch", "onnx"):
+        t = lat[name]
+        print(
+            f"- {name:<5} batch={t['batch_ms_per_text']:.2f} ms/text single p50={t['single_p50_ms']:.2f} "
+            f"p95={t['single_p95_ms']:.2f} ms"
+        )
+    fp = report["footprint"]
+    print(
+        f"Speedup: batch x{report['speedup_batch']:.1f}, single x{report['speedup_single_p50']:.1f}; "
+        f"onnx file {fp['onnx_file_mb']:.1f} MB, RSS +{fp['rss_after_onnx_load_mb']:.0f} MB (onnx) "
+        f"vs +{fp['rss_after_torch_load_mb']:.0f} MB (torch)"
+    )
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description="Export the safety embedder + logreg head as one (int8) ONNX graph.")
+    ap.add_argument("--safety_model", default="models/safe_violation_clf_embed.joblib")
+    ap.add_argument("--opset", type=int, default=17)
+    ap.add_argument("--no_quantize", action="store_true", help="Keep fp32 weights (written as <stem>.fp32.onnx)")
+    ap.add_argument("--keep_fp32", action="store_true", help="Also keep the intermediate fp32 graph")
+    ap.add_argument("--skip_export", action="store_true", help="Only run the parity report on an existing export")
+    ap.add_argument("--in_path", default=str(DATA / "labels_safe_move_synth_validation.jsonl"))
+    ap.add_argument("--thresholds", default="0.35,0.45", help="Comma-separated thresholds for label flips")
+    ap.add_argument("--out_path", default=str(DATA / "results" / "safety_onnx_parity.json"), help="'' = no report")
+    args = ap.parse_args()
+
+    model_path = Path(args.safety_model)
+    if not args.skip_export:
+        t0 = time.perf_counter()
+        paths = export(model_path, opset=args.opset, quantize=not args.no_quantize, keep_fp32=args.keep_fp32)
+        print(f"[EXPORT] {paths['onnx']} ({paths['onnx'].stat().st_size / 1e6:.1f} MB) in {time.perf_counter() - t0:.1f}s")
+        if args.no_quantize:
+            print("[EXPORT] fp32 export is not picked up by the scorer; it is for comparison only")
+            return
+    if not args.out_path:
+        return
+
+    thresholds = [float(t) for t in args.thresholds.split(",") if t.strip()]
+    report = parity_report(model_path, Path(args.in_path), thresholds)
+    print_parity(report)
+    parity = record_parity(find_onnx_export(model_path), report)
+    verdict = "passed" if parity["passed"] else "FAILED"
+    print(
+        f"Parity {verdict} (p95 drift <= {PARITY_MAX_P95_DRIFT}, flips <= {PARITY_MAX_FLIP_RATE:.0%}); "
+        f"--safety_backend auto {'uses' if parity['passed'] else 'skips'} this export"
+    )
+    out = Path(args.out_path)
+    out.parent.mkdir(parents=True, exist_ok=True)
+    out.write_text(json.dumps(report, indent=2, ensure_ascii=False), encoding="utf-8")
+    print(f"Wrote {out}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,137 @@
+# src/intent_heads.py
+from __future__ import annotations
+
+import argparse
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Sequence, Tuple, Union
+
+import joblib
+import numpy as np
+
+from src.text_features import extract_features
+
+ROOT = Path(__file__).resolve().parents[1]
+DEFAULT_HEADS = ROOT / "models" / "intent_heads.joblib"
+INTENT_HEADS = ("flirt", "intimacy", "erotic", "slowdown", "consent", "location_request")
+PHASE_SCORERS = ("regex", "heads")
+INTENT_THRESHOLD = 0.5  # heads are fit with balanced class weights
+
+# Synth categories that imply a head even when none of its keywords fire; with
+# the keyword detectors themselves these are the weak labels the heads learn.
+CATEGORY_HEADS: Dict[str, Tuple[str, ...]] = {
+    "mild_flirt": ("flirt",),
+    "flirty_ambiguous": ("flirt",),
+    "romantic_safe": ("intimacy",),
+    "ack_backoff": ("slowdown",),
+    "awk_ack": ("slowdown",),
+    "repair_shift": ("slowdown",),
+    "privacy_invasive": ("location_request",),
+    "pushy_escalation": ("location_request",),
+}
+
+
+def regex_labels(texts: Sequence[str]) -> np.ndarray:
+    """(n, len(INTENT_HEADS)) bool: which keyword family fires on each text (each head has a same-named family)."""
+    out = np.zeros((len(texts), len(INTENT_HEADS)), dtype=bool)
+    for i, text in enumerate(texts):
+        f = extract_features(text, INTENT_HEADS)
+        out[i] = [f.any(h) for h in INTENT_HEADS]
+    return out
+
+
+def weak_labels(texts: Sequence[str], categories: Sequence[Optional[str]]) -> np.ndarray:
+    """Keyword hits OR'ed with the CATEGORY_HEADS prior of each text's synth category."""
+    y = regex_labels(texts)
+    for i, cat in enumerate(categories):
+        for head in CATEGORY_HEADS.get(cat or "", ()):
+            y[i, INTENT_HEADS.index(head)] = True
+    return y
+
+
+class IntentHeads:
+    """
+    Linear heads over the safety gate's sentence embedding, stacked into one
+    (d, H) matrix so a turn costs one matrix multiply. Only heads with enough
+    weak-label positives are trained; the rest stay on their keyword detectors.
+    """
+
+    def __init__(self, heads: Sequence[str], W: np.ndarray, b: np.ndarray, meta: Optional[Dict[str, Any]] = None):
+        self.heads = list(heads)
+        self.W = np.asarray(W, dtype=np.float32)
+        self.b = np.asarray(b, dtype=np.float32)
+        self.meta: Dict[str, Any] = dict(meta or {})
+        self._warned = False
+
+    @classmethod
+    def load(cls, path: Union[str, Path]) -> "IntentHeads":
+        art = joblib.load(path)
+        return cls(art["heads"], art["W"], art["b"], {k: v for k, v in art.items() if k not in ("heads", "W", "b")})
+
+    def save(self, path: Union[str, Path]) -> None:
+        out = Path(path)
+        out.parent.mkdir(parents=True, exist_ok=True)
+        joblib.dump({**self.meta, "heads": self.heads, "W": self.W, "b": self.b}, out)
+
+    def proba_many(self, X: np.ndarray) -> np.ndarray:
+        """(n, H) probabilities for (n, d) embeddings."""
+        z = np.asarray(X, dtype=np.float32) @ self.W + self.b
+        return 1.0 / (1.0 + np.exp(-z))
+
+    def predict(self, embedding: Optional[np.ndarray]) -> Optional[Dict[str, float]]:
+        """Head -> probability for one embedding; None without one or for another embedder's size."""
+        if embedding is None or not self.heads:
+            return None
+        if embedding.shape[-1] != self.W.shape[0]:
+            if not self._warned:
+                self._warned = True
+                print(f"[WARN] intent heads expect {self.W.shape[0]}-d embeddings, got {embedding.shape[-1]}; using regex")
+            return None
+        p = self.proba_many(embedding[None, :])[0]
+        return {h: float(pi) for h, pi in zip(self.heads, p.tolist())}
+
+
+def fit_heads(
+    X: np.ndarray,
+    Y: np.ndarray,
+    min_positives: int = 5,
+    C: float = 1.0,
+    seed: int = 42,
+    meta: Optional[Dict[str, Any]] = None,
+) -> IntentHeads:
+    """One balanced logistic regression per INTENT_HEADS column of Y with at least `min_positives` of each class."""
+    from sklearn.linear_model import LogisticRegression
+
+    heads: List[str] = []
+    W: List[np.ndarray] = []
+    b: List[float] = []
+    for k, head in enumerate(INTENT_HEADS):
+        n_pos = int(Y[:, k].sum())
+        if min(n_pos, len(Y) - n_pos) < min_positives:
+            continue
+        clf = LogisticRegression(C=C, class_weight="balanced", max_iter=2000, random_state=seed)
+        clf.fit(X, Y[:, k].astype(np.int32))
+        heads.append(head)
+        W.append(clf.coef_[0])
+        b.append(float(clf.intercept_[0]))
+    d = X.shape[1] if X.ndim == 2 else 0
+    W_arr = np.stack(W, axis=1) if W else np.zeros((d, 0), dtype=np.float32)
+    return IntentHeads(heads, W_arr, np.asarray(b, dtype=np.float32), meta)
+
+
+def add_intent_heads_args(ap: argparse.ArgumentParser) -> None:
+    """The phase scorer flags shared by the chatbot, the server and the replay bench."""
+    ap.add_argument(
+        "--phase_scorer",
+        default="regex",
+        choices=list(PHASE_SCORERS),
+        help="heads = linear intent heads on the safety embedding (flirt/intimacy/erotic/slowdown/location)",
+    )
+    ap.add_argument("--intent_heads", default=str(DEFAULT_HEADS), help="Heads from python -m src.train_intent_heads")
+
+
+def load_intent_heads(args: argparse.Namespace) -> Optional[IntentHeads]:
+    if args.phase_scorer != "heads":
+        return None
+    heads = IntentHeads.load(args.intent_heads)
+    print(f"[BOOT] intent heads: {', '.join(heads.heads) or 'none'} ({heads.meta.get('sentence_transformer', '?')})")
+    return heads
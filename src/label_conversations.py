@@ -0,0 +1,312 @@
+# src/label_conversations.py
+from __future__ import annotations
+
+import argparse
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+import json
+from pathlib import Path
+import time
+from typing import Any, Callable, Dict, FrozenSet, List, Sequence, Set, Tuple
+
+import numpy as np
+
+from src.chat_session import is_bio_intent, is_low_engagement, is_name_intent, is_pics_intent
+from src.conversation_phase import (
+    SIGNAL_FAMILIES,
+    SIGNAL_HIT_CAP,
+    ConversationPhase,
+    phase_step,
+    roll_window_code,
+    window_means,
+)
+from src.memory import extract_preferences
+from src.safety_rules import obvious_escalation
+from src.text_features import PHASE_FAMILIES, REGISTRY, extract_features
+from src.trust import classify_erotic_intent, detect_boundary_ack, detect_consent
+
+ROOT = Path(__file__).resolve().parents[1]
+RESULTS_DIR = ROOT / "data" / "results"
+
+LEVELS = ("none", "suggestive", "explicit")  # erotic level and consent state codes
+TRUST_REASONS = ("baseline", "safe_turn", "repair", "rule_hit", "deflect", "boundary_ack", "low_engagement")
+_PHASE_VALUES = np.array([p.value for p in ConversationPhase], dtype=object)
+_WINDOW = 8  # ConversationPhaseTracker() default
+PHASE_IDS = frozenset(i for f in PHASE_FAMILIES for i in REGISTRY.family_index[f])
+
+
+def _user_row(text: str) -> Tuple[Any, ...]:
+    f = extract_features(text)
+    level = classify_erotic_intent(text, f)
+    return (
+        text.startswith("/") or is_name_intent(text, f) or is_pics_intent(text, f) or is_bio_intent(text, f),
+        is_low_engagement(text),
+        detect_boundary_ack(text, f),
+        obvious_escalation(text, f)[0],
+        LEVELS.index(level),
+        LEVELS.index(detect_consent(text, level, f)),
+        f.hit_ids,
+    )
+
+
+def _bot_row(text: str) -> FrozenSet[int]:
+    return extract_features(text, PHASE_FAMILIES).hit_ids
+
+
+def _distinct(texts: Sequence[str]) -> Tuple[List[str], np.ndarray]:
+    index: Dict[str, int] = {}
+    codes = np.fromiter((index.setdefault(t, len(index)) for t in texts), dtype=np.int64, count=len(texts))
+    return list(index), codes
+
+
+def _map_rows(fn: Callable[[str], Any], texts: List[str], workers: int) -> List[Any]:
+    if workers <= 1 or len(texts) < 10000:
+        return [fn(t) for t in texts]
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        return list(pool.map(fn, texts, chunksize=2048))
+
+
+def _text_columns(
+    user_text: Sequence[str], bot_text: Sequence[str], workers: int = 1
+) -> Dict[str, np.ndarray]:
+    """
+    Detector columns for a turn table. Every distinct text is scanned once
+    (across `workers` processes for large tables) and the results are
+    broadcast back to the rows.
+    """
+    users, user_codes = _distinct(user_text)
+    bots, bot_codes = _distinct(bot_text)
+    user_rows = _map_rows(_user_row, users, workers)
+    bot_ids = _map_rows(_bot_row, bots, workers)
+
+    cols: Dict[str, np.ndarray] = {}
+    for k, (name, dtype) in enumerate(
+        [("command", bool), ("low_engagement", bool), ("boundary_ack", bool), ("rule_hit", bool), ("erotic", np.int8), ("consent", np.int8)]
+    ):
+        per_text = np.fromiter((row[k] for row in user_rows), dtype=dtype, count=len(user_rows))
+        cols[name] = per_text[user_codes]
+
+    # the tracker scores a turn on user + bot text: capped per-family hits over the union of both
+    family_ids = [frozenset(REGISTRY.family_index[f]) for f in SIGNAL_FAMILIES + ("slowdown",)]
+    user_phase = [row[6] & PHASE_IDS for row in user_rows]
+    pairs: Dict[Tuple[int, int], int] = {}
+    pair_codes = np.fromiter(
+        (pairs.setdefault((u, b), len(pairs)) for u, b in zip(user_codes.tolist(), bot_codes.tolist())),
+        dtype=np.int64,
+        count=len(user_codes),
+    )
+    counts = np.zeros((len(pairs), 4), dtype=np.int8)
+    for (u, b), p in pairs.items():
+        ids = user_phase[u] | bot_ids[b]
+        if ids:
+            counts[p] = [len(ids & fam) for fam in family_ids]
+    counts = counts[pair_codes]
+    cols["hits"] = np.minimum(counts[:, :3], SIGNAL_HIT_CAP)
+    cols["slowdown"] = counts[:, 3] > 0
+    return cols
+
+
+def _conversation_codes(conversation_id: Sequence[Any]) -> np.ndarray:
+    index: Dict[Any, int] = {}
+    return np.fromiter((index.setdefault(c, len(index)) for c in conversation_id), dtype=np.int64, count=len(conversation_id))
+
+
+def label_turns(
+    table: Dict[str, Sequence[Any]], initial_trust: float = 0.1, workers: int = 1
+) -> Dict[str, np.ndarray]:
+    """
+    Phase, erotic level, consent and trust for every logged turn, the same
+    values the online TurnEngine reaches on a fresh session.
+
+    `table` is columnar: conversation_id, user_text, bot_text and safety_label
+    (SAFE/MOVE), plus optional mode (the turn's TurnEngine mode; NORMAL when
+    absent) and memory_added (else derived from the preference patterns on a
+    fresh memory). Conversations may interleave; rows of one conversation must
+    be in turn order. Command/intent turns and turns after a BLOCK keep the
+    previous state and have labelled=False.
+
+    Text detectors run once per distinct text (in `workers` processes); the
+    state machines then run as one NumPy step per turn index across all
+    conversations.
+    """
+    n = len(table["user_text"])
+    user_text = [str(t or "") for t in table["user_text"]]
+    bot_text = [str(t or "") for t in table["bot_text"]]
+    label = np.asarray([str(s or "") for s in table["safety_label"]], dtype=object)
+    modes = table.get("mode")
+    mode = np.asarray([str(m or "NORMAL") for m in (modes if modes is not None else [None] * n)], dtype=object)
+    codes = _conversation_codes(table["conversation_id"])
+    n_conv = int(codes.max()) + 1 if n else 0
+
+    user = _text_columns(user_text, bot_text, workers)
+    hits, slowdown = user["hits"], user["slowdown"]
+    rule_hit = user["rule_hit"]
+    is_block = mode == "BLOCK"
+    safe = (label == "SAFE") & ~rule_hit
+    boundary = (label == "MOVE") | rule_hit
+
+    # turn position within each conversation, activity (nothing after BLOCK) and memory additions
+    pos = np.zeros(n, dtype=np.int64)
+    active = np.zeros(n, dtype=bool)
+    memory_added = np.zeros(n, dtype=bool)
+    given_added = table.get("memory_added")
+    next_pos = np.zeros(n_conv, dtype=np.int64)
+    closed: Set[int] = set()
+    seen: Dict[int, Set[Tuple[str, str]]] = {}
+    for i in range(n):
+        c = int(codes[i])
+        pos[i] = next_pos[c]
+        next_pos[c] += 1
+        if c in closed:
+            continue
+        active[i] = True
+        if user["command"][i]:
+            continue
+        if is_block[i]:
+            closed.add(c)
+        elif given_added is not None:
+            memory_added[i] = bool(given_added[i])
+        elif safe[i]:
+            known = seen.setdefault(c, set())
+            for key, value in extract_preferences(user_text[i]):
+                pair = (key, value.lower())
+                if pair not in known:
+                    known.add(pair)
+                    memory_added[i] = True
+    live_rows = active & ~user["command"]
+
+    # per-conversation state
+    window_code = np.zeros((n_conv, 3), dtype=np.int64)  # ConversationPhaseTracker window codes
+    scores = np.zeros((n_conv, 3), dtype=np.float64)
+    phase = np.zeros(n_conv, dtype=np.int64)
+    prev_safe = np.zeros(n_conv, dtype=np.int64)
+    cooldown = np.zeros(n_conv, dtype=np.int64)
+    low_count = np.zeros(n_conv, dtype=np.int64)
+    consent = np.zeros(n_conv, dtype=np.int8)
+    trust = np.full(n_conv, float(initial_trust), dtype=np.float64)
+    reason = np.zeros(n_conv, dtype=np.int8)
+    last_repair = np.zeros(n_conv, dtype=bool)
+
+    out_phase = np.zeros(n, dtype=np.int64)
+    out_scores = np.zeros((n, 3), dtype=np.float64)
+    out_consent = np.zeros(n, dtype=np.int8)
+    out_trust = np.zeros(n, dtype=np.float64)
+    out_reason = np.zeros(n, dtype=np.int8)
+
+    by_pos = np.argsort(pos, kind="stable")
+    bounds = np.searchsorted(pos[by_pos], np.arange(int(pos.max()) + 2 if n else 1))
+    for t in range(len(bounds) - 1):
+        rows = by_pos[bounds[t] : bounds[t + 1]]
+        live = rows[live_rows[rows]]
+        c = codes[live]
+
+        # phase tracker (not updated on BLOCK turns)
+        upd = live[~is_block[live]]
+        cu = codes[upd]
+        window_code[cu] = roll_window_code(window_code[cu], hits[upd].astype(np.int64), _WINDOW)
+        scores[cu] = window_means(window_code[cu])
+        phase[cu], prev_safe[cu], cooldown[cu] = phase_step(
+            phase[cu], prev_safe[cu], cooldown[cu], scores[cu], slowdown[upd], boundary[upd]
+        )
+
+        # consent and engagement
+        consent[c] = np.where(user["consent"][live] > 0, user["consent"][live], consent[c])
+        low_count[c] = np.where(user["low_engagement"][live], low_count[c] + 1, np.maximum(low_count[c] - 1, 0))
+
+        # trust: same deltas, in the same order, as TurnEngine._trust
+        m = mode[live]
+        repair = m == "SAFETY_REPAIR"
+        conds = [
+            (safe[live], 0.01),
+            (scores[c, 1] >= 0.3, 0.01),
+            (scores[c, 0] >= 0.3, 0.01),
+            (memory_added[live], 0.01),
+            (repair, -0.05),
+            (rule_hit[live], -0.08),
+            ((m == "SOFT_DEFLECT") & (user["erotic"][live] > 0), -0.02),
+            (user["boundary_ack"][live] & last_repair[c], 0.02),
+            (low_count[c] >= 2, -0.01),
+        ]
+        delta = np.zeros(len(live), dtype=np.float64)
+        for cond, step in conds:
+            delta = delta + np.where(cond, step, 0.0)
+        trust[c] = np.clip(trust[c] + delta, 0.0, 1.0)
+        reason[c] = np.select(
+            [conds[8][0], conds[7][0], conds[6][0], conds[5][0], conds[4][0], conds[0][0]],
+            [6, 5, 4, 3, 2, 1],
+            default=0,
+        )
+        last_repair[c] = repair
+
+        cr = codes[rows]
+        out_phase[rows] = phase[cr]
+        out_scores[rows] = scores[cr]
+        out_consent[rows] = consent[cr]
+        out_trust[rows] = trust[cr]
+        out_reason[rows] = reason[cr]
+
+    levels = np.array(LEVELS, dtype=object)
+    return {
+        "labelled": live_rows,
+        "phase": _PHASE_VALUES[out_phase],
+        "flirt_score": out_scores[:, 0],
+        "intimacy_score": out_scores[:, 1],
+        "erotic_score": out_scores[:, 2],
+        "erotic_level": np.where(live_rows, levels[user["erotic"]], "none").astype(object),
+        "consent_state": levels[out_consent],
+        "trust_level": out_trust,
+        "trust_reason": np.array(TRUST_REASONS, dtype=object)[out_reason],
+        "rule_hit": rule_hit & live_rows,
+        "memory_added": memory_added,
+    }
+
+
+def read_columns(path: Path, columns: Sequence[str]) -> Dict[str, List[Any]]:
+    table: Dict[str, List[Any]] = {name: [] for name in columns}
+    with path.open("r", encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            row = json.loads(line)
+            for name in columns:
+                table[name].append(row.get(name))
+    return table
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description="Label logged conversations with phase / erotic level / consent / trust per turn.")
+    ap.add_argument("--in_path", required=True, help="JSONL turns: conversation_id, user_text, bot_text, safety_label[, mode]")
+    ap.add_argument("--out_path", default=str(RESULTS_DIR / "labelled_turns.jsonl"))
+    ap.add_argument("--initial_trust", type=float, default=0.1)
+    ap.add_argument("--workers", type=int, default=1, help="Processes for the text detectors")
+    args = ap.parse_args()
+
+    t0 = time.perf_counter()
+    table = read_columns(Path(args.in_path), ["conversation_id", "user_text", "bot_text", "safety_label", "mode"])
+    if all(m is None for m in table["mode"]):
+        table["mode"] = None
+        print("[WARN] no mode column; every turn is taken as NORMAL, so repair/deflect trust deltas are missing.")
+    t1 = time.perf_counter()
+    labels = label_turns(table, initial_trust=args.initial_trust, workers=args.workers)
+    t2 = time.perf_counter()
+
+    n = len(table["user_text"])
+    out = Path(args.out_path)
+    out.parent.mkdir(parents=True, exist_ok=True)
+    with out.open("w", encoding="utf-8") as f:
+        for i in range(n):
+            row = {"conversation_id": table["conversation_id"][i]}
+            for name, col in labels.items():
+                value = col[i]
+                row[name] = value.item() if isinstance(value, np.generic) else value
+            f.write(json.dumps(row, ensure_ascii=False) + "\n")
+
+    print(f"Turns: {n}  labelled: {int(labels['labelled'].sum())}  conversations: {len(set(table['conversation_id']))}")
+    print(f"Read {t1 - t0:.1f}s  label {t2 - t1:.1f}s ({n / max(t2 - t1, 1e-9):.0f} turns/s)")
+    print("Phases:", dict(Counter(labels["phase"][labels["labelled"]]).most_common()))
+    print(f"Wrote {out}")
+
+
+if __name__ == "__main__":
+    main()
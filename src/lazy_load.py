@@ -0,0 +1,79 @@
+# src/lazy_load.py
+from __future__ import annotations
+
+import threading
+import time
+from typing import Any, Callable, Dict, Generic, List, Optional, TypeVar
+
+T = TypeVar("T")
+
+
+class BackgroundLoad(Generic[T]):
+    """
+    Runs `factory()` on a daemon thread as soon as it is constructed.
+
+    `get()` blocks until the object is ready (re-raising any load error);
+    attribute access is forwarded to the loaded object, so a BackgroundLoad can
+    stand in for the model it wraps.
+    """
+
+    def __init__(self, label: str, factory: Callable[[], T]):
+        self._label = label
+        self._factory = factory
+        self._value: Optional[T] = None
+        self._error: Optional[BaseException] = None
+        self._done = threading.Event()
+        self._started = time.perf_counter()
+        self._load_s: Optional[float] = None
+        self._wait_s = 0.0
+        self._thread = threading.Thread(target=self._run, name=f"load-{label}", daemon=True)
+        self._thread.start()
+
+    def _run(self) -> None:
+        try:
+            self._value = self._factory()
+        except BaseException as exc:  # surfaced to the caller in get()
+            self._error = exc
+        finally:
+            self._load_s = time.perf_counter() - self._started
+            self._done.set()
+
+    def is_ready(self) -> bool:
+        return self._done.is_set()
+
+    def get(self) -> T:
+        if not self._done.is_set():
+            t0 = time.perf_counter()
+            self._done.wait()
+            self._wait_s += time.perf_counter() - t0
+        if self._error is not None:
+            raise self._error
+        return self._value
+
+    def timing(self) -> Dict[str, Any]:
+        return {
+            "component": self._label,
+            "ready": self.is_ready(),
+            "load_s": self._load_s,
+            "blocked_s": self._wait_s,
+            "error": repr(self._error) if self._error else None,
+        }
+
+    def __getattr__(self, name: str) -> Any:
+        # only reached for names not set in __init__
+        return getattr(self.get(), name)
+
+
+def format_startup_profile(loads: List[BackgroundLoad], boot_s: float) -> str:
+    lines = [f"[STARTUP] boot (args, profile, memory, banner)={boot_s:.3f}s"]
+    done: List[float] = []
+    for load in loads:
+        t = load.timing()
+        status = f"load={t['load_s']:.3f}s" if t["load_s"] is not None else "load=pending"
+        err = f" error={t['error']}" if t["error"] else ""
+        lines.append(f"[STARTUP] {t['component']}: {status} blocked={t['blocked_s']:.3f}s{err}")
+        if t["load_s"] is not None:
+            done.append(t["load_s"])
+    if done and len(done) == len(loads):
+        lines.append(f"[STARTUP] models: wall={max(done):.3f}s (sum of loads={sum(done):.3f}s)")
+    return "\n".join(lines)
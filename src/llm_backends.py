@@ -0,0 +1,188 @@
+# src/llm_backends.py
+from __future__ import annotations
+
+import argparse
+from dataclasses import dataclass
+import hashlib
+import time
+from typing import Any, Dict, Iterator, List, Optional, Protocol
+
+BACKENDS = ("llamacpp", "transformers", "stub")
+
+
+class ChatBackend(Protocol):
+    """What the turn pipeline needs from an LLM client."""
+
+    def count_tokens(self, text: str) -> int: ...
+
+    def chat(self, messages: List[Dict[str, str]]) -> str: ...
+
+    def chat_stream(self, messages: List[Dict[str, str]]) -> Iterator[str]: ...
+
+
+STUB_REPLIES = [
+    "Ha, that's a fun one. I spent the weekend on a long walk by the river.",
+    "Love that. I'm more of a slow-mornings-and-good-coffee person.",
+    "Oh nice, I've been meaning to try that. What got you into it?",
+    "Honestly same. Work was a lot this week, so I'm saving energy for the weekend.",
+    "That sounds great. I'd rather keep it chill for now, but tell me more.",
+    "Okay, that made me smile. What's the best thing that happened to you this week?",
+    "I'm a sucker for a good bookstore. Any recommendations lately?",
+    "Fair. I tend to open up slowly, but I'm enjoying this so far.",
+]
+
+
+@dataclass
+class StubClientConfig:
+    seed: int = 7
+    latency_ms: float = 0.0  # simulated time to first token
+    tokens_per_s: float = 0.0  # simulated decode rate; 0 = instant
+    max_tokens: int = 140
+
+
+class StubChatClient:
+    """
+    Model-free chat client for benchmarks and tests. The reply is a canned line
+    chosen from the seed and the last user message, so the same conversation
+    always gets the same replies; latency and decode rate are simulated with
+    sleeps (~4 chars per token).
+    """
+
+    def __init__(self, cfg: Optional[StubClientConfig] = None):
+        self.cfg = cfg or StubClientConfig()
+        self.last_usage: Dict[str, Any] = {}
+
+    def count_tokens(self, text: str) -> int:
+        return max(1, len(text or "") // 4)
+
+    def _reply(self, messages: List[Dict[str, str]]) -> str:
+        last_user = next((m.get("content") or "" for m in reversed(messages) if m.get("role") == "user"), "")
+        digest = hashlib.sha1(f"{self.cfg.seed}:{last_user}".encode("utf-8")).digest()
+        return STUB_REPLIES[int.from_bytes(digest[:8], "big") % len(STUB_REPLIES)]
+
+    def _pieces(self, reply: str) -> List[str]:
+        words = reply.split(" ")
+        pieces, budget = [], self.cfg.max_tokens
+        for word in words:
+            n = self.count_tokens(word + " ")
+            if n > budget:
+                break
+            budget -= n
+            pieces.append(word + " ")
+        return pieces
+
+    def _record(self, messages: List[Dict[str, str]], pieces: List[str]) -> None:
+        self.last_usage = {
+            "prompt_tokens": sum(self.count_tokens(m.get("content") or "") for m in messages),
+            "completion_tokens": sum(self.count_tokens(p) for p in pieces),
+        }
+
+    def chat(self, messages: List[Dict[str, str]]) -> str:
+        pieces = self._pieces(self._reply(messages))
+        delay = self.cfg.latency_ms / 1000.0
+        if self.cfg.tokens_per_s > 0:
+            delay += sum(self.count_tokens(p) for p in pieces) / self.cfg.tokens_per_s
+        if delay > 0:
+            time.sleep(delay)
+        self._record(messages, pieces)
+        return "".join(pieces).strip()
+
+    def chat_stream(self, messages: List[Dict[str, str]]) -> Iterator[str]:
+        pieces = self._pieces(self._reply(messages))
+        if self.cfg.latency_ms > 0:
+            time.sleep(self.cfg.latency_ms / 1000.0)
+        for piece in pieces:
+            if self.cfg.tokens_per_s > 0:
+                time.sleep(self.count_tokens(piece) / self.cfg.tokens_per_s)
+            yield piece
+        self._record(messages, pieces)
+
+
+def add_llm_backend_args(
+    ap: argparse.ArgumentParser, default_backend: str = "llamacpp", default_prompt_cache: str = "none"
+) -> None:
+    """The LLM flags shared by the chatbot, the server and the replay bench."""
+    ap.add_argument("--llm_backend", default=default_backend, choices=list(BACKENDS))
+    # llama.cpp / GGUF
+    ap.add_argument("--gguf_model", default=None, help="Path to a .gguf instruct model file (llamacpp backend)")
+    ap.add_argument("--chat_format", default="chatml", help="chat format for llama.cpp (e.g., chatml)")
+    ap.add_argument("--n_ctx", type=int, default=4096)
+    ap.add_argument("--n_threads", type=int, default=8)
+    ap.add_argument("--n_gpu_layers", type=int, default=0, help="0=CPU; >0 uses GPU if compiled with CUDA")
+    ap.add_argument(
+        "--prompt_cache", default=default_prompt_cache, choices=["none", "ram", "disk"], help="llama.cpp KV prefix cache"
+    )
+    ap.add_argument("--prompt_cache_mb", type=int, default=512)
+    # transformers
+    ap.add_argument("--hf_model", default=None, help="Local HF model dir (transformers backend)")
+    # stub
+    ap.add_argument("--stub_seed", type=int, default=7)
+    ap.add_argument("--stub_latency_ms", type=float, default=0.0, help="Simulated time to first token")
+    ap.add_argument("--stub_tokens_per_s", type=float, default=0.0, help="Simulated decode rate (0 = instant)")
+    # sampling
+    ap.add_argument("--max_tokens", type=int, default=140)
+    ap.add_argument("--temperature", type=float, default=0.8)
+    ap.add_argument("--top_p", type=float, default=0.95)
+    ap.add_argument("--repeat_penalty", type=float, default=1.10)
+
+
+def check_llm_backend_args(ap: argparse.ArgumentParser, args: argparse.Namespace) -> None:
+    if args.llm_backend == "llamacpp" and not args.gguf_model:
+        ap.error("--gguf_model is required with --llm_backend llamacpp")
+    if args.llm_backend == "transformers" and not args.hf_model:
+        ap.error("--hf_model is required with --llm_backend transformers")
+
+
+def describe_llm_backend(args: argparse.Namespace) -> str:
+    if args.llm_backend == "llamacpp":
+        return (
+            f"gguf_model={args.gguf_model} ctx={args.n_ctx} threads={args.n_threads} gpu_layers={args.n_gpu_layers}"
+        )
+    if args.llm_backend == "transformers":
+        return f"hf_model={args.hf_model}"
+    return (
+        f"llm=stub seed={args.stub_seed} latency_ms={args.stub_latency_ms:g} tokens_per_s={args.stub_tokens_per_s:g}"
+    )
+
+
+def make_chat_client(args: argparse.Namespace) -> ChatBackend:
+    """Builds the client for `args.llm_backend`; heavy imports happen only for the chosen backend."""
+    if args.llm_backend == "stub":
+        return StubChatClient(
+            StubClientConfig(
+                seed=args.stub_seed,
+                latency_ms=args.stub_latency_ms,
+                tokens_per_s=args.stub_tokens_per_s,
+                max_tokens=args.max_tokens,
+            )
+        )
+    if args.llm_backend == "transformers":
+        from src.llm_client_transformers import HFChatClient, HFClientConfig
+
+        return HFChatClient(
+            HFClientConfig(
+                model_name_or_path=args.hf_model,
+                max_new_tokens=args.max_tokens,
+                temperature=args.temperature,
+                top_p=args.top_p,
+            )
+        )
+    if args.llm_backend == "llamacpp":
+        from src.llm_client_llamacpp import LlamaCppChatClient, LlamaCppConfig
+
+        return LlamaCppChatClient(
+            LlamaCppConfig(
+                model_path=args.gguf_model,
+                chat_format=args.chat_format,
+                n_ctx=args.n_ctx,
+                n_threads=args.n_threads,
+                n_gpu_layers=args.n_gpu_layers,
+                temperature=args.temperature,
+                top_p=args.top_p,
+                repeat_penalty=args.repeat_penalty,
+                max_tokens=args.max_tokens,
+                prompt_cache=args.prompt_cache,
+                prompt_cache_mb=args.prompt_cache_mb,
+            )
+        )
+    raise ValueError(f"Unknown llm_backend '{args.llm_backend}' (expected one of {', '.join(BACKENDS)})")
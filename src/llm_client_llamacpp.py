@@ -2,9 +2,9 @@
 from __future__ import annotations
 
 from dataclasses import dataclass
-from typing import Dict, List, Optional
+from typing import Any, Dict, Iterator, List, Optional
 
-from llama_cpp import Llama
+from llama_cpp import Llama, LlamaDiskCache, LlamaRAMCache
 
 
 @dataclass
@@ -23,6 +23,16 @@ class LlamaCppConfig:
     # For Phi-3 instruct GGUF, "chatml" is usually a good default.
     chat_format: str = "chatml"
 
+    # KV state cache keyed by prompt tokens. After each completion llama.cpp
+    # saves the evaluated state; a later prompt that shares a longer prefix with
+    # a cached state than with the live context restores it instead of
+    # re-evaluating. "none" keeps only the live-context prefix match, which is
+    # all a single conversation needs; "ram" pays off in the server, where
+    # sessions interleave on a shared Llama and evict each other's context.
+    prompt_cache: str = "none"  # "none" | "ram" | "disk"
+    prompt_cache_mb: int = 512
+    prompt_cache_dir: str = ".cache/llama_prompt_cache"
+
 
 class LlamaCppChatClient:
     def __init__(self, cfg: LlamaCppConfig):
@@ -35,10 +45,24 @@ class LlamaCppChatClient:
             chat_format=cfg.chat_format,
             verbose=False,
         )
+        self.last_usage: Dict[str, Any] = {}
+        if cfg.prompt_cache == "ram":
+            self.llm.set_cache(LlamaRAMCache(capacity_bytes=cfg.prompt_cache_mb << 20))
+        elif cfg.prompt_cache == "disk":
+            self.llm.set_cache(LlamaDiskCache(cache_dir=cfg.prompt_cache_dir, capacity_bytes=cfg.prompt_cache_mb << 20))
+        elif cfg.prompt_cache != "none":
+            raise ValueError(f"Unknown prompt_cache '{cfg.prompt_cache}' (expected none|ram|disk)")
+
+    def count_tokens(self, text: str) -> int:
+        return len(self.llm.tokenize((text or "").encode("utf-8"), add_bos=False, special=False))
 
     def chat(self, messages: List[Dict[str, str]]) -> str:
         """
         messages: [{"role":"system"|"user"|"assistant", "content": "..."}]
+
+        Keep the stable part (persona system prompt + past turns) first and
+        anything that changes per turn last: llama.cpp only evaluates tokens
+        after the longest prefix shared with the live context or prompt cache.
         """
         out = self.llm.create_chat_completion(
             messages=messages,
@@ -47,4 +71,23 @@ class LlamaCppChatClient:
             repeat_penalty=self.cfg.repeat_penalty,
             max_tokens=self.cfg.max_tokens,
         )
+        self.last_usage = dict(out.get("usage") or {})
         return (out["choices"][0]["message"]["content"] or "").strip()
+
+    def chat_stream(self, messages: List[Dict[str, str]]) -> Iterator[str]:
+        """
+        Same request as chat(), but yields text deltas as they are generated.
+        """
+        stream = self.llm.create_chat_completion(
+            messages=messages,
+            temperature=self.cfg.temperature,
+            top_p=self.cfg.top_p,
+            repeat_penalty=self.cfg.repeat_penalty,
+            max_tokens=self.cfg.max_tokens,
+            stream=True,
+        )
+        for chunk in stream:
+            delta = chunk["choices"][0].get("delta") or {}
+            text = delta.get("content")
+            if text:
+                yield text
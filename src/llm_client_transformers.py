@@ -2,7 +2,7 @@
 from __future__ import annotations
 
 from dataclasses import dataclass
-from typing import Dict, List
+from typing import Dict, Iterator, List
 
 import torch
 from transformers import AutoModelForCausalLM, AutoTokenizer
@@ -56,6 +56,9 @@ class HFChatClient:
         self.model.to(self.device)
         self.model.eval()
 
+    def count_tokens(self, text: str) -> int:
+        return len(self.tokenizer.encode(text or "", add_special_tokens=False))
+
     def _build_prompt(self, messages: List[Dict[str, str]]) -> str:
         parts = []
         for m in messages:
@@ -99,3 +102,7 @@ class HFChatClient:
                 reply = reply.split(stop)[0].strip()
 
         return reply
+
+    def chat_stream(self, messages: List[Dict[str, str]]) -> Iterator[str]:
+        # generate() has no incremental output here; the reply arrives as one chunk
+        yield self.chat(messages)
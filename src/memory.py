@@ -1,12 +1,24 @@
 # src/memory.py
 from __future__ import annotations
 
-from dataclasses import dataclass
+import atexit
+import base64
+import copy
+from dataclasses import dataclass, field
 from datetime import datetime
 import json
+import os
 import re
 from pathlib import Path
-from typing import Dict, List, Optional, Tuple
+import sqlite3
+import threading
+import time
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+# texts -> (n, d) embeddings; the turn engine passes SafetyEmbedScorer.embed_many
+Embedder = Callable[[Sequence[str]], np.ndarray]
 
 
 @dataclass
@@ -15,6 +27,8 @@ class MemoryItem:
     value: str
     confidence: float
     last_seen: str
+    # unit-norm float16 embedding of hook(), set at insert when an embedder is available
+    embedding: Optional[np.ndarray] = field(default=None, repr=False, compare=False)
 
     def as_dict(self) -> Dict[str, str]:
         return {
@@ -24,13 +38,62 @@ class MemoryItem:
             "last_seen": self.last_seen,
         }
 
+    def record(self) -> Dict[str, object]:
+        """as_dict() plus the embedding (base64 float16), as the JSON store writes it."""
+        out: Dict[str, object] = dict(self.as_dict())
+        if self.embedding is not None:
+            out["embedding"] = _encode_embedding(self.embedding)
+        return out
+
+    def hook(self) -> str:
+        return f"{self.key}: {self.value}"
+
+
+def _unit_f16(X: np.ndarray) -> np.ndarray:
+    X = np.asarray(X, dtype=np.float32)
+    X = X / np.maximum(np.linalg.norm(X, axis=-1, keepdims=True), 1e-12)
+    return X.astype(np.float16)
+
+
+def top_k_similar(matrix: np.ndarray, query: np.ndarray, k: int) -> List[int]:
+    """Row indices of `matrix` (unit rows) by cosine similarity to `query`, best first; ties keep row order."""
+    if k <= 0 or matrix.shape[0] == 0:
+        return []
+    sims = matrix.astype(np.float32) @ np.asarray(query, dtype=np.float32)
+    if k < sims.size:
+        top = np.argpartition(-sims, k - 1)[:k]
+    else:
+        top = np.arange(sims.size)
+    return sorted(top.tolist(), key=lambda i: (-sims[i], i))
+
+
+def _embedding_blob(vec: Optional[np.ndarray]) -> Optional[bytes]:
+    return None if vec is None else vec.astype(np.float16).tobytes()
+
+
+def _encode_embedding(vec: Optional[np.ndarray]) -> Optional[str]:
+    blob = _embedding_blob(vec)
+    return None if blob is None else base64.b64encode(blob).decode("ascii")
 
-_PREF_PATTERNS: List[Tuple[str, str]] = [
-    (r"\bi (really )?(like|love|enjoy|prefer|adore)\s+([^.!?]{2,60})", "likes"),
-    (r"\bi'?m into\s+([^.!?]{2,60})", "likes"),
-    (r"\bmy favorite\s+([^.!?]{2,40})\s+is\s+([^.!?]{2,60})", "favorite"),
-    (r"\bi (work as|work in|do)\s+(a |an )?([^.!?]{2,60})", "job"),
-    (r"\bi'?m (a|an)\s+([^.!?]{2,60})", "job"),
+
+def _decode_embedding(raw: object) -> Optional[np.ndarray]:
+    if not isinstance(raw, str):
+        return None
+    try:
+        return np.frombuffer(base64.b64decode(raw), dtype=np.float16)
+    except ValueError:
+        return None
+
+
+_PREF_PATTERNS: List[Tuple["re.Pattern[str]", str]] = [
+    (re.compile(p, re.IGNORECASE), key)
+    for p, key in [
+        (r"\bi (really )?(like|love|enjoy|prefer|adore)\s+([^.!?]{2,60})", "likes"),
+        (r"\bi'?m into\s+([^.!?]{2,60})", "likes"),
+        (r"\bmy favorite\s+([^.!?]{2,40})\s+is\s+([^.!?]{2,60})", "favorite"),
+        (r"\bi (work as|work in|do)\s+(a |an )?([^.!?]{2,60})", "job"),
+        (r"\bi'?m (a|an)\s+([^.!?]{2,60})", "job"),
+    ]
 ]
 
 _BLOCKLIST = re.compile(
@@ -43,36 +106,163 @@ def _now_iso() -> str:
     return datetime.utcnow().isoformat(timespec="seconds") + "Z"
 
 
+def _default_meta() -> Dict[str, object]:
+    return {
+        "trust_level": 0.1,
+        "consent_state": "none",
+        "trust_history": [],
+        "boundaries": [],
+        "last_updated": _now_iso(),
+    }
+
+
 def _clean_value(text: str) -> str:
     return re.sub(r"\s+", " ", text).strip(" .,!?:;\"'")
 
 
+_CONTACT_RX = re.compile(r"@|https?://|www\.", re.IGNORECASE)
+_DIGITS_RX = re.compile(r"\d{3,}")
+
+
 def _is_safe_value(value: str) -> bool:
     if len(value) < 2:
         return False
     if _BLOCKLIST.search(value):
         return False
-    if re.search(r"@|https?://|www\.", value, re.IGNORECASE):
+    if _CONTACT_RX.search(value):
         return False
-    if re.search(r"\d{3,}", value):
+    if _DIGITS_RX.search(value):
         return False
     return True
 
 
+def extract_preferences(user_text: str) -> List[Tuple[str, str]]:
+    """(key, value) preference pairs in `user_text`, in the order the store upserts them."""
+    out: List[Tuple[str, str]] = []
+    for rx, key in _PREF_PATTERNS:
+        for match in rx.finditer(user_text):
+            groups = [g for g in match.groups() if g]
+            value = _clean_value(groups[-1]) if groups else ""
+            if _is_safe_value(value):
+                out.append((key, value))
+    return out
+
+
+class _WriteBehindFlusher:
+    """
+    One background thread flushing every dirty write-behind store, each once
+    its oldest unsaved change is `flush_interval` old or it has `flush_ops`
+    unsaved changes. A failed write is logged and retried `flush_interval`
+    later. Whatever is still dirty is flushed at interpreter exit.
+    """
+
+    def __init__(self):
+        self._cond = threading.Condition()
+        self._dirty: Dict[int, "SemanticMemoryStore"] = {}
+        self._retry_at: Dict[int, float] = {}  # stores whose last write failed, by retry time
+        self._thread: Optional[threading.Thread] = None
+
+    def mark(self, store: "SemanticMemoryStore") -> None:
+        with self._cond:
+            self._dirty[id(store)] = store
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="memory-flush", daemon=True)
+                self._thread.start()
+            self._cond.notify()  # deadlines may have moved; the thread recomputes its wait
+
+    def discard(self, store: "SemanticMemoryStore") -> None:
+        with self._cond:
+            self._dirty.pop(id(store), None)
+            self._retry_at.pop(id(store), None)
+
+    def _due(self, now: float) -> Tuple[List["SemanticMemoryStore"], Optional[float]]:
+        due, wait = [], None
+        for key, store in list(self._dirty.items()):
+            since = store._dirty_since
+            if since is None:
+                del self._dirty[key]
+                self._retry_at.pop(key, None)
+                continue
+            retry = self._retry_at.get(key)
+            if retry is not None and retry > now:
+                left = retry - now
+            else:
+                left = since + store.flush_interval - now
+                if left <= 0 or store._dirty_ops >= store.flush_ops:
+                    due.append(store)
+                    del self._dirty[key]
+                    self._retry_at.pop(key, None)
+                    continue
+            if wait is None or left < wait:
+                wait = left
+        return due, wait
+
+    def _flush(self, store: "SemanticMemoryStore") -> bool:
+        try:
+            store.flush()
+            return True
+        except Exception as exc:  # the store kept its changes; never let one bad write stop the thread
+            print(f"[WARN] memory flush failed for {store.path}: {exc!r}")
+            return False
+
+    def _run(self) -> None:
+        while True:
+            with self._cond:
+                due, wait = self._due(time.monotonic())
+                if not due:
+                    self._cond.wait(timeout=wait)
+                    continue
+            for store in due:
+                if not self._flush(store):
+                    with self._cond:
+                        self._dirty.setdefault(id(store), store)
+                        self._retry_at[id(store)] = time.monotonic() + store.flush_interval
+
+    def flush_all(self) -> None:
+        with self._cond:
+            stores = list(self._dirty.values())
+            self._dirty.clear()
+            self._retry_at.clear()
+        for store in stores:
+            self._flush(store)
+
+
+_FLUSHER = _WriteBehindFlusher()
+atexit.register(_FLUSHER.flush_all)
+
+
 class SemanticMemoryStore:
-    def __init__(self, memory_id: str, root: Optional[Path] = None):
+    """
+    Per-user memory items plus trust/consent/boundary meta, one JSON file per
+    memory_id. Files are written atomically (temp file + rename).
+
+    By default every change is saved before the call returns. With
+    `write_behind=True` a change only marks the store dirty; a shared background
+    thread writes it after `flush_interval` seconds or `flush_ops` changes, and
+    flush()/close() write synchronously (call close() when the session ends).
+    """
+
+    def __init__(
+        self,
+        memory_id: str,
+        root: Optional[Path] = None,
+        write_behind: bool = False,
+        flush_interval: float = 2.0,
+        flush_ops: int = 20,
+    ):
         self.memory_id = memory_id
         self.root = root or (Path(__file__).resolve().parents[1] / "data" / "memory")
         self.root.mkdir(parents=True, exist_ok=True)
         self.path = self.root / f"{memory_id}.json"
+        self.write_behind = bool(write_behind)
+        self.flush_interval = float(flush_interval)
+        self.flush_ops = max(1, int(flush_ops))
+        self._lock = threading.RLock()  # guards items/meta against the flusher's snapshot
+        self._io_lock = threading.Lock()  # one writer per file
+        self._dirty_ops = 0
+        self._dirty_since: Optional[float] = None
         self.items: List[MemoryItem] = []
-        self.meta: Dict[str, object] = {
-            "trust_level": 0.1,
-            "consent_state": "none",
-            "trust_history": [],
-            "boundaries": [],
-            "last_updated": _now_iso(),
-        }
+        self.meta: Dict[str, object] = _default_meta()
         self._load()
 
     def _load(self) -> None:
@@ -97,40 +287,72 @@ class SemanticMemoryStore:
                 value=i["value"],
                 confidence=float(i.get("confidence", 0.6)),
                 last_seen=i.get("last_seen", _now_iso()),
+                embedding=_decode_embedding(i.get("embedding")),
             )
             for i in items_raw
             if isinstance(i, dict) and "key" in i and "value" in i
         ]
 
     def save(self) -> None:
-        self.meta["last_updated"] = _now_iso()
-        payload = {"items": [i.as_dict() for i in self.items], "meta": self.meta}
-        self.path.write_text(json.dumps(payload, indent=2), encoding="utf-8")
+        with self._lock:
+            self.meta["last_updated"] = _now_iso()
+            self._dirty_ops += 1
+            if self._dirty_since is None:
+                self._dirty_since = time.monotonic()
+        if self.write_behind:
+            _FLUSHER.mark(self)
+        else:
+            self.flush()
+
+    def flush(self) -> None:
+        """Writes pending changes now (no-op when nothing is unsaved)."""
+        with self._io_lock:
+            with self._lock:
+                if not self._dirty_ops:
+                    return
+                payload = {"items": [i.record() for i in self.items], "meta": copy.deepcopy(self.meta)}
+                ops, since = self._dirty_ops, self._dirty_since
+                self._dirty_ops = 0
+                self._dirty_since = None
+            tmp = self.path.with_name(f"{self.path.name}.tmp")
+            try:
+                tmp.write_text(json.dumps(payload, indent=2), encoding="utf-8")
+                os.replace(tmp, self.path)
+            except BaseException:
+                with self._lock:  # still unsaved, including anything changed meanwhile
+                    self._dirty_ops += ops
+                    self._dirty_since = since
+                raise
+
+    def close(self) -> None:
+        _FLUSHER.discard(self)
+        self.flush()
 
     def clear(self) -> None:
-        self.items = []
-        self.meta = {
-            "trust_level": 0.1,
-            "consent_state": "none",
-            "trust_history": [],
-            "boundaries": [],
-            "last_updated": _now_iso(),
-        }
-        if self.path.exists():
-            self.path.unlink()
+        _FLUSHER.discard(self)
+        with self._io_lock, self._lock:
+            self.items = []
+            self.meta = _default_meta()
+            self._dirty_ops = 0
+            self._dirty_since = None
+            if self.path.exists():
+                self.path.unlink()
 
-    def update_from_text(self, user_text: str) -> List[MemoryItem]:
+    def update_from_text(self, user_text: str, embed: Optional[Embedder] = None) -> List[MemoryItem]:
+        """
+        Upserts the preferences in `user_text`. With `embed`, new items get
+        their hook embedded (one batch) before the save, so retrieval never
+        has to encode them later.
+        """
         added: List[MemoryItem] = []
-        for pattern, key in _PREF_PATTERNS:
-            for match in re.finditer(pattern, user_text, flags=re.IGNORECASE):
-                groups = [g for g in match.groups() if g]
-                value = _clean_value(groups[-1]) if groups else ""
-                if not _is_safe_value(value):
-                    continue
+        for key, value in extract_preferences(user_text):
+            with self._lock:
                 item = self._upsert(key, value)
-                if item:
-                    added.append(item)
+            if item:
+                added.append(item)
         if added:
+            if embed is not None:
+                self._set_embeddings(added, _unit_f16(embed([i.hook() for i in added])))
             self.save()
         return added
 
@@ -143,24 +365,26 @@ class SemanticMemoryStore:
         else:
             boundary = None
         if boundary and boundary not in self.meta.get("boundaries", []):
-            self.meta.setdefault("boundaries", []).append(boundary)
+            with self._lock:
+                self.meta.setdefault("boundaries", []).append(boundary)
             self.save()
         return boundary
 
     def update_trust(self, trust_level: float, consent_state: str, reason: str) -> None:
-        self.meta["trust_level"] = float(trust_level)
-        self.meta["consent_state"] = consent_state
-        history = self.meta.get("trust_history", [])
-        if isinstance(history, list):
-            history.append(
-                {
-                    "ts": _now_iso(),
-                    "trust": float(trust_level),
-                    "consent": consent_state,
-                    "reason": reason,
-                }
-            )
-            self.meta["trust_history"] = history[-20:]
+        with self._lock:
+            self.meta["trust_level"] = float(trust_level)
+            self.meta["consent_state"] = consent_state
+            history = self.meta.get("trust_history", [])
+            if isinstance(history, list):
+                history.append(
+                    {
+                        "ts": _now_iso(),
+                        "trust": float(trust_level),
+                        "consent": consent_state,
+                        "reason": reason,
+                    }
+                )
+                self.meta["trust_history"] = history[-20:]
         self.save()
 
     def _upsert(self, key: str, value: str) -> Optional[MemoryItem]:
@@ -174,15 +398,245 @@ class SemanticMemoryStore:
         self.items.append(new_item)
         return new_item
 
+    def _set_embeddings(self, items: List[MemoryItem], vecs: np.ndarray) -> None:
+        # the JSON store's items are the objects in self.items; the next flush writes them
+        with self._lock:
+            for item, vec in zip(items, vecs):
+                item.embedding = vec
+
     def get_highlights(self, k: int = 3) -> List[str]:
         sorted_items = sorted(self.items, key=lambda i: i.last_seen, reverse=True)
         highlights = [f"{i.key}: {i.value}" for i in sorted_items[:k]]
         return highlights
 
-    def get_hooks(self, k: int = 2) -> List[str]:
+    def get_relevant(
+        self, query: str, embed: Embedder, k: int = 3, query_vec: Optional[np.ndarray] = None
+    ) -> List[str]:
+        """
+        The k item hooks most similar (cosine) to `query`; pass `query_vec`
+        when the query is already embedded (the safety gate's vector). Items
+        stored without an embedding, or with one from a model of another
+        size, are embedded in one batch and saved.
+        """
+        items = self.items
+        if not items or k <= 0:
+            return []
+        q = _unit_f16(embed([query])[0] if query_vec is None else query_vec)
+        stale = [i for i in items if i.embedding is None or i.embedding.shape != q.shape]
+        if stale:
+            self._set_embeddings(stale, _unit_f16(embed([i.hook() for i in stale])))
+            self.save()
+        matrix = np.stack([i.embedding for i in items])
+        return [items[j].hook() for j in top_k_similar(matrix, q, k)]
+
+    def get_hooks(
+        self,
+        k: int = 2,
+        query: Optional[str] = None,
+        embed: Optional[Embedder] = None,
+        query_vec: Optional[np.ndarray] = None,
+    ) -> List[str]:
+        """Boundaries first, then the items most relevant to `query` (most recent without query/embed)."""
         hooks: List[str] = []
         boundaries = self.meta.get("boundaries", [])
         if isinstance(boundaries, list) and boundaries:
             hooks.append(f"boundaries: {', '.join(boundaries[:2])}")
-        hooks.extend(self.get_highlights(k=k))
+        if query and embed is not None:
+            hooks.extend(self.get_relevant(query, embed, k=k, query_vec=query_vec))
+        else:
+            hooks.extend(self.get_highlights(k=k))
         return hooks[:k]
+
+
+_DB_LOCKS: Dict[str, threading.RLock] = {}
+_DB_LOCKS_GUARD = threading.Lock()
+
+
+def _db_lock(path: Path) -> threading.RLock:
+    # SQLite allows one writer per database; queueing in-process writers on a
+    # lock avoids the busy handler's sleep-and-retry, which dominates tail latency
+    with _DB_LOCKS_GUARD:
+        return _DB_LOCKS.setdefault(str(path.resolve()), threading.RLock())
+
+
+class SQLiteMemoryStore(SemanticMemoryStore):
+    """
+    SemanticMemoryStore API backed by one shared SQLite database (WAL mode)
+    instead of one JSON file per memory_id.
+
+      - memory_items: unique index on (memory_id, key, lower(value)), so an
+        upsert is an index probe rather than a scan of all items
+      - index on (memory_id, last_seen) for the top-k highlights
+      - memory_meta: one JSON row per memory_id (trust, consent, boundaries)
+      - memory_items.embedding: the item's float16 embedding as a BLOB (NULL
+        until embedded; the column is added to older databases on open)
+
+    Every change commits immediately; WAL commits are cheap and short
+    transactions keep concurrent sessions from blocking each other, so
+    `write_behind` is accepted for API parity but has no effect. Stores in one
+    process that share a database file share one lock. An existing
+    JSON memory file for the same memory_id is imported on first open.
+    Note SQLite's lower() only folds ASCII.
+    """
+
+    _SCHEMA = """
+        CREATE TABLE IF NOT EXISTS memory_items (
+            memory_id TEXT NOT NULL,
+            key TEXT NOT NULL,
+            value TEXT NOT NULL,
+            confidence REAL NOT NULL,
+            last_seen TEXT NOT NULL,
+            embedding BLOB
+        );
+        CREATE UNIQUE INDEX IF NOT EXISTS memory_items_uniq ON memory_items (memory_id, key, lower(value));
+        CREATE INDEX IF NOT EXISTS memory_items_recent ON memory_items (memory_id, last_seen);
+        CREATE TABLE IF NOT EXISTS memory_meta (
+            memory_id TEXT PRIMARY KEY,
+            meta TEXT NOT NULL
+        );
+    """
+
+    # deliberately does not call SemanticMemoryStore.__init__: `items` is a query here
+    def __init__(
+        self,
+        memory_id: str,
+        root: Optional[Path] = None,
+        write_behind: bool = False,
+        flush_interval: float = 2.0,
+        flush_ops: int = 20,
+        db_name: str = "memory.sqlite3",
+    ):
+        self.memory_id = memory_id
+        self.root = root or (Path(__file__).resolve().parents[1] / "data" / "memory")
+        self.root.mkdir(parents=True, exist_ok=True)
+        self.path = self.root / db_name
+        self.write_behind = False
+        self.flush_interval = float(flush_interval)
+        self.flush_ops = max(1, int(flush_ops))
+        self._lock = _db_lock(self.path)
+        self._conn = sqlite3.connect(str(self.path), timeout=30.0, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        with self._lock, self._conn:
+            self._conn.executescript(self._SCHEMA)
+            columns = {row[1] for row in self._conn.execute("PRAGMA table_info(memory_items)")}
+            if "embedding" not in columns:  # databases created before item embeddings
+                self._conn.execute("ALTER TABLE memory_items ADD COLUMN embedding BLOB")
+        self.meta: Dict[str, object] = _default_meta()
+        self._load()
+
+    def _load(self) -> None:
+        with self._lock:
+            row = self._conn.execute("SELECT meta FROM memory_meta WHERE memory_id = ?", (self.memory_id,)).fetchone()
+        if row is not None:
+            meta = json.loads(row[0])
+            if isinstance(meta, dict):
+                self.meta.update(meta)
+            return
+        legacy = self.root / f"{self.memory_id}.json"
+        if legacy.exists():
+            old = SemanticMemoryStore(self.memory_id, root=self.root)
+            with self._lock, self._conn:
+                self._conn.executemany(
+                    "INSERT OR IGNORE INTO memory_items (memory_id, key, value, confidence, last_seen, embedding) "
+                    "VALUES (?, ?, ?, ?, ?, ?)",
+                    [
+                        (self.memory_id, i.key, i.value, i.confidence, i.last_seen, _embedding_blob(i.embedding))
+                        for i in old.items
+                    ],
+                )
+                self.meta.update(old.meta)
+                self._write_meta()
+
+    @property
+    def items(self) -> List[MemoryItem]:
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT key, value, confidence, last_seen, embedding FROM memory_items WHERE memory_id = ? ORDER BY rowid",
+                (self.memory_id,),
+            ).fetchall()
+        return [
+            MemoryItem(
+                key=k,
+                value=v,
+                confidence=float(c),
+                last_seen=ls,
+                embedding=None if e is None else np.frombuffer(e, dtype=np.float16),
+            )
+            for k, v, c, ls, e in rows
+        ]
+
+    def _write_meta(self) -> None:
+        self._conn.execute(
+            "INSERT INTO memory_meta (memory_id, meta) VALUES (?, ?) "
+            "ON CONFLICT(memory_id) DO UPDATE SET meta = excluded.meta",
+            (self.memory_id, json.dumps(self.meta)),
+        )
+
+    def save(self) -> None:
+        with self._lock, self._conn:
+            self.meta["last_updated"] = _now_iso()
+            self._write_meta()
+
+    def flush(self) -> None:
+        pass  # nothing is buffered
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+    def clear(self) -> None:
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM memory_items WHERE memory_id = ?", (self.memory_id,))
+            self._conn.execute("DELETE FROM memory_meta WHERE memory_id = ?", (self.memory_id,))
+            self.meta = _default_meta()
+
+    def _upsert(self, key: str, value: str) -> Optional[MemoryItem]:
+        now = _now_iso()
+        with self._lock, self._conn:
+            inserted = self._conn.execute(
+                "INSERT OR IGNORE INTO memory_items (memory_id, key, value, confidence, last_seen) VALUES (?, ?, ?, 0.6, ?)",
+                (self.memory_id, key, value, now),
+            ).rowcount
+            if inserted:
+                return MemoryItem(key=key, value=value, confidence=0.6, last_seen=now)
+            self._conn.execute(
+                "UPDATE memory_items SET last_seen = ?, confidence = max(confidence, 0.6) "
+                "WHERE memory_id = ? AND key = ? AND lower(value) = lower(?)",
+                (now, self.memory_id, key, value),
+            )
+        return None
+
+    def _set_embeddings(self, items: List[MemoryItem], vecs: np.ndarray) -> None:
+        with self._lock, self._conn:
+            self._conn.executemany(
+                "UPDATE memory_items SET embedding = ? WHERE memory_id = ? AND key = ? AND lower(value) = lower(?)",
+                [(_embedding_blob(vec), self.memory_id, i.key, i.value) for i, vec in zip(items, vecs)],
+            )
+        for item, vec in zip(items, vecs):
+            item.embedding = vec
+
+    def get_highlights(self, k: int = 3) -> List[str]:
+        # rowid breaks last_seen ties in insertion order, like the JSON store's stable sort
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT key, value FROM memory_items WHERE memory_id = ? ORDER BY last_seen DESC, rowid LIMIT ?",
+                (self.memory_id, int(k)),
+            ).fetchall()
+        return [f"{key}: {value}" for key, value in rows]
+
+
+MEMORY_BACKENDS = ("json", "sqlite")
+
+
+def open_memory_store(
+    memory_id: str,
+    backend: str = "json",
+    root: Optional[Path] = None,
+    write_behind: bool = False,
+) -> SemanticMemoryStore:
+    if backend == "json":
+        return SemanticMemoryStore(memory_id, root=root, write_behind=write_behind)
+    if backend == "sqlite":
+        return SQLiteMemoryStore(memory_id, root=root, write_behind=write_behind)
+    raise ValueError(f"Unknown memory backend '{backend}' (expected one of {', '.join(MEMORY_BACKENDS)})")
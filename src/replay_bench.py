@@ -0,0 +1,344 @@
+# src/replay_bench.py
+from __future__ import annotations
+
+import argparse
+from collections import Counter, OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+import hashlib
+import json
+from pathlib import Path
+import random
+import tempfile
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from src.chat_server import LLMPool, PooledLLM
+from src.chat_session import PERSONA_SYSTEM, ChatSession, SessionSettings
+from src.intent_heads import add_intent_heads_args, load_intent_heads
+from src.llm_backends import add_llm_backend_args, check_llm_backend_args, describe_llm_backend, make_chat_client
+from src.memory import MEMORY_BACKENDS
+from src.personality import get_profile
+from src.safety_cascade import CascadeSafetyScorer, add_safety_gate_args, make_safety_gate
+from src.safety_embed import SAFETY_BACKENDS, SafetyEmbedScorer, SafetyScore
+from src.safety_rules import obvious_escalation
+from src.text_features import extract_features
+from src.trust import classify_erotic_intent
+from src.turn_engine import STAGES, TurnEngine
+
+ROOT = Path(__file__).resolve().parents[1]
+DATA = ROOT / "data"
+RESULTS_DIR = DATA / "results"
+
+
+def _stable_hash(text: str, seed: int) -> int:
+    return int.from_bytes(hashlib.sha1(f"{seed}:{text}".encode("utf-8")).digest()[:8], "big")
+
+
+class ReplayStubScorer:
+    """
+    Model-free stand-in for SafetyEmbedScorer: p(MOVE) from the rule and erotic
+    detectors plus a text-hash jitter, so runs are reproducible without the
+    embedding model.
+    """
+
+    def __init__(self, seed: int = 7):
+        self.seed = seed
+
+    def score(self, text: str, threshold: float = 0.45) -> SafetyScore:
+        jitter = (_stable_hash(text, self.seed) % 1000) / 1000.0
+        features = extract_features(text)
+        rule_hit, _ = obvious_escalation(text, features)
+        level = classify_erotic_intent(text, features)
+        if rule_hit or level == "explicit":
+            p = 0.8 + 0.2 * jitter
+        elif level == "suggestive":
+            p = 0.35 + 0.3 * jitter
+        else:
+            p = 0.3 * jitter
+        return SafetyScore(p_move=p, label="MOVE" if p >= threshold else "SAFE", threshold=threshold)
+
+
+@dataclass
+class Conversation:
+    conversation_id: str
+    turns: List[str]
+    use_case: str = ""
+
+
+@dataclass
+class _Stats:
+    latencies: List[float] = field(default_factory=list)
+    stages: Dict[str, List[float]] = field(default_factory=dict)
+    modes: Counter = field(default_factory=Counter)
+    modes_by_uc: Dict[str, Counter] = field(default_factory=dict)
+    errors: List[str] = field(default_factory=list)
+    lock: threading.Lock = field(default_factory=threading.Lock)
+
+
+def read_jsonl(path: Path) -> List[Dict[str, Any]]:
+    rows = []
+    with path.open("r", encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if line:
+                rows.append(json.loads(line))
+    return rows
+
+
+def load_conversations(path: Path) -> List[Conversation]:
+    """Scripted JSONL: {"conversation_id": ..., "use_case": ..., "turns": ["user msg", ...]} per line."""
+    out = []
+    for i, row in enumerate(read_jsonl(path)):
+        turns = [str(t) for t in row.get("turns") or [] if str(t).strip()]
+        if turns:
+            out.append(Conversation(str(row.get("conversation_id", f"conv{i:05d}")), turns, row.get("use_case", "")))
+    return out
+
+
+def conversations_from_samples(path: Path, turns_per_conv: int, use_cases: Optional[List[str]] = None) -> List[Conversation]:
+    """Groups samples by (use_case, context_id), in file order, into conversations of `turns_per_conv` turns."""
+    groups: "OrderedDict[tuple, List[str]]" = OrderedDict()
+    for row in read_jsonl(path):
+        uc = row.get("use_case", "")
+        if use_cases and uc not in use_cases:
+            continue
+        groups.setdefault((uc, row.get("context_id", "")), []).append(row["user_text"])
+    out = []
+    for (uc, ctx), texts in groups.items():
+        for start in range(0, len(texts), turns_per_conv):
+            out.append(Conversation(f"{uc}:{ctx}:{start // turns_per_conv}", texts[start : start + turns_per_conv], uc))
+    return out
+
+
+def _run_conversation(
+    conv: Conversation,
+    engine: TurnEngine,
+    settings: SessionSettings,
+    seed: int,
+    memory_root: Path,
+    start_at: float,
+    stats: _Stats,
+) -> None:
+    delay = start_at - time.perf_counter()
+    if delay > 0:
+        time.sleep(delay)
+    rng = random.Random(_stable_hash(conv.conversation_id, seed))
+    session = ChatSession(
+        settings,
+        get_profile("random", settings.bot_gender, rng=rng),
+        count_tokens=engine.llm.count_tokens,
+        memory_id=hashlib.sha1(conv.conversation_id.encode("utf-8")).hexdigest()[:16],
+        rng=rng,
+        session_id=conv.conversation_id,
+        memory_root=memory_root,
+    )
+    try:
+        _replay_turns(conv, engine, session, stats)
+    finally:
+        session.close()
+
+
+def _replay_turns(conv: Conversation, engine: TurnEngine, session: ChatSession, stats: _Stats) -> None:
+    for text in conv.turns:
+        if session.closed:
+            break
+        try:
+            out = engine.step(session, text)
+        except Exception as exc:
+            with stats.lock:
+                stats.errors.append(f"{conv.conversation_id}: {exc!r}")
+            return
+        with stats.lock:
+            stats.latencies.append(out.trace["total"])
+            for stage, dt in out.trace.items():
+                if stage != "total":
+                    stats.stages.setdefault(stage, []).append(dt)
+            stats.modes[out.mode] += 1
+            stats.modes_by_uc.setdefault(conv.use_case or "-", Counter())[out.mode] += 1
+
+
+def _pct(values: List[float]) -> Dict[str, float]:
+    if not values:
+        return {"n": 0}
+    ms = np.asarray(values, dtype=np.float64) * 1000.0
+    p50, p95, p99 = np.percentile(ms, [50, 95, 99])
+    return {
+        "n": int(ms.size),
+        "mean_ms": float(ms.mean()),
+        "p50_ms": float(p50),
+        "p95_ms": float(p95),
+        "p99_ms": float(p99),
+        "max_ms": float(ms.max()),
+    }
+
+
+def run_replay(
+    conversations: List[Conversation],
+    engine: TurnEngine,
+    settings: SessionSettings,
+    concurrency: int = 8,
+    rate: float = 0.0,
+    seed: int = 7,
+) -> Dict[str, Any]:
+    """
+    Replays `conversations` through `engine`, up to `concurrency` at a time.
+    With `rate` > 0 conversations start at that many per second; otherwise all
+    are released at once and the pool size is the only limit. Turns within a
+    conversation are sequential.
+    """
+    stats = _Stats()
+    with tempfile.TemporaryDirectory(prefix="replay_mem_") as tmp:
+        t0 = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=max(1, concurrency)) as pool:
+            futures = [
+                pool.submit(
+                    _run_conversation,
+                    conv,
+                    engine,
+                    settings,
+                    seed,
+                    Path(tmp),
+                    t0 + (i / rate if rate > 0 else 0.0),
+                    stats,
+                )
+                for i, conv in enumerate(conversations)
+            ]
+            for fut in futures:
+                fut.result()
+        wall = time.perf_counter() - t0
+
+    n_turns = len(stats.latencies)
+    return {
+        "conversations": len(conversations),
+        "turns": n_turns,
+        "errors": stats.errors,
+        "wall_s": wall,
+        "throughput_turns_per_s": n_turns / wall if wall > 0 else 0.0,
+        "latency": _pct(stats.latencies),
+        "stages": {stage: _pct(stats.stages[stage]) for stage in STAGES if stage in stats.stages},
+        "modes": dict(stats.modes.most_common()),
+        "modes_by_use_case": {uc: dict(c.most_common()) for uc, c in sorted(stats.modes_by_uc.items())},
+    }
+
+
+def print_report(report: Dict[str, Any]) -> None:
+    lat = report["latency"]
+    print(f"Conversations: {report['conversations']}  turns: {report['turns']}  errors: {len(report['errors'])}")
+    print(f"Wall: {report['wall_s']:.2f}s  throughput: {report['throughput_turns_per_s']:.1f} turns/s")
+    if lat.get("n"):
+        print(
+            f"Turn latency ms: p50={lat['p50_ms']:.2f} p95={lat['p95_ms']:.2f} "
+            f"p99={lat['p99_ms']:.2f} max={lat['max_ms']:.2f}"
+        )
+    print("\nPer stage (ms):")
+    for stage, st in report["stages"].items():
+        print(f"- {stage:<13} n={st['n']:<6} mean={st['mean_ms']:.3f} p95={st['p95_ms']:.3f} p99={st['p99_ms']:.3f}")
+    total = max(1, report["turns"])
+    print("\nModes:")
+    for mode, n in report["modes"].items():
+        print(f"- {mode}: {n} ({100.0 * n / total:.1f}%)")
+    print("\nModes by use case:")
+    for uc, modes in report["modes_by_use_case"].items():
+        print(f"- {uc}: " + ", ".join(f"{m}={n}" for m, n in modes.items()))
+    for err in report["errors"][:5]:
+        print(f"[ERROR] {err}")
+
+
+def make_replay_llm(
+    args: argparse.Namespace, make_client: Callable[[argparse.Namespace], Any] = make_chat_client
+) -> Tuple[Any, Optional[LLMPool]]:
+    """
+    The LLM shared by the replay's worker threads, and the pool to close after.
+    The stub is thread-safe; a llama.cpp or transformers model is not, so its
+    generations queue for `--llm_workers` instances, as on the chat server.
+    """
+    if args.llm_backend == "stub":
+        return make_client(args), None
+    pool = LLMPool(lambda: make_client(args), workers=args.llm_workers)
+    return PooledLLM(pool, "replay"), pool
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description="Replay scripted conversations through the chat turn pipeline under load.")
+    src = ap.add_mutually_exclusive_group()
+    src.add_argument("--conversations", default=None, help="JSONL of {conversation_id, use_case, turns: [...]}")
+    src.add_argument("--from_samples", default=str(DATA / "samples_unlabeled.jsonl"), help="Build conversations from samples JSONL")
+    ap.add_argument("--use_case", action="append", default=None, help="Only these use_case values (repeatable)")
+    ap.add_argument("--turns_per_conv", type=int, default=8)
+    ap.add_argument("--repeat", type=int, default=1, help="Replay the conversation set this many times")
+    ap.add_argument("--concurrency", type=int, default=8, help="Conversations in flight")
+    ap.add_argument("--rate", type=float, default=0.0, help="New conversations per second (0 = all at once)")
+    ap.add_argument("--seed", type=int, default=7)
+
+    ap.add_argument("--scorer", default="embed", choices=["embed", "stub"], help="Safety scorer (stub needs no model files)")
+    ap.add_argument("--safety_model", default="models/safe_violation_clf_embed.joblib")
+    ap.add_argument(
+        "--safety_backend", default="auto", choices=list(SAFETY_BACKENDS), help="auto = int8 ONNX export if present"
+    )
+    ap.add_argument("--embed_store", default="", help="Embedding store dir for the embed scorer ('' disables)")
+    add_safety_gate_args(ap)
+    add_intent_heads_args(ap)
+    ap.add_argument("--threshold", type=float, default=0.45)
+    ap.add_argument("--persona", default="friendly", choices=list(PERSONA_SYSTEM.keys()))
+    ap.add_argument("--bot_gender", default="random", choices=["female", "male", "nonbinary", "random"])
+    ap.add_argument("--memory_backend", default="json", choices=list(MEMORY_BACKENDS))
+    ap.add_argument("--memory_write_behind", action="store_true", help="Session memory saved in the background")
+    add_llm_backend_args(ap, default_backend="stub")
+    ap.add_argument("--llm_workers", type=int, default=1, help="Model instances for non-stub backends (each holds its own model + KV)")
+    ap.add_argument("--out", default=str(RESULTS_DIR / "replay_bench.json"), help="Report JSON path ('' = don't write)")
+    args = ap.parse_args()
+    check_llm_backend_args(ap, args)
+
+    if args.conversations:
+        conversations = load_conversations(Path(args.conversations))
+    else:
+        conversations = conversations_from_samples(Path(args.from_samples), max(1, args.turns_per_conv), args.use_case)
+    conversations = [
+        Conversation(f"{c.conversation_id}#{r}" if r else c.conversation_id, c.turns, c.use_case)
+        for r in range(max(1, args.repeat))
+        for c in conversations
+    ]
+    if not conversations:
+        raise SystemExit("No conversations to replay.")
+
+    if args.scorer == "stub":
+        scorer: Any = ReplayStubScorer(seed=args.seed)
+    else:
+        scorer = SafetyEmbedScorer(args.safety_model, embed_store=args.embed_store or None, backend=args.safety_backend)
+        scorer = make_safety_gate(args, scorer)
+    print(f"[REPLAY] {describe_llm_backend(args)} scorer={args.scorer} gate={args.safety_gate}", flush=True)
+    llm, llm_pool = make_replay_llm(args)
+    engine = TurnEngine(scorer, llm, intent_heads=load_intent_heads(args))
+    settings = SessionSettings(
+        persona=args.persona,
+        threshold=args.threshold,
+        bot_gender=args.bot_gender,
+        memory_write_behind=args.memory_write_behind,
+        memory_backend=args.memory_backend,
+    )
+
+    try:
+        report = run_replay(conversations, engine, settings, concurrency=args.concurrency, rate=args.rate, seed=args.seed)
+    finally:
+        if llm_pool is not None:
+            llm_pool.close()
+    report["config"] = {k: v for k, v in vars(args).items() if k != "out"}
+    if isinstance(scorer, CascadeSafetyScorer):
+        report["safety_gate"] = dict(scorer.stats)
+    print_report(report)
+    if "safety_gate" in report:
+        gate = report["safety_gate"]
+        print(f"\nCascade: sparse={gate.get('sparse', 0)} embed={gate.get('embed', 0)}")
+    if args.out:
+        out = Path(args.out)
+        out.parent.mkdir(parents=True, exist_ok=True)
+        out.write_text(json.dumps(report, indent=2), encoding="utf-8")
+        print(f"\nWrote {out}")
+
+
+if __name__ == "__main__":
+    main()
@@ -2,7 +2,7 @@
 from __future__ import annotations
 
 import re
-from typing import List
+from typing import List, Optional, Tuple
 
 from src.personality import BotProfile
 
@@ -50,40 +50,76 @@ _IMPLAUSIBLE_KEYWORDS = [
     "spacewalk",
 ]
 
+_GROUNDED_LINE = "I haven't done anything that extreme, but I do like keeping things grounded."
+
+_SENTENCE_BREAK = re.compile(r"(?<=[.!?])\s+")
+
+
+_NAME_RX = [re.compile(p, re.IGNORECASE) for p in _NAME_PATTERNS]
+_GENDER_RX = [(re.compile(p, re.IGNORECASE), g) for p, g in _GENDER_PATTERNS]
+_PRONOUNS_RX = re.compile(r"my pronouns are\s+[a-z/]+", re.IGNORECASE)
+
+
+def _first_match(patterns: List[re.Pattern], text: str) -> Optional[Tuple[int, re.Match]]:
+    """(pattern index, match) of the earliest match in `text`; the earlier pattern wins a tie."""
+    best: Optional[Tuple[int, re.Match]] = None
+    for i, rx in enumerate(patterns):
+        m = rx.search(text)
+        if m and (best is None or m.start() < best[1].start()):
+            best = (i, m)
+    return best
+
+
+class _IdentityLock:
+    """
+    enforce_identity's decisions for one reply, kept across its sentences so a
+    streamed reply is rewritten exactly like the whole text. The first name claim
+    decides: a false token ("I'm sure") or the bot's own name leaves names alone,
+    any other name rewrites every claim of that form. Gender works the same way.
+    """
+
+    def __init__(self, bot_profile: BotProfile):
+        self.bot_profile = bot_profile
+        self._name_decided = False
+        self._name_rx: Optional[re.Pattern] = None
+        self._gender_decided = False
+        self._gender_rx: Optional[re.Pattern] = None
+
+    def apply(self, text: str) -> str:
+        profile = self.bot_profile
+        if not self._name_decided:
+            hit = _first_match(_NAME_RX, text)
+            if hit:
+                self._name_decided = True
+                claimed = hit[1].group(1).lower()
+                if claimed not in _FALSE_NAME_TOKENS and claimed != profile.name.lower():
+                    self._name_rx = _NAME_RX[hit[0]]
+        if self._name_rx is not None:
+            text = self._name_rx.sub(f"my name is {profile.name}", text)
+
+        if not self._gender_decided:
+            hit = _first_match([rx for rx, _ in _GENDER_RX], text)
+            if hit:
+                self._gender_decided = True
+                rx, gender = _GENDER_RX[hit[0]]
+                if gender != profile.gender:
+                    self._gender_rx = rx
+        if self._gender_rx is not None:
+            if profile.gender == "female":
+                replacement = "I am a woman"
+            elif profile.gender == "male":
+                replacement = "I am a man"
+            else:
+                replacement = "I am nonbinary"
+            text = self._gender_rx.sub(replacement, text)
+
+        if "my pronouns are" in text.lower():
+            text = _PRONOUNS_RX.sub(f"my pronouns are {profile.pronouns}", text)
+        return text
+
 
 def enforce_identity(reply: str, bot_profile: BotProfile) -> str:
-    text = reply or ""
-    name = bot_profile.name
-    for pat in _NAME_PATTERNS:
-        m = re.search(pat, text, flags=re.IGNORECASE)
-        if m:
-            claimed = m.group(1)
-            if claimed.lower() in _FALSE_NAME_TOKENS:
-                return text
-            if claimed.lower() != name.lower():
-                text = re.sub(pat, f"my name is {name}", text, flags=re.IGNORECASE)
-            break
-
-    for pat, gender in _GENDER_PATTERNS:
-        if re.search(pat, text, flags=re.IGNORECASE):
-            if gender != bot_profile.gender:
-                if bot_profile.gender == "female":
-                    replacement = "I am a woman"
-                elif bot_profile.gender == "male":
-                    replacement = "I am a man"
-                else:
-                    replacement = "I am nonbinary"
-                text = re.sub(pat, replacement, text, flags=re.IGNORECASE)
-            break
-
-    if "my pronouns are" in text.lower():
-        text = re.sub(
-            r"my pronouns are\s+[a-z/]+",
-            f"my pronouns are {bot_profile.pronouns}",
-            text,
-            flags=re.IGNORECASE,
-        )
-    return text
+    return _IdentityLock(bot_profile).apply(reply or "")
 
 
 def reality_guard(reply: str, bot_profile: BotProfile) -> str:
@@ -92,21 +128,19 @@ def reality_guard(reply: str, bot_profile: BotProfile) -> str:
     if not any(k in lower for k in _IMPLAUSIBLE_KEYWORDS):
         return text
 
-    sentences = re.split(r"(?<=[.!?])\s+", text)
+    sentences = _SENTENCE_BREAK.split(text)
     cleaned: List[str] = []
     replaced = False
     for s in sentences:
         if any(k in s.lower() for k in _IMPLAUSIBLE_KEYWORDS):
             if not replaced:
-                cleaned.append(
-                    "I haven't done anything that extreme, but I do like keeping things grounded."
-                )
+                cleaned.append(_GROUNDED_LINE)
                 replaced = True
             continue
         cleaned.append(s)
 
     if not cleaned:
-        return "I haven't done anything that extreme, but I do like keeping things grounded."
+        return _GROUNDED_LINE
     return " ".join(cleaned).strip()
 
 
@@ -114,8 +148,71 @@ def strip_questions(reply: str) -> str:
     text = reply or ""
     if "?" not in text:
         return text
-    sentences = re.split(r"(?<=[.!?])\s+", text)
+    sentences = _SENTENCE_BREAK.split(text)
     kept = [s for s in sentences if "?" not in s]
     if kept:
         return " ".join(kept).strip()
     return re.sub(r"\?+", ".", text).strip()
+
+
+class StreamingGuard:
+    """
+    Sentence-level version of enforce_identity -> reality_guard -> strip_questions
+    for streamed replies. Only the sentence currently being generated is held back;
+    each completed sentence is guarded and returned from feed() ready to print.
+    Identity decisions carry over between sentences, so text() matches the batch
+    guards on the same reply.
+    """
+
+    def __init__(self, bot_profile: BotProfile, ask_question: bool = True):
+        self.bot_profile = bot_profile
+        self.ask_question = ask_question
+        self._identity = _IdentityLock(bot_profile)
+        self._buf = ""
+        self._replaced = False
+        self._emitted: List[str] = []
+        self._held_questions: List[str] = []
+
+    def _guard(self, sentence: str) -> Optional[str]:
+        s = self._identity.apply(sentence)
+        if any(k in s.lower() for k in _IMPLAUSIBLE_KEYWORDS):
+            if self._replaced:
+                return None
+            self._replaced = True
+            s = _GROUNDED_LINE
+        if not self.ask_question and "?" in s:
+            # held until finish(): only used if every sentence was a question
+            self._held_questions.append(s)
+            return None
+        self._emitted.append(s)
+        return s
+
+    def feed(self, chunk: str) -> List[str]:
+        self._buf += chunk or ""
+        ready: List[str] = []
+        while True:
+            m = _SENTENCE_BREAK.search(self._buf)
+            if not m:
+                break
+            sentence = self._buf[: m.start()].strip()
+            self._buf = self._buf[m.end() :]
+            guarded = self._guard(sentence) if sentence else None
+            if guarded:
+                ready.append(guarded)
+        return ready
+
+    def finish(self) -> List[str]:
+        ready: List[str] = []
+        tail = self._buf.strip()
+        self._buf = ""
+        guarded = self._guard(tail) if tail else None
+        if guarded:
+            ready.append(guarded)
+        if not self._emitted and self._held_questions:
+            fallback = re.sub(r"\?+", ".", " ".join(self._held_questions)).strip()
+            self._emitted.append(fallback)
+            ready.append(fallback)
+        return ready
+
+    def text(self) -> str:
+        return " ".join(self._emitted).strip()
@@ -0,0 +1,137 @@
+# src/rubric_columns.py
+from __future__ import annotations
+
+from bisect import bisect_left
+from typing import Any, Dict, Iterable, List, Sequence
+
+import numpy as np
+
+RUBRIC_KEYS = ["ENG", "CTX", "TONE", "CLAR", "SAFE", "MOVE"]
+
+# v0 heuristic keyword lists (substring matches on the lowercased, stripped text)
+INTERROGATIVES = ["what", "how", "why", "where", "when"]  # whole whitespace-separated tokens
+CTX_CUES = ["berlin", "your bio", "profile"]
+RUDE_MARKERS = ["whatever", "shut up", "idiot", "stupid", "bitch"]
+OBJECTIFYING = ["hot", "sexy", "tits"]
+POLITE_MARKERS = ["please", "thanks", "no worries", "fair", "totally"]
+UNSAFE_MARKERS = [
+    "come over tonight",
+    "send nudes",
+    "don't be shy",
+    "you owe",
+    "why not",
+    "stop being",
+    "sensitive",
+    "where do you live exactly",
+]
+RESPECT_MARKERS = ["fair", "no worries", "take it slow", "comfortable", "all good"]
+DATE_MARKERS = ["coffee", "walk", "meet", "grab a"]
+
+_SEP = "\x00"  # row separator in the joined corpus; no keyword contains it
+
+
+def _is_gap(ch: str) -> bool:
+    return ch == _SEP or ch.isspace()
+
+
+class _Corpus:
+    """
+    The distinct lowercased texts of a column joined by _SEP. A keyword set is
+    scanned with one str.find pass per keyword over the whole corpus
+    (CPython's fastsearch, faster than an `re` alternation here); once a row
+    hits, the rest of that row is skipped, so Python runs once per hit row.
+    """
+
+    def __init__(self, texts: Sequence[str]):
+        self.n = len(texts)
+        self.text = _SEP.join(texts)
+        if self.text.count(_SEP) != max(0, self.n - 1):
+            self.text = _SEP.join(t.replace(_SEP, "\x01") for t in texts)
+        lengths = np.fromiter(map(len, texts), dtype=np.int64, count=self.n)
+        self.ends: List[int] = (np.cumsum(lengths + 1) - 1).tolist()  # each row's separator (or end of text)
+
+    def rows_containing(self, keywords: Iterable[str], token: bool = False) -> np.ndarray:
+        """Rows with any keyword as a substring (token=True: as a whole whitespace-separated token)."""
+        hit = bytearray(self.n)
+        text, ends, find = self.text, self.ends, self.text.find
+        for kw in keywords:
+            i = find(kw)
+            while i >= 0:
+                row = bisect_left(ends, i)
+                j = i + len(kw)
+                if token and ((i > 0 and not _is_gap(text[i - 1])) or (j < len(text) and not _is_gap(text[j]))):
+                    i = find(kw, i + 1)
+                    continue
+                hit[row] = 1
+                i = find(kw, ends[row] + 1)
+        return np.frombuffer(bytes(hit), dtype=np.uint8).astype(bool)
+
+
+def _persona_keys(persona: Dict[str, Any]) -> List[str]:
+    """Lowercased name (if any) and interests; a hit on any of them gives CTX=2."""
+    keys = [str(it).lower() for it in persona.get("interests", [])]
+    name = persona.get("name", "").lower()
+    return keys + [name] if name else keys
+
+
+def score_columns(
+    texts: Sequence[str],
+    use_cases: Sequence[str],
+    persona_ids: Sequence[str],
+    persona_by_id: Dict[str, Dict[str, Any]],
+) -> Dict[str, np.ndarray]:
+    """
+    Rubric scores for whole columns; identical to run_batch_v0.score_message
+    row by row. Each distinct text is scanned once: every keyword list is
+    searched over the joined corpus, and the per-row rules are NumPy selects
+    over the hits broadcast back to the rows.
+    """
+    n = len(texts)
+    stripped: List[str] = list(map(str.strip, texts))
+    codes: Dict[str, int] = {}
+    inv = np.fromiter((codes.setdefault(t, len(codes)) for t in stripped), dtype=np.int64, count=n)
+    distinct = list(codes)
+    lowered = list(map(str.lower, distinct))
+    corpus = _Corpus(lowered)
+    lengths = np.fromiter(map(len, distinct), dtype=np.int64, count=len(distinct))[inv]
+    uc = np.asarray(use_cases, dtype=object)
+
+    def has(keywords: Iterable[str], token: bool = False) -> np.ndarray:
+        return corpus.rows_containing(keywords, token=token)[inv]
+
+    clar = np.where((lengths == 0) | (lengths > 250), 0, np.where(lengths < 12, 1, 2))
+    eng = np.where(has(["?"]) | has(INTERROGATIVES, token=True), 2, np.where(lengths >= 12, 1, 0))
+
+    # name/interests: each persona's keywords only scan the distinct texts of its own rows
+    pids = np.asarray(persona_ids, dtype=object)
+    persona_hit = np.zeros(n, dtype=bool)
+    for pid in set(persona_ids):
+        rows = np.flatnonzero(pids == pid)
+        keys = _persona_keys(persona_by_id[pid])
+        if "" in keys:  # an empty interest is a substring of every text
+            persona_hit[rows] = True
+        elif keys:
+            own = np.unique(inv[rows])
+            own_hit = np.zeros(len(distinct), dtype=bool)
+            own_hit[own] = _Corpus([lowered[c] for c in own.tolist()]).rows_containing(keys)
+            persona_hit[rows] = own_hit[inv[rows]]
+    ctx = np.where(persona_hit, 2, np.where(has(CTX_CUES), 1, 0))
+
+    tone = np.where(has(RUDE_MARKERS + OBJECTIFYING), 0, np.where(has(POLITE_MARKERS), 2, 1))
+
+    boundary = uc == "UC4_BOUNDARY"
+    safe = np.where(has(UNSAFE_MARKERS), 0, np.where(boundary & has(RESPECT_MARKERS), 2, 1))
+
+    move = np.select(
+        [uc == "UC1_COLD_OPEN", uc == "UC2_KEEP_GOING", uc == "UC3_SUGGEST_DATE", boundary],
+        [
+            np.where(eng >= 1, 2, 1),
+            np.where((eng >= 1) & (lengths >= 12), 2, np.where(lengths >= 8, 1, 0)),
+            np.where(has(DATE_MARKERS) & (safe != 0), 2, 1),
+            np.where(safe == 2, 2, np.where(safe == 0, 0, 1)),
+        ],
+        default=1,
+    )
+
+    cols = {"ENG": eng, "CTX": ctx, "TONE": tone, "CLAR": clar, "SAFE": safe, "MOVE": move}
+    return {k: v.astype(np.int8) for k, v in cols.items()}
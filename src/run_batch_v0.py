@@ -1,17 +1,31 @@
 #!/usr/bin/env python3
 import argparse
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
 import json
+import os
 import time
 from pathlib import Path
-from typing import Dict, Any, List
+from typing import Dict, Any, List, Optional, Tuple
+
+from src.rubric_columns import (
+    CTX_CUES,
+    DATE_MARKERS,
+    INTERROGATIVES,
+    OBJECTIFYING,
+    POLITE_MARKERS,
+    RESPECT_MARKERS,
+    RUBRIC_KEYS,
+    RUDE_MARKERS,
+    UNSAFE_MARKERS,
+    score_columns,
+)
 
 ROOT = Path(__file__).resolve().parents[1]
 DATA = ROOT / "data"
 RESULTS_DIR = DATA / "results"
 RESULTS_DIR.mkdir(parents=True, exist_ok=True)
 
-RUBRIC_KEYS = ["ENG", "CTX", "TONE", "CLAR", "SAFE", "MOVE"]
-
 
 def read_json(path: Path):
     return json.loads(path.read_text(encoding="utf-8"))
@@ -49,7 +63,7 @@ def score_message(user_text: str, persona: Dict[str, Any], context: Dict[str, An
         clar = 2
 
     # ENG: question mark or interrogatives
-    eng = 2 if ("?" in t or any(w in tl.split() for w in ["what", "how", "why", "where", "when"])) else (1 if len(t) >= 12 else 0)
+    eng = 2 if ("?" in t or any(w in tl.split() for w in INTERROGATIVES)) else (1 if len(t) >= 12 else 0)
 
     # CTX: references persona name or interests or profile cues
     ctx = 0
@@ -62,25 +76,22 @@ def score_message(user_text: str, persona: Dict[str, Any], context: Dict[str, An
                 hits += 1
         if hits >= 1:
             ctx = 2
-        elif any(k in tl for k in ["berlin", "your bio", "profile"]):
+        elif any(k in tl for k in CTX_CUES):
             ctx = 1
 
     # TONE: crude detection
-    rude_markers = ["whatever", "shut up", "idiot", "stupid", "bitch"]
-    objectifying = ["hot", "sexy", "tits"]
-    if any(x in tl for x in rude_markers) or any(x in tl for x in objectifying):
+    if any(x in tl for x in RUDE_MARKERS) or any(x in tl for x in OBJECTIFYING):
         tone = 0
-    elif any(x in tl for x in ["please", "thanks", "no worries", "fair", "totally"]):
+    elif any(x in tl for x in POLITE_MARKERS):
         tone = 2
     else:
         tone = 1
 
     # SAFE: boundary pressure / coercion heuristics
-    unsafe_markers = ["come over tonight", "send nudes", "don't be shy", "you owe", "why not", "stop being", "sensitive", "where do you live exactly"]
-    if any(x in tl for x in unsafe_markers):
+    if any(x in tl for x in UNSAFE_MARKERS):
         safe = 0
     else:
-        if context.get("use_case") == "UC4_BOUNDARY" and any(x in tl for x in ["fair", "no worries", "take it slow", "comfortable", "all good"]):
+        if context.get("use_case") == "UC4_BOUNDARY" and any(x in tl for x in RESPECT_MARKERS):
             safe = 2
         else:
             safe = 1
@@ -92,7 +103,7 @@ def score_message(user_text: str, persona: Dict[str, Any], context: Dict[str, An
     elif uc == "UC2_KEEP_GOING":
         move = 2 if eng >= 1 and len(t) >= 12 else 1 if len(t) >= 8 else 0
     elif uc == "UC3_SUGGEST_DATE":
-        move = 2 if any(x in tl for x in ["coffee", "walk", "meet", "grab a"]) and safe != 0 else 1
+        move = 2 if any(x in tl for x in DATE_MARKERS) and safe != 0 else 1
     elif uc == "UC4_BOUNDARY":
         move = 2 if safe == 2 else 0 if safe == 0 else 1
     else:
@@ -106,6 +117,248 @@ def ocq(scores: Dict[str, int]) -> float:
     return total / 12.0
 
 
+def _base_row(
+    s: Dict[str, Any],
+    persona_by_id: Dict[str, Dict[str, Any]],
+    context_by_id: Dict[str, Dict[str, Any]],
+    run_id: str,
+) -> Tuple[Dict[str, Any], Optional[Dict[str, Any]]]:
+    """(row without scores, context) for a sample, or (error row, None)."""
+    sample_id = s["sample_id"]
+    context_id = s["context_id"]
+    user_text = s["user_text"]
+    use_case = s.get("use_case", "UNKNOWN")
+
+    ctx = context_by_id.get(context_id)
+    if ctx is None:
+        # If contexts are missing, still record a row with errors
+        return {
+            "run_id": run_id,
+            "sample_id": sample_id,
+            "context_id": context_id,
+            "use_case": use_case,
+            "error": f"Missing context_id={context_id}"
+        }, None
+
+    persona_id = ctx["persona_id"]
+    persona = persona_by_id.get(persona_id)
+    if persona is None:
+        return {
+            "run_id": run_id,
+            "sample_id": sample_id,
+            "context_id": context_id,
+            "use_case": use_case,
+            "persona_id": persona_id,
+            "error": f"Missing persona_id={persona_id}"
+        }, None
+
+    return {
+        "run_id": run_id,
+        "sample_id": sample_id,
+        "context_id": context_id,
+        "use_case": ctx.get("use_case", use_case),
+        "persona_id": persona_id,
+        "user_text": user_text,
+    }, ctx
+
+
+def _finish_row(row: Dict[str, Any], scores: Dict[str, int]) -> Dict[str, Any]:
+    row["scores"] = scores
+    row["ocq"] = ocq(scores)
+    row["safe_violation"] = 1 if scores["SAFE"] == 0 else 0
+    row["timestamp"] = time.strftime("%Y-%m-%dT%H:%M:%S")
+    return row
+
+
+def score_sample(
+    s: Dict[str, Any],
+    persona_by_id: Dict[str, Dict[str, Any]],
+    context_by_id: Dict[str, Dict[str, Any]],
+    run_id: str,
+) -> Dict[str, Any]:
+    row, ctx = _base_row(s, persona_by_id, context_by_id, run_id)
+    if ctx is None:
+        return row
+    return _finish_row(row, score_message(row["user_text"], persona_by_id[row["persona_id"]], ctx))
+
+
+def score_samples(
+    samples: List[Dict[str, Any]],
+    persona_by_id: Dict[str, Dict[str, Any]],
+    context_by_id: Dict[str, Dict[str, Any]],
+    run_id: str,
+) -> List[Dict[str, Any]]:
+    """score_sample() for a whole batch, with the rubric computed column-wise by score_columns()."""
+    rows, todo, use_cases = [], [], []
+    for s in samples:
+        row, ctx = _base_row(s, persona_by_id, context_by_id, run_id)
+        if ctx is not None:
+            todo.append(row)
+            use_cases.append(ctx.get("use_case", "UNKNOWN"))
+        rows.append(row)
+    if todo:
+        cols = score_columns(
+            [r["user_text"] for r in todo], use_cases, [r["persona_id"] for r in todo], persona_by_id
+        )
+        values = [cols[k].tolist() for k in RUBRIC_KEYS]
+        for row, vals in zip(todo, zip(*values)):
+            _finish_row(row, dict(zip(RUBRIC_KEYS, vals)))
+    return rows
+
+
+# -------------------------
+# streaming mode: bounded memory, process pool, resumable
+# -------------------------
+_WORKER: Dict[str, Any] = {}
+
+
+def _init_worker(persona_by_id: Dict[str, Any], context_by_id: Dict[str, Any], run_id: str) -> None:
+    _WORKER.update(persona_by_id=persona_by_id, context_by_id=context_by_id, run_id=run_id)
+
+
+def _parse_sample(line: bytes) -> Dict[str, Any]:
+    s = json.loads(line)
+    if not isinstance(s, dict) or not isinstance(s.get("user_text"), str):
+        raise ValueError("expected an object with a string user_text")
+    for key in ("sample_id", "context_id"):
+        if key not in s:
+            raise KeyError(key)
+    return s
+
+
+def _score_lines(lines: List[bytes]) -> Tuple[str, int, Optional[Dict[str, Any]]]:
+    """One chunk of raw JSONL lines -> (output JSONL text, error rows, first error row)."""
+    samples: List[Dict[str, Any]] = []
+    unreadable: Dict[int, Dict[str, Any]] = {}
+    for i, line in enumerate(lines):
+        try:
+            samples.append(_parse_sample(line))
+        except (ValueError, KeyError) as exc:
+            unreadable[i] = {
+                "run_id": _WORKER["run_id"],
+                "error": f"Unreadable sample: {exc!r}",
+                "line": line[:200].decode("utf-8", "replace"),
+            }
+    scored = iter(score_samples(samples, _WORKER["persona_by_id"], _WORKER["context_by_id"], _WORKER["run_id"]))
+    out, n_err, first = [], 0, None
+    for i in range(len(lines)):
+        row = unreadable[i] if i in unreadable else next(scored)
+        if "error" in row:
+            n_err += 1
+            first = first or row
+        out.append(json.dumps(row, ensure_ascii=False) + "\n")
+    return "".join(out), n_err, first
+
+
+def checkpoint_path(out_path: Path) -> Path:
+    return out_path.with_name(out_path.name + ".ckpt.json")
+
+
+def save_checkpoint(path: Path, state: Dict[str, Any]) -> None:
+    tmp = path.with_name(path.name + ".tmp")
+    tmp.write_text(json.dumps(state, ensure_ascii=False, indent=2), encoding="utf-8")
+    os.replace(tmp, path)
+
+
+def _read_chunks(samples_path: Path, offset: int, chunk_rows: int, limit: Optional[int]):
+    """(lines, end byte offset) chunks of non-empty lines starting at byte `offset`."""
+    with samples_path.open("rb") as f:
+        f.seek(offset)
+        lines: List[bytes] = []
+        while limit is None or limit > 0:
+            line = f.readline()
+            if not line:
+                break
+            if line.strip():
+                lines.append(line.strip())
+                limit = None if limit is None else limit - 1
+            if len(lines) >= chunk_rows:
+                yield lines, f.tell()
+                lines = []
+        if lines:
+            yield lines, f.tell()
+
+
+def run_stream(
+    samples_path: Path,
+    out_path: Path,
+    persona_by_id: Dict[str, Dict[str, Any]],
+    context_by_id: Dict[str, Dict[str, Any]],
+    workers: int = 1,
+    chunk_rows: int = 5000,
+    resume: bool = False,
+    limit: int = 0,
+) -> Dict[str, Any]:
+    """
+    Scores `samples_path` chunk by chunk across `workers` processes, appending
+    each finished chunk to `out_path` in input order. After every chunk the
+    input byte offset and output size go to <out>.ckpt.json, so `resume`
+    truncates any half-written chunk and continues from the last one completed.
+    At most 2 * workers chunks are in flight.
+    """
+    ckpt = checkpoint_path(out_path)
+    state: Dict[str, Any] = {}
+    if resume and ckpt.exists():
+        state = json.loads(ckpt.read_text(encoding="utf-8"))
+        if state.get("samples") != str(samples_path):
+            raise ValueError(f"{ckpt} belongs to samples={state.get('samples')}, not {samples_path}")
+        if state.get("done"):
+            print(f"[RESUME] {out_path} is already complete ({state['rows']} rows)")
+            return state
+        print(f"[RESUME] {state['rows']} rows done; continuing at byte {state['offset']} of {samples_path}")
+    if not state:
+        state = {
+            "samples": str(samples_path),
+            "run_id": f"batch_{int(time.time())}",
+            "offset": 0,
+            "out_bytes": 0,
+            "rows": 0,
+            "errors": 0,
+            "first_error": None,
+            "done": False,
+        }
+
+    out_path.parent.mkdir(parents=True, exist_ok=True)
+    out = out_path.open("r+b" if state["out_bytes"] else "wb")
+    out.truncate(state["out_bytes"])
+    out.seek(state["out_bytes"])
+
+    remaining = max(0, limit - state["rows"]) if limit > 0 else None
+    chunks = _read_chunks(samples_path, state["offset"], max(1, chunk_rows), remaining)
+    initargs = (persona_by_id, context_by_id, state["run_id"])
+
+    def _commit(result: Tuple[str, int, Optional[Dict[str, Any]]], n: int, end: int) -> None:
+        text, n_err, first = result
+        out.write(text.encode("utf-8"))
+        out.flush()
+        os.fsync(out.fileno())
+        state.update(offset=end, out_bytes=out.tell(), rows=state["rows"] + n, errors=state["errors"] + n_err)
+        state["first_error"] = state["first_error"] or first
+        save_checkpoint(ckpt, state)
+
+    try:
+        if workers <= 1:
+            _init_worker(*initargs)
+            for lines, end in chunks:
+                _commit(_score_lines(lines), len(lines), end)
+        else:
+            with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=initargs) as pool:
+                pending: deque = deque()
+                for lines, end in chunks:
+                    pending.append((pool.submit(_score_lines, lines), len(lines), end))
+                    if len(pending) >= 2 * workers:
+                        fut, n, e = pending.popleft()
+                        _commit(fut.result(), n, e)
+                while pending:
+                    fut, n, e = pending.popleft()
+                    _commit(fut.result(), n, e)
+    finally:
+        out.close()
+    state["done"] = True
+    save_checkpoint(ckpt, state)
+    return state
+
+
 def main() -> None:
     parser = argparse.ArgumentParser(description="Batch-evaluate samples using v0 heuristic rubric scoring.")
     parser.add_argument("--personas", default=str(DATA / "personas.json"), help="Path to personas.json")
@@ -114,68 +367,42 @@ def main() -> None:
     parser.add_argument("--out", default=str(RESULTS_DIR / "v0_batch_results.jsonl"), help="Output JSONL path")
     parser.add_argument("--limit", type=int, default=0, help="Limit number of samples (0 = no limit)")
     parser.add_argument("--seed", type=int, default=7, help="Reserved for future deterministic sampling; v0 ignores this.")
+    parser.add_argument("--stream", action="store_true", help="Read, score and write chunk by chunk with a checkpoint")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="Scoring processes in --stream mode")
+    parser.add_argument("--chunk_rows", type=int, default=5000, help="Samples per chunk / checkpoint in --stream mode")
+    parser.add_argument("--resume", action="store_true", help="Continue a killed --stream run from <out>.ckpt.json")
     args = parser.parse_args()
 
     personas = read_json(Path(args.personas))
     contexts = read_jsonl(Path(args.contexts))
-    samples = read_jsonl(Path(args.samples))
 
     persona_by_id = {p["persona_id"]: p for p in personas}
     context_by_id = {c["context_id"]: c for c in contexts}
 
+    if args.stream or args.resume:
+        t0 = time.perf_counter()
+        state = run_stream(
+            Path(args.samples),
+            Path(args.out),
+            persona_by_id,
+            context_by_id,
+            workers=args.workers,
+            chunk_rows=args.chunk_rows,
+            resume=args.resume,
+            limit=args.limit,
+        )
+        print(f"Wrote {state['rows']} rows to: {args.out} ({time.perf_counter() - t0:.1f}s, workers={args.workers})")
+        if state["errors"]:
+            print(f"WARNING: {state['errors']} rows contain errors (missing context/persona). First error:")
+            print(json.dumps(state["first_error"], ensure_ascii=False, indent=2))
+        return
+
+    samples = read_jsonl(Path(args.samples))
     if args.limit and args.limit > 0:
         samples = samples[: args.limit]
 
     run_id = f"batch_{int(time.time())}"
-    rows_out = []
-
-    for s in samples:
-        sample_id = s["sample_id"]
-        context_id = s["context_id"]
-        user_text = s["user_text"]
-        use_case = s.get("use_case", "UNKNOWN")
-
-        ctx = context_by_id.get(context_id)
-        if ctx is None:
-            # If contexts are missing, still record a row with errors
-            rows_out.append({
-                "run_id": run_id,
-                "sample_id": sample_id,
-                "context_id": context_id,
-                "use_case": use_case,
-                "error": f"Missing context_id={context_id}"
-            })
-            continue
-
-        persona_id = ctx["persona_id"]
-        persona = persona_by_id.get(persona_id)
-        if persona is None:
-            rows_out.append({
-                "run_id": run_id,
-                "sample_id": sample_id,
-                "context_id": context_id,
-                "use_case": use_case,
-                "persona_id": persona_id,
-                "error": f"Missing persona_id={persona_id}"
-            })
-            continue
-
-        scores = score_message(user_text, persona, ctx)
-        ocq_val = ocq(scores)
-        safe_violation = 1 if scores["SAFE"] == 0 else 0
-
-        rows_out.append({
-            "run_id": run_id,
-            "sample_id": sample_id,
-            "context_id": context_id,
-            "use_case": ctx.get("use_case", use_case),
-            "persona_id": persona_id,
-            "user_text": user_text,
-            "scores": scores,
-            "ocq": ocq_val,
-            "safe_violation": safe_violation,
-            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
-        })
+    rows_out = score_samples(samples, persona_by_id, context_by_id, run_id)
 
     out_path = Path(args.out)
     write_jsonl(out_path, rows_out)
@@ -0,0 +1,149 @@
+# src/safety_cascade.py
+from __future__ import annotations
+
+import argparse
+from collections import Counter
+from dataclasses import asdict, dataclass
+import json
+from pathlib import Path
+import threading
+from typing import Any, Callable, Dict, List, Optional, Sequence, Union
+
+import joblib
+import numpy as np
+
+from src.embedding_store import normalize_text
+from src.safety_embed import SafetyScore
+
+ROOT = Path(__file__).resolve().parents[1]
+DEFAULT_BANDS = ROOT / "models" / "safety_cascade.json"
+SAFETY_GATES = ("embed", "cascade")
+
+
+@dataclass
+class CascadeBands:
+    """
+    Sparse-score bands fit by src.eval_safety_cascade for one embed threshold:
+    score < safe_below is SAFE, score >= move_above is MOVE (a value above 1
+    disables that band), anything in between goes to the embedding scorer.
+    """
+
+    safe_below: float
+    move_above: float
+    threshold: float
+    sparse_model: str
+    target_agreement: float = 0.0
+
+    def as_dict(self) -> Dict[str, Any]:
+        return asdict(self)
+
+    @classmethod
+    def load(cls, path: Union[str, Path]) -> "CascadeBands":
+        data = json.loads(Path(path).read_text(encoding="utf-8"))
+        return cls(**{k: data[k] for k in cls.__dataclass_fields__ if k in data})
+
+    def save(self, path: Union[str, Path], extra: Dict[str, Any]) -> None:
+        out = Path(path)
+        out.parent.mkdir(parents=True, exist_ok=True)
+        out.write_text(json.dumps({**self.as_dict(), **extra}, indent=2), encoding="utf-8")
+
+
+class SparseSafetyModel:
+    """The TF-IDF + LogReg bundle from train_safe_classifier.py, scored in one sparse matmul per batch."""
+
+    def __init__(self, model_path: Union[str, Path]):
+        bundle = joblib.load(model_path)
+        self.model_path = str(model_path)
+        self.vectorizer = bundle["vectorizer"]
+        self.model = bundle["model"]
+
+    def proba_many(self, texts: Sequence[str]) -> np.ndarray:
+        if not texts:
+            return np.zeros(0, dtype=np.float64)
+        X = self.vectorizer.transform([normalize_text(t) for t in texts])
+        return np.asarray(self.model.predict_proba(X)[:, 1], dtype=np.float64)
+
+
+class CascadeSafetyScorer:
+    """
+    Two-stage safety gate with the SafetyEmbedScorer interface. The sparse
+    model settles texts outside the uncertain band; only the band reaches
+    `embed`, which may be a BackgroundLoad, so turns the sparse model settles
+    never wait for the transformer to load. With a threshold other than the
+    one the bands were fit for, every text goes to `embed`.
+    """
+
+    def __init__(self, sparse: SparseSafetyModel, bands: CascadeBands, embed: Any):
+        self.sparse = sparse
+        self.bands = bands
+        self.embed = embed
+        self.stats: Counter = Counter()
+        self._lock = threading.Lock()
+        self._warned = False
+
+    @classmethod
+    def from_files(cls, bands_path: Union[str, Path], embed: Any) -> "CascadeSafetyScorer":
+        bands = CascadeBands.load(bands_path)
+        return cls(SparseSafetyModel(bands.sparse_model), bands, embed)
+
+    def _embed_scores(self, texts: Sequence[str], threshold: float) -> List[SafetyScore]:
+        scores = self.embed.score_many(texts, threshold=threshold)
+        for s in scores:
+            s.stage = "embed"
+        return scores
+
+    def score_many(self, texts: Sequence[str], threshold: float = 0.45) -> List[SafetyScore]:
+        if abs(threshold - self.bands.threshold) > 1e-9:
+            if not self._warned:
+                self._warned = True
+                print(f"[WARN] cascade bands were fit for threshold={self.bands.threshold:g}; using the embed gate only")
+            with self._lock:
+                self.stats["embed"] += len(texts)
+            return self._embed_scores(texts, threshold)
+
+        p = self.sparse.proba_many(texts)
+        out: List[Any] = [None] * len(texts)
+        escalate: List[int] = []
+        for i, pi in enumerate(p.tolist()):
+            if pi < self.bands.safe_below:
+                out[i] = SafetyScore(p_move=pi, label="SAFE", threshold=threshold, stage="sparse")
+            elif pi >= self.bands.move_above:
+                out[i] = SafetyScore(p_move=pi, label="MOVE", threshold=threshold, stage="sparse")
+            else:
+                escalate.append(i)
+        if escalate:
+            for i, s in zip(escalate, self._embed_scores([texts[i] for i in escalate], threshold)):
+                out[i] = s
+        with self._lock:
+            self.stats["sparse"] += len(texts) - len(escalate)
+            self.stats["embed"] += len(escalate)
+        return out
+
+    def score(self, text: str, threshold: float = 0.45) -> SafetyScore:
+        return self.score_many([text], threshold=threshold)[0]
+
+    @property
+    def embed_many(self) -> Optional[Callable[[Sequence[str]], np.ndarray]]:
+        """The embed scorer's embed_many, or None while it is still loading (callers fall back)."""
+        is_ready = getattr(self.embed, "is_ready", None)
+        if is_ready is not None and not is_ready():
+            return None
+        return getattr(self.embed, "embed_many", None)
+
+
+def add_safety_gate_args(ap: argparse.ArgumentParser) -> None:
+    """The cascade flags shared by the chatbot, the server and the replay bench."""
+    ap.add_argument(
+        "--safety_gate", default="embed", choices=list(SAFETY_GATES), help="cascade = TF-IDF bands before the embedder"
+    )
+    ap.add_argument("--cascade_bands", default=str(DEFAULT_BANDS), help="Bands from python -m src.eval_safety_cascade")
+
+
+def make_safety_gate(args: argparse.Namespace, embed: Any) -> Any:
+    """`embed` itself, or the cascade in front of it when --safety_gate cascade."""
+    if args.safety_gate != "cascade":
+        return embed
+    gate = CascadeSafetyScorer.from_files(args.cascade_bands, embed)
+    if abs(gate.bands.threshold - args.threshold) > 1e-9:
+        print(f"[WARN] {args.cascade_bands} was fit for threshold={gate.bands.threshold:g}, not {args.threshold:g}")
+    return gate
@@ -1,12 +1,20 @@
 # src/safety_embed.py
 from __future__ import annotations
 
-from dataclasses import dataclass
-from typing import Dict, Any
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from pathlib import Path
+import threading
+from typing import Dict, Any, List, Optional, Sequence, Tuple, Union
 
 import joblib
 import numpy as np
-from sentence_transformers import SentenceTransformer
+
+from src.embedding_store import EmbeddingStore, encode_with_store, normalize_text, text_key
+from src.safety_onnx import OnnxEmbedder, find_onnx_export
+
+SAFETY_BACKENDS = ("auto", "torch", "onnx")
+ONNX_STORE_SUFFIX = "@onnx-int8"  # quantized embeddings differ slightly; never mix them with fp32 ones
 
 
 @dataclass
@@ -14,9 +22,22 @@ class SafetyScore:
     p_move: float
     label: str
     threshold: float
+    stage: str = ""  # cascade gate: "sparse" (decided by TF-IDF, p_move is its score) or "embed"
+    # the gate's embedding of the text, for reuse later in the turn (memory retrieval);
+    # None for empty text and sparse decisions, never serialized
+    embedding: Optional[np.ndarray] = field(default=None, repr=False, compare=False)
 
     def as_dict(self) -> Dict[str, Any]:
-        return {"p_move": float(self.p_move), "label": self.label, "threshold": float(self.threshold)}
+        out = {"p_move": float(self.p_move), "label": self.label, "threshold": float(self.threshold)}
+        if self.stage:
+            out["stage"] = self.stage
+        return out
+
+
+def _clean_p(p: np.ndarray) -> np.ndarray:
+    # numerical safety
+    p = np.nan_to_num(np.asarray(p, dtype=np.float64), nan=0.0, posinf=0.0, neginf=0.0)
+    return np.clip(p, 0.0, 1.0)
 
 
 class SafetyEmbedScorer:
@@ -27,35 +48,182 @@ class SafetyEmbedScorer:
       - sentence_transformer: str
       - logreg: sklearn LogisticRegression
       - normalize_embeddings: bool (optional)
+
+    Embeddings are kept in a bounded LRU cache keyed by `text_key`, so repeated
+    texts (replays, retries, duplicate turns) skip the transformer entirely.
+    With `embed_store`, LRU misses are looked up in the shared on-disk
+    EmbeddingStore before encoding, and new encodings are appended to it.
+    One scorer can be shared by threads: the cache, store and embedder are
+    used under a lock.
+
+    backend="auto" prefers the int8 ONNX export next to the artifact (see
+    src.export_safety_onnx) when it exists, matches the artifact, passed its
+    recorded parity check and onnxruntime is installed; "torch" always uses
+    SentenceTransformer and "onnx" requires the export. The logreg head runs
+    on the embeddings either way, so the cache and store work unchanged (ONNX
+    embeddings get their own store directory).
     """
 
-    def __init__(self, model_path: str):
+    def __init__(
+        self,
+        model_path: str,
+        cache_size: int = 4096,
+        batch_size: int = 32,
+        max_batch_chars: int = 4096,
+        embed_store: Union[EmbeddingStore, str, Path, None] = None,
+        backend: str = "auto",
+    ):
         self.model_path = model_path
         self.artifact = joblib.load(model_path)
         self.embed_name = self.artifact["sentence_transformer"]
         self.clf = self.artifact["logreg"]
         self.normalize = bool(self.artifact.get("normalize_embeddings", True))
+        self.backend = self._load_embedder(backend)
+        self.cache_size = max(0, int(cache_size))
+        self.batch_size = max(1, int(batch_size))
+        self.max_batch_chars = max(1, int(max_batch_chars))
+        self._cache: "OrderedDict[str, np.ndarray]" = OrderedDict()
+        self._lock = threading.RLock()
+        if embed_store is not None and not isinstance(embed_store, EmbeddingStore):
+            store_name = self.embed_name if self.backend == "torch" else f"{self.embed_name}{ONNX_STORE_SUFFIX}"
+            embed_store = EmbeddingStore(store_name, self.normalize, root=Path(embed_store))
+        self.embed_store: Optional[EmbeddingStore] = embed_store
+
+    def _load_embedder(self, backend: str) -> str:
+        if backend not in SAFETY_BACKENDS:
+            raise ValueError(f"Unknown safety backend '{backend}' (expected one of {', '.join(SAFETY_BACKENDS)})")
+        if backend != "torch":
+            paths = find_onnx_export(self.model_path, require_parity=backend == "auto")
+            if paths is None and backend == "onnx":
+                raise FileNotFoundError(f"No ONNX export for {self.model_path}; run python -m src.export_safety_onnx")
+            if paths is not None:
+                try:
+                    self.embedder: Any = OnnxEmbedder(paths)
+                    parity = self.embedder.meta.get("parity") or {}
+                    print(
+                        f"[BOOT] safety embedder: {paths['onnx'].name} "
+                        f"(parity p95 drift={parity.get('p95_abs_drift', float('nan')):.4f}, "
+                        f"flips={parity.get('max_flip_rate', float('nan')):.2%} on n={parity.get('n', 0)})"
+                    )
+                    return "onnx"
+                except ImportError:
+                    if backend == "onnx":
+                        raise
+                    print("[WARN] onnxruntime/tokenizers not installed; using the torch safety embedder")
+        from sentence_transformers import SentenceTransformer  # imported here so SafetyScore needs no torch
+
         self.embedder = SentenceTransformer(self.embed_name)
+        return "torch"
+
+    def _cache_get(self, key: str) -> Optional[np.ndarray]:
+        vec = self._cache.get(key)
+        if vec is not None:
+            self._cache.move_to_end(key)
+        return vec
+
+    def _cache_put(self, key: str, vec: np.ndarray) -> None:
+        if self.cache_size <= 0:
+            return
+        self._cache[key] = vec
+        self._cache.move_to_end(key)
+        while len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)
+
+    def _micro_batches(self, texts: Sequence[str]) -> List[List[int]]:
+        # Length-sorted batches capped by count and total characters: similar
+        # lengths pad less, and a few long texts don't inflate a whole batch.
+        order = sorted(range(len(texts)), key=lambda i: len(texts[i]))
+        batches: List[List[int]] = []
+        batch: List[int] = []
+        chars = 0
+        for i in order:
+            n = len(texts[i])
+            if batch and (len(batch) >= self.batch_size or chars + n > self.max_batch_chars):
+                batches.append(batch)
+                batch, chars = [], 0
+            batch.append(i)
+            chars += n
+        if batch:
+            batches.append(batch)
+        return batches
+
+    def _encode(self, texts: Sequence[str]) -> np.ndarray:
+        out: List[Optional[np.ndarray]] = [None] * len(texts)
+        for batch in self._micro_batches(texts):
+            X = self.embedder.encode(
+                [texts[i] for i in batch],
+                batch_size=len(batch),
+                show_progress_bar=False,
+                convert_to_numpy=True,
+                normalize_embeddings=self.normalize,
+            )
+            for i, vec in zip(batch, X):
+                out[i] = np.asarray(vec, dtype=np.float32)
+        return np.stack(out)
+
+    def embed_many(self, texts: Sequence[str]) -> np.ndarray:
+        """Embeddings for `texts` (one row each); duplicates and cached texts are encoded once."""
+        with self._lock:
+            return self._embed_many(texts)
+
+    def _embed_many(self, texts: Sequence[str]) -> np.ndarray:
+        norm = [normalize_text(t) for t in texts]
+        keys = [text_key(t) for t in norm]
+        vecs: Dict[str, np.ndarray] = {}
+        missing: Dict[str, str] = {}
+        for key, text in zip(keys, norm):
+            if key in vecs or key in missing:
+                continue
+            vec = self._cache_get(key)
+            if vec is None:
+                missing[key] = text
+            else:
+                vecs[key] = vec
+        if missing:
+            encoded = encode_with_store(list(missing.values()), self.embed_store, self._encode)
+            for key, vec in zip(missing.keys(), encoded):
+                vecs[key] = vec
+                self._cache_put(key, vec)
+        if not keys:
+            return np.zeros((0, 0), dtype=np.float32)
+        return np.stack([vecs[k] for k in keys])
+
+    def predict_proba_many(self, texts: Sequence[str]) -> np.ndarray:
+        return self._proba_and_embeddings(texts)[0]
+
+    def _proba_and_embeddings(self, texts: Sequence[str]) -> Tuple[np.ndarray, List[Optional[np.ndarray]]]:
+        norm = [normalize_text(t) for t in texts]
+        p = np.zeros(len(norm), dtype=np.float64)
+        vecs: List[Optional[np.ndarray]] = [None] * len(norm)
+
+        # dedupe non-empty texts, embed once, run the logreg once on the stack
+        uniq: Dict[str, int] = {}
+        rows: List[int] = []
+        slots: List[int] = []
+        for i, text in enumerate(norm):
+            if not text:
+                continue
+            slots.append(uniq.setdefault(text, len(uniq)))
+            rows.append(i)
+        if not uniq:
+            return p, vecs
+
+        X = self.embed_many(list(uniq.keys()))
+        p_uniq = _clean_p(self.clf.predict_proba(X)[:, 1])
+        p[rows] = p_uniq[slots]
+        for i, slot in zip(rows, slots):
+            vecs[i] = X[slot]
+        return p, vecs
 
     def predict_proba_move(self, text: str) -> float:
-        text = (text or "").strip()
-        if not text:
-            return 0.0
-
-        X = self.embedder.encode(
-            [text],
-            batch_size=1,
-            show_progress_bar=False,
-            convert_to_numpy=True,
-            normalize_embeddings=self.normalize,
-        )
-        p_move = float(self.clf.predict_proba(X)[0, 1])
-        # numerical safety
-        if np.isnan(p_move) or np.isinf(p_move):
-            return 0.0
-        return max(0.0, min(1.0, p_move))
+        return float(self.predict_proba_many([text])[0])
+
+    def score_many(self, texts: Sequence[str], threshold: float = 0.45) -> List[SafetyScore]:
+        p, vecs = self._proba_and_embeddings(texts)
+        return [
+            SafetyScore(p_move=pi, label="MOVE" if pi >= threshold else "SAFE", threshold=threshold, embedding=vec)
+            for pi, vec in zip(p.tolist(), vecs)
+        ]
 
     def score(self, text: str, threshold: float = 0.45) -> SafetyScore:
-        p = self.predict_proba_move(text)
-        label = "MOVE" if p >= threshold else "SAFE"
-        return SafetyScore(p_move=p, label=label, threshold=threshold)
+        return self.score_many([text], threshold=threshold)[0]
@@ -0,0 +1,138 @@
+# src/safety_onnx.py
+from __future__ import annotations
+
+import hashlib
+import json
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Sequence, Union
+
+import numpy as np
+
+# Sidecar files written next to the joblib artifact by src.export_safety_onnx:
+#   <stem>.int8.onnx            embedder + mean pooling (+ L2 norm) + logreg head
+#   <stem>.int8.tokenizer.json  fast tokenizer of the sentence transformer
+#   <stem>.int8.json            meta (source artifact hash, pad/seq settings)
+ONNX_SUFFIX = ".int8"
+OUTPUT_NAMES = ["embedding", "p_move"]
+
+# --safety_backend auto only picks an export whose recorded parity check
+# (src.export_safety_onnx) stayed within these bounds against the torch scorer
+PARITY_MAX_P95_DRIFT = 0.02
+PARITY_MAX_FLIP_RATE = 0.01
+
+
+def onnx_paths(model_path: Union[str, Path], suffix: str = ONNX_SUFFIX) -> Dict[str, Path]:
+    p = Path(model_path)
+    base = p.with_name(p.stem + suffix)
+    return {
+        "onnx": base.with_name(base.name + ".onnx"),
+        "tokenizer": base.with_name(base.name + ".tokenizer.json"),
+        "meta": base.with_name(base.name + ".json"),
+    }
+
+
+def file_sha1(path: Union[str, Path]) -> str:
+    h = hashlib.sha1()
+    with Path(path).open("rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def find_onnx_export(model_path: Union[str, Path], require_parity: bool = False) -> Optional[Dict[str, Path]]:
+    """
+    The export for `model_path` if all its files exist and it was built from
+    this exact artifact; with `require_parity`, also only if its recorded
+    parity check against the torch scorer passed.
+    """
+    paths = onnx_paths(model_path)
+    if not all(p.exists() for p in paths.values()):
+        return None
+    meta = json.loads(paths["meta"].read_text(encoding="utf-8"))
+    if meta.get("source_sha1") != file_sha1(model_path):
+        print(f"[WARN] {paths['onnx']} was exported from a different {Path(model_path).name}; ignoring it")
+        return None
+    if require_parity and not (meta.get("parity") or {}).get("passed"):
+        state = "failed its" if meta.get("parity") else "has no"
+        print(
+            f"[WARN] {paths['onnx']} {state} parity check against the torch scorer; using torch "
+            "(python -m src.export_safety_onnx --skip_export re-runs it)"
+        )
+        return None
+    return paths
+
+
+def parity_summary(report: Dict[str, Any]) -> Dict[str, Any]:
+    """The part of a parity report kept in the export's meta, with the auto-selection verdict."""
+    n = max(1, int(report["n"]))
+    flip_rate = max((f["n"] / n for f in report["label_flips"].values()), default=0.0)
+    drift = report["drift"]
+    return {
+        "in_path": report["in_path"],
+        "n": int(report["n"]),
+        "p95_abs_drift": drift["p95_abs"],
+        "max_abs_drift": drift["max_abs"],
+        "max_flip_rate": flip_rate,
+        "passed": bool(report["n"]) and drift["p95_abs"] <= PARITY_MAX_P95_DRIFT and flip_rate <= PARITY_MAX_FLIP_RATE,
+    }
+
+
+def record_parity(paths: Dict[str, Path], report: Dict[str, Any]) -> Dict[str, Any]:
+    summary = parity_summary(report)
+    meta = json.loads(paths["meta"].read_text(encoding="utf-8"))
+    meta["parity"] = summary
+    paths["meta"].write_text(json.dumps(meta, indent=2), encoding="utf-8")
+    return summary
+
+
+class OnnxEmbedder:
+    """
+    onnxruntime stand-in for SentenceTransformer.encode() on the exported
+    graph: tokenizes with the saved fast tokenizer and returns the graph's
+    pooled embeddings. predict_proba() also returns the graph's own p(MOVE).
+    """
+
+    def __init__(self, paths: Dict[str, Path], intra_op_threads: int = 0):
+        import onnxruntime as ort
+        from tokenizers import Tokenizer
+
+        self.meta: Dict[str, Any] = json.loads(paths["meta"].read_text(encoding="utf-8"))
+        self.tokenizer = Tokenizer.from_file(str(paths["tokenizer"]))
+        self.tokenizer.enable_truncation(max_length=int(self.meta["max_seq_length"]))
+        self.tokenizer.enable_padding(pad_id=int(self.meta["pad_token_id"]), pad_token=self.meta["pad_token"])
+        opts = ort.SessionOptions()
+        opts.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        if intra_op_threads > 0:
+            opts.intra_op_num_threads = intra_op_threads
+        self.session = ort.InferenceSession(str(paths["onnx"]), opts, providers=["CPUExecutionProvider"])
+        self.input_names = [i.name for i in self.session.get_inputs()]
+
+    def _run(self, texts: Sequence[str]) -> List[np.ndarray]:
+        enc = self.tokenizer.encode_batch([str(t).strip() for t in texts])
+        feeds = {
+            "input_ids": np.asarray([e.ids for e in enc], dtype=np.int64),
+            "attention_mask": np.asarray([e.attention_mask for e in enc], dtype=np.int64),
+            "token_type_ids": np.asarray([e.type_ids for e in enc], dtype=np.int64),
+        }
+        return self.session.run(OUTPUT_NAMES, {name: feeds[name] for name in self.input_names})
+
+    def encode(
+        self,
+        sentences: Sequence[str],
+        batch_size: int = 32,
+        show_progress_bar: bool = False,
+        convert_to_numpy: bool = True,
+        normalize_embeddings: bool = False,
+    ) -> np.ndarray:
+        out = []
+        for start in range(0, len(sentences), max(1, batch_size)):
+            emb = self._run(sentences[start : start + batch_size])[0].astype(np.float32)
+            if normalize_embeddings:
+                emb /= np.maximum(np.linalg.norm(emb, axis=1, keepdims=True), 1e-12)
+            out.append(emb)
+        dim = int(self.meta.get("dim", 0))
+        return np.concatenate(out) if out else np.zeros((0, dim), dtype=np.float32)
+
+    def predict_proba(self, texts: Sequence[str], batch_size: int = 32) -> np.ndarray:
+        out = [self._run(texts[s : s + batch_size])[1] for s in range(0, len(texts), max(1, batch_size))]
+        return np.concatenate(out).astype(np.float64).reshape(-1) if out else np.zeros(0, dtype=np.float64)
@@ -1,29 +1,18 @@
 # src/safety_rules.py
 from __future__ import annotations
 
-import re
-from typing import Tuple
+from typing import Optional, Tuple
 
-# Small, high-precision patterns for obvious risky asks.
-# This is a lightweight override to catch cases the classifier may miss.
-_PATTERNS = [
-    r"\b(send|drop|share)\b.*\b(address|location|loc)\b",
-    r"\bwhat'?s your address\b",
-    r"\b(send|share)\b.*\b(your )?location\b",
-    r"\bcome over\b",
-    r"\bcome to (my|mine)\b",
-    r"\bmeet (me )?now\b",
-    r"\bno excuses\b",
-]
+from src.text_features import TurnFeatures, extract_features
 
-_COMPILED = [re.compile(p, re.IGNORECASE) for p in _PATTERNS]
+# Small, high-precision patterns for obvious risky asks live in the
+# "escalation" family of src.text_features.
+# This is a lightweight override to catch cases the classifier may miss.
 
 
-def obvious_escalation(text: str) -> Tuple[bool, str]:
-    t = (text or "").strip()
-    if not t:
+def obvious_escalation(text: str, features: Optional[TurnFeatures] = None) -> Tuple[bool, str]:
+    f = features or extract_features(text, ("escalation",))
+    pattern = f.first_pattern("escalation")
+    if pattern is None:
         return False, ""
-    for rx in _COMPILED:
-        if rx.search(t):
-            return True, f"matched:{rx.pattern}"
-    return False, ""
+    return True, f"matched:{pattern}"
@@ -1,8 +1,10 @@
 # src/safety_templates.py
 from __future__ import annotations
 
+from dataclasses import dataclass
 import random
-from typing import List
+import re
+from typing import Dict, List, Optional, Tuple
 
 from src.personality import BotProfile
 
@@ -34,8 +36,12 @@ EROTIC_ALLOWED_GUIDANCE = (
 )
 
 
+# used when a caller has no rng of its own (the turn engine passes the session's)
+_RNG = random.Random()
+
+
 def boundary_safe_reply(rng: random.Random | None = None) -> str:
-    rng = rng or random.Random()
+    rng = rng or _RNG
     base = rng.choice(SAFE_REDIRECTS)
     # occasionally append a softener (keeps it human, not robotic)
     if rng.random() < 0.35:
@@ -78,16 +84,77 @@ _ACK_TEMPLATES = [
 ]
 
 
+_PERSONA_REDIRECT = "Let’s keep it playful and comfy—what’s something you’re into outside the app?"
+
+# keyword -> index into _ACK_TOPICS. Keywords match as substrings (as the
+# per-topic `in` checks did): each search resumes one character after the last
+# hit so overlapping keywords are not skipped, and the earliest topic wins. No
+# keyword of one topic is a prefix of another topic's, so one hit per position
+# sees every topic.
+_ACK_INDEX: Dict[str, int] = {k: i for i, (keywords, _) in enumerate(_ACK_TOPICS) for k in keywords}
+_ACK_RX = re.compile("|".join(map(re.escape, _ACK_INDEX)))
+
+
 def _infer_ack(text: str) -> str:
     t = (text or "").lower()
-    for keywords, ack in _ACK_TOPICS:
-        if any(k in t for k in keywords):
-            return ack
+    topic: Optional[int] = None
+    m = _ACK_RX.search(t)
+    while m is not None:
+        i = _ACK_INDEX[m.group()]
+        if topic is None or i < topic:
+            topic = i
+            if i == 0:
+                break
+        m = _ACK_RX.search(t, m.start() + 1)
+    if topic is not None:
+        return _ACK_TOPICS[topic][1]
     if "body" in t:
         return "totally get it"
     return "thanks for sharing that"
 
 
+HUMOR_STYLES = ("dry", "playful", "none")
+# humor_style -> (probability, wrapper) applied to the ack
+_HUMOR_ACKS: Dict[str, Tuple[float, str]] = {
+    "playful": (0.35, "that’s kind of cute — {ack}"),
+    "dry": (0.20, "{ack}, noted"),
+}
+
+
+@dataclass(frozen=True)
+class TemplateRow:
+    """Every ack template x redirect for one (phase, strictness, humor) bucket, with only {ack} left to fill."""
+
+    humor_p: float
+    humor_ack: str
+    replies: Tuple[str, ...]
+    persona_replies: Tuple[str, ...]  # the flirty_adult_ok redirect, taken 25% of the time
+
+
+def _build_template_table() -> Dict[Tuple[str, str, str], TemplateRow]:
+    def fill(redirects: List[str]) -> Tuple[str, ...]:
+        return tuple(t.replace("{redirect}", r) for r in redirects for t in _ACK_TEMPLATES)
+
+    table: Dict[Tuple[str, str, str], TemplateRow] = {}
+    for phase_bucket, redirects in (("open", _REDIRECTS_OPEN), ("late", _REDIRECTS_LATE)):
+        for strict_bucket in ("normal", "firm"):
+            replies = fill(_REDIRECTS_FIRM if strict_bucket == "firm" else redirects)
+            for humor in HUMOR_STYLES:
+                p, wrapper = _HUMOR_ACKS.get(humor, (0.0, "{ack}"))
+                table[(phase_bucket, strict_bucket, humor)] = TemplateRow(p, wrapper, replies, fill([_PERSONA_REDIRECT]))
+    return table
+
+
+TEMPLATE_TABLE = _build_template_table()
+
+
+def template_row(phase: str, bot_profile: BotProfile, trust: float) -> TemplateRow:
+    phase_bucket = "open" if phase in {"OPENING", "RAPPORT"} else "late"
+    strict_bucket = "firm" if bot_profile.boundary_strictness >= 0.7 and trust < 0.6 else "normal"
+    humor = bot_profile.humor_style if bot_profile.humor_style in HUMOR_STYLES else "none"
+    return TEMPLATE_TABLE[(phase_bucket, strict_bucket, humor)]
+
+
 def boundary_safe_reply_contextual(
     user_text: str,
     phase: str,
@@ -96,25 +163,17 @@ def boundary_safe_reply_contextual(
     trust: float,
     rng: random.Random | None = None,
 ) -> str:
-    rng = rng or random.Random()
+    rng = rng or _RNG
+    row = template_row(phase, bot_profile, trust)
     ack = _infer_ack(user_text)
-    if bot_profile.humor_style == "playful" and rng.random() < 0.35:
-        ack = f"that’s kind of cute — {ack}"
-    if bot_profile.humor_style == "dry" and rng.random() < 0.20:
-        ack = f"{ack}, noted"
-
-    redirects = _REDIRECTS_OPEN if phase in {"OPENING", "RAPPORT"} else _REDIRECTS_LATE
-    if bot_profile.boundary_strictness >= 0.7 and trust < 0.6:
-        redirects = _REDIRECTS_FIRM
-    redirect = rng.choice(redirects)
-    if persona == "flirty_adult_ok" and rng.random() < 0.25:
-        redirect = "Let’s keep it playful and comfy—what’s something you’re into outside the app?"
-    template = rng.choice(_ACK_TEMPLATES)
-    return template.format(ack=ack, redirect=redirect)
+    if row.humor_p and rng.random() < row.humor_p:
+        ack = row.humor_ack.replace("{ack}", ack)
+    replies = row.persona_replies if persona == "flirty_adult_ok" and rng.random() < 0.25 else row.replies
+    return rng.choice(replies).replace("{ack}", ack)
 
 
 def soft_deflect_reply(rng: random.Random | None = None) -> str:
-    rng = rng or random.Random()
+    rng = rng or _RNG
     base = rng.choice(SOFT_DEFLECTS)
     if rng.random() < 0.30:
         base = f"{base} {rng.choice(SOFTENERS)}"
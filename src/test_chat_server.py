@@ -0,0 +1,172 @@
+# src/test_chat_server.py
+import argparse
+import asyncio
+import json
+import tempfile
+import threading
+from pathlib import Path
+
+from src.chat_server import ChatServer, FairQueue, LLMPool
+from src.llm_backends import StubChatClient, StubClientConfig
+from src.replay_bench import ReplayStubScorer
+
+
+def test_queue_round_robins_clients() -> None:
+    q = FairQueue()
+    for client_id, session_id in [("A", "a1"), ("A", "a2"), ("A", "a3"), ("B", "b1"), ("C", "c1"), ("B", "b2")]:
+        q.put(client_id, session_id, lambda _, sid=session_id: sid)
+    dropped = q.put("A", "a4", lambda _: "a4")
+    q.drop("a4")
+    assert dropped.cancelled() and len(q) == 6
+
+    order = []
+    while len(q):
+        job, _ = q.get()
+        order.append(job(None))
+    assert order == ["a1", "b1", "c1", "a2", "b2", "a3"]
+
+    q.close()
+    assert q.get() is None
+
+
+def _args() -> argparse.Namespace:
+    return argparse.Namespace(
+        turn_threads=2,
+        persona="friendly",
+        threshold=0.45,
+        bot_gender="random",
+        history_turns=6,
+        context_budget=0,
+        n_ctx=4096,
+        max_tokens=140,
+        memory_write_behind=False,
+        memory_backend="json",
+        session_ttl=1800.0,
+        phase_scorer="regex",
+        intent_heads="",
+    )
+
+
+async def _request(port: int, method: str, path: str, body=None):
+    reader, writer = await asyncio.open_connection("127.0.0.1", port)
+    data = json.dumps(body).encode("utf-8") if body is not None else b""
+    writer.write(f"{method} {path} HTTP/1.1\r\nHost: x\r\nContent-Length: {len(data)}\r\n\r\n".encode("latin-1") + data)
+    await writer.drain()
+    raw = await reader.read()
+    writer.close()
+    head, _, payload = raw.partition(b"\r\n\r\n")
+    status = int(head.split(b" ", 2)[1])
+    if b"Transfer-Encoding: chunked" not in head:
+        return status, json.loads(payload)
+    lines = []
+    while True:
+        size, _, rest = payload.partition(b"\r\n")
+        n = int(size, 16)
+        if n == 0:
+            return status, lines
+        lines.append(json.loads(rest[:n]))
+        payload = rest[n + 2 :]
+
+
+def test_streaming_turn_smoke() -> None:
+    async def run(tmp: Path):
+        pool = LLMPool(lambda: StubChatClient(StubClientConfig(seed=3)), workers=1)
+        app = ChatServer(_args(), ReplayStubScorer(seed=3), pool, memory_root=tmp)
+        server = await asyncio.start_server(app.handle, "127.0.0.1", 0)
+        port = server.sockets[0].getsockname()[1]
+        try:
+            status, created = await _request(port, "POST", "/sessions", {"seed": 7, "client_id": "test"})
+            assert status == 201 and app.sessions[created["session_id"]].llm.client_id == "test"
+            sid = created["session_id"]
+            status, lines = await _request(port, "POST", f"/sessions/{sid}/turns", {"text": "hey, how was your weekend?", "stream": True})
+            assert status == 200
+            *sentences, last = lines
+            assert sentences and all(set(s) == {"sentence"} for s in sentences)
+            assert last["turn"]["mode"] == "NORMAL"
+            assert last["turn"]["reply"] == " ".join(s["sentence"] for s in sentences)
+
+            status, health = await _request(port, "GET", "/health")
+            assert status == 200 and health["sessions"] == 1 and health["queued"] == 0
+            status, closed = await _request(port, "DELETE", f"/sessions/{sid}")
+            assert status == 200 and closed == {"closed": True}
+        finally:
+            server.close()
+            await server.wait_closed()
+            pool.close()
+            app.executor.shutdown(wait=True)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        asyncio.run(run(Path(tmp)))
+
+
+class _GatedStub(StubChatClient):
+    """Holds every generation until `gate` is set; `started` tells the test one is running."""
+
+    def __init__(self) -> None:
+        super().__init__(StubClientConfig(seed=3))
+        self.started = threading.Event()
+        self.gate = threading.Event()
+
+    def chat_stream(self, messages):
+        self.started.set()
+        self.gate.wait(10)
+        yield from super().chat_stream(messages)
+
+
+def test_close_during_queued_and_running_turns() -> None:
+    async def wait_for(cond) -> None:
+        for _ in range(500):
+            if cond():
+                return
+            await asyncio.sleep(0.01)
+        raise AssertionError("timed out")
+
+    async def run(tmp: Path):
+        stub = _GatedStub()
+        pool = LLMPool(lambda: stub, workers=1)
+        app = ChatServer(_args(), ReplayStubScorer(seed=3), pool, memory_root=tmp)
+        server = await asyncio.start_server(app.handle, "127.0.0.1", 0)
+        port = server.sockets[0].getsockname()[1]
+        try:
+            running = (await _request(port, "POST", "/sessions", {"seed": 1}))[1]["session_id"]
+            queued = (await _request(port, "POST", "/sessions", {"seed": 2}))[1]["session_id"]
+            hosted = app.sessions[running]
+            close_memory = hosted.session.close
+            closes = []
+            hosted.session.close = lambda: (closes.append(stub.gate.is_set()), close_memory())
+            turn = {"text": "hey, how was your weekend?", "stream": True}
+            running_turn = asyncio.ensure_future(_request(port, "POST", f"/sessions/{running}/turns", turn))
+            await wait_for(stub.started.is_set)
+            queued_turn = asyncio.ensure_future(_request(port, "POST", f"/sessions/{queued}/turns", turn))
+            await wait_for(lambda: len(pool.queue) == 1)
+
+            # the queued job is dropped; its stream must end instead of blocking the turn thread
+            assert await asyncio.wait_for(_request(port, "DELETE", f"/sessions/{queued}"), 5) == (200, {"closed": True})
+            status, lines = await asyncio.wait_for(queued_turn, 5)
+            assert status == 200 and lines == [{"turn": {"reply": "", "mode": "CLOSED"}}]
+
+            # the running turn keeps its memory store until it finishes
+            closing = asyncio.ensure_future(_request(port, "DELETE", f"/sessions/{running}"))
+            await asyncio.sleep(0.2)
+            assert not closing.done() and not closes
+            stub.gate.set()
+            status, lines = await asyncio.wait_for(running_turn, 5)
+            assert status == 200 and lines[-1]["turn"]["mode"] == "NORMAL"
+            assert await asyncio.wait_for(closing, 5) == (200, {"closed": True})
+            assert closes == [True] and not app.sessions
+        finally:
+            stub.gate.set()
+            server.close()
+            await server.wait_closed()
+            pool.close()
+            app.executor.shutdown(wait=True)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        asyncio.run(run(Path(tmp)))
+
+
+if __name__ == "__main__":
+    test_queue_round_robins_clients()
+    test_streaming_turn_smoke()
+    test_close_during_queued_and_running_turns()
+    print("ok")
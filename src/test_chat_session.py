@@ -0,0 +1,84 @@
+# src/test_chat_session.py
+import dataclasses
+import tempfile
+from pathlib import Path
+
+from src.chat_session import (
+    ChatSession,
+    SessionSettings,
+    build_system_context,
+    profile_prompt_block,
+    system_context_parts,
+)
+from src.conversation_phase import ConversationPhaseTracker
+from src.personality import get_profile
+from src.response_planner import StylePlan
+from src.trust import TrustState
+
+
+class _CountingTokens:
+    def __init__(self) -> None:
+        self.texts = []
+
+    def __call__(self, text: str) -> int:
+        self.texts.append(text)
+        return len(text.split())
+
+
+def _args(profile, memory_hooks=()):
+    phase = ConversationPhaseTracker().update("hi", "hey", "SAFE", False)
+    return (
+        phase,
+        profile,
+        list(memory_hooks),
+        False,
+        "male",
+        "unspecified",
+        TrustState(0.42, "suggestive"),
+        True,
+        StylePlan(plan="tease", ask_question=True, disclosure="I bake on Sundays"),
+    )
+
+
+def test_profile_block_is_rendered_once_per_profile() -> None:
+    profile = get_profile("random", "female")
+    block = profile_prompt_block(profile)
+    assert profile_prompt_block(profile) is block
+    assert block == (
+        f"bot_profile={profile.summary()}\n"
+        f"bio={' '.join(profile.bio)}\n"
+        f"photos={profile.photos_summary()}\n"
+        f"photos_prompt={profile.photos_prompt()}\n"
+    )
+    renamed = dataclasses.replace(profile, name="Someone Else")
+    assert "Someone Else" in profile_prompt_block(renamed) and profile_prompt_block(profile) is block
+
+    head, cached, tail = system_context_parts(*_args(profile, ["likes: jazz"]))
+    assert cached is block and head.startswith("SYSTEM CONTEXT (hidden):\nphase=")
+    assert tail.startswith("trust_level=0.42") and "memory=likes: jazz\n" in tail
+    assert head + block + tail == build_system_context(*_args(profile, ["likes: jazz"]))
+
+
+def test_session_counts_the_profile_block_once() -> None:
+    tokens = _CountingTokens()
+    with tempfile.TemporaryDirectory() as tmp:
+        session = ChatSession(SessionSettings(), get_profile("random", "female"), tokens, memory_root=Path(tmp))
+        for hooks in ([], ["likes: jazz"], ["job: nurse"]):
+            parts = system_context_parts(*_args(session.bot_profile, hooks))
+            assert session.system_context_tokens(parts) == tokens("".join(parts))
+        assert tokens.texts.count(profile_prompt_block(session.bot_profile)) == 1
+
+        session.switch_profile()
+        parts = system_context_parts(*_args(session.bot_profile))
+        session.system_context_tokens(parts)
+        assert tokens.texts[-2] == parts[1]  # new profile, counted again
+        session.memory.close()
+
+        session.history.add("user", "hey")
+        assert session.history.messages(reserve="a b c") == session.history.messages(reserve_tokens=3)
+
+
+if __name__ == "__main__":
+    test_profile_block_is_rendered_once_per_profile()
+    test_session_counts_the_profile_block_once()
+    print("ok")
@@ -0,0 +1,103 @@
+# src/test_context_window.py
+import random
+
+from src.context_window import MESSAGE_OVERHEAD_TOKENS, ContextWindow
+
+PERSONA = "You are a friendly match on a dating app."
+
+
+def _count(text: str) -> int:
+    return len(text.split())
+
+
+def _tokens(messages, reserve_tokens: int = 0) -> int:
+    total = sum(_count(m["content"]) + MESSAGE_OVERHEAD_TOKENS for m in messages)
+    return total + (reserve_tokens + MESSAGE_OVERHEAD_TOKENS if reserve_tokens else 0)
+
+
+def _say(rng: random.Random, i: int, who: str) -> str:
+    return f"{who} {i}. " + " ".join(f"w{rng.randint(0, 99)}" for _ in range(rng.randint(3, 40)))
+
+
+def _chat(window: ContextWindow, n: int, reserve_tokens: int = 0, seed: int = 0):
+    """Drives the window like TurnEngine; yields each turn's messages and the reply that preceded them."""
+    rng = random.Random(seed)
+    reply = None
+    for i in range(n):
+        window.add("user", _say(rng, i, "user"))
+        yield window.messages(reserve_tokens=reserve_tokens), reply
+        reply = {"role": "assistant", "content": _say(rng, i, "bot")}
+        window.add(**reply)
+
+
+def _verbatim(messages):
+    return [m for m in messages if m["role"] != "system"]
+
+
+def test_prompt_stays_within_budget() -> None:
+    window = ContextWindow(PERSONA, _count, budget_tokens=300, keep_turns=6, fold_every=2)
+    for messages, _ in _chat(window, 80, reserve_tokens=60):
+        assert _tokens(messages, 60) <= 300
+        assert _verbatim(messages)[0]["role"] == "user" and messages[-1]["role"] == "user"
+
+
+def test_prefix_changes_once_per_fold_block() -> None:
+    for budget in (100_000, 400):  # keep_turns bound, then token budget bound
+        window = ContextWindow(PERSONA, _count, budget_tokens=budget, keep_turns=4, fold_every=3)
+        prev, changes, turns = None, 0, 60
+        for messages, reply in _chat(window, turns, reserve_tokens=40):
+            if prev is not None and messages[: len(prev) + 1] != prev + [reply]:
+                changes += 1
+            prev = messages
+        assert 0 < changes <= turns // 3 + 3, (budget, changes)  # was 47 for 400 when every request folded
+
+
+def test_folds_keep_exchanges_whole() -> None:
+    window = ContextWindow(PERSONA, _count, keep_turns=2, fold_every=1)
+    window.add("user", "first message")  # no reply: generation failed
+    for i in range(12):
+        window.add("user", f"user {i}")
+        window.add("assistant", f"bot {i}")
+        assert window.turns[0].role == "user"
+    assert window.turns[0].content.startswith("user") and len(window.turns) <= 2 * (2 + 1)
+
+
+def test_summary_is_capped() -> None:
+    window = ContextWindow(PERSONA, _count, keep_turns=1, fold_every=1, summary_tokens=30)
+    for messages, _ in _chat(window, 40):
+        summary = [m for m in messages[1:] if m["role"] == "system"]
+        if summary:
+            assert _count(summary[0]["content"]) + MESSAGE_OVERHEAD_TOKENS <= 30
+    assert summary and "bot 37." in summary[0]["content"]  # newest folded turn is kept
+
+    window.reset("new persona")
+    assert window.turns == [] and window.messages() == [{"role": "system", "content": "new persona"}]
+
+
+def test_newest_turn_over_budget_is_cut() -> None:
+    window = ContextWindow(PERSONA, _count, budget_tokens=60, keep_turns=2, fold_every=1)
+    window.add("user", "hi")
+    window.add("assistant", "hey")
+    window.add("user", " ".join(f"word{i}" for i in range(200)))
+    messages = window.messages(reserve_tokens=10)
+    assert _tokens(messages, 10) <= 60
+    assert len(_verbatim(messages)) == 1 and messages[-1]["content"].startswith("word0 word1")
+    assert messages[-1]["content"].endswith("…")
+
+    tiny = ContextWindow(PERSONA, _count, budget_tokens=20)
+    tiny.add("user", "hello there")
+    try:
+        tiny.messages(reserve="far too much hidden context for this budget")
+    except ValueError:
+        pass
+    else:
+        raise AssertionError("expected ValueError")
+
+
+if __name__ == "__main__":
+    test_prompt_stays_within_budget()
+    test_prefix_changes_once_per_fold_block()
+    test_folds_keep_exchanges_whole()
+    test_summary_is_capped()
+    test_newest_turn_over_budget_is_cut()
+    print("ok")
@@ -0,0 +1,97 @@
+# src/test_conversation_phase.py
+import itertools
+import random
+from collections import deque
+
+import numpy as np
+
+from src.conversation_phase import (
+    ConversationPhase,
+    ConversationPhaseTracker,
+    phase_trajectories,
+    roll_window_code,
+    window_code_mean,
+)
+
+USER = [
+    "Hey, how was your week?",
+    "You're cute, and a little flirty too",
+    "I feel like we have a deep connection, I can be honest with you",
+    "Let's make out, I want you in bed, naked",
+    "Okay, that's too fast, slow down",
+    "Send me your location",
+]
+BOT = ["Ha, that's sweet.", "I feel the same, you're pretty playful.", "Let's keep it chill."]
+
+
+def _conversations(n: int, seed: int = 3):
+    rng = random.Random(seed)
+    out = []
+    for _ in range(n):
+        turns = []
+        for _ in range(rng.randint(1, 20)):
+            user = rng.choice(USER)
+            turns.append((user, rng.choice(BOT), "MOVE" if rng.random() < 0.1 else "SAFE", "location" in user))
+        out.append(turns)
+    return out
+
+
+def test_update_many_matches_sequential_updates() -> None:
+    conversations = _conversations(200)
+    phases, scores = ConversationPhaseTracker.update_many(conversations)
+    order = list(ConversationPhase)
+    for c, turns in enumerate(conversations):
+        tracker = ConversationPhaseTracker()
+        for t, turn in enumerate(turns):
+            state = tracker.update(*turn)
+            assert order[phases[c, t]] == state.phase
+            assert tuple(scores[c, t]) == (state.flirt_score, state.intimacy_score, state.erotic_score)
+        assert (phases[c, len(turns) :] == -1).all()
+
+
+def test_window_average_evicts_old_turns() -> None:
+    tracker = ConversationPhaseTracker(window=6)
+    state = tracker.update("you're cute, playful and flirty", "", "SAFE", False)
+    assert state.flirt_score == 1.0
+    for _ in range(5):
+        state = tracker.update("hi", "", "SAFE", False)
+    assert abs(state.flirt_score - 1.0 / 6) < 1e-12
+    state = tracker.update("hi", "", "SAFE", False)
+    assert state.flirt_score == 0.0
+
+
+def _baseline_means(hits, window: int):
+    """The original tracker's arithmetic: a deque of min(1, hits / 3.0) scores, averaged oldest first."""
+    scores = deque(maxlen=window)
+    for h in hits:
+        scores.append(min(1.0, h / 3.0))
+        yield sum(s for s in scores) / len(scores)
+
+
+def test_window_means_match_the_baseline_arithmetic() -> None:
+    for hits in itertools.product(range(4), repeat=7):
+        code = 0
+        for h, expected in zip(hits, _baseline_means(hits, 6)):
+            code = roll_window_code(code, h, 6)
+            assert window_code_mean(code) == expected, hits
+
+    # intimacy hits 0, 2, 3, 1 stay just under the INTIMATE threshold
+    tracker = ConversationPhaseTracker()
+    for text in ["hi", "I feel a deep connection", "I feel I can be honest, deep", "I feel"]:
+        state = tracker.update(text, "", "SAFE", False)
+    assert state.intimacy_score == 0.49999999999999994 and state.phase != ConversationPhase.INTIMATE
+
+    rng = np.random.default_rng(0)
+    hits = rng.integers(0, 4, size=(50, 30, 3))
+    lengths = np.full(50, 30)
+    _, scores = phase_trajectories(hits, np.zeros((50, 30), bool), np.zeros((50, 30), bool), lengths, 8)
+    for c in range(50):
+        for k in range(3):
+            assert scores[c, :, k].tolist() == list(_baseline_means(hits[c, :, k].tolist(), 8))
+
+
+if __name__ == "__main__":
+    test_update_many_matches_sequential_updates()
+    test_window_average_evicts_old_turns()
+    test_window_means_match_the_baseline_arithmetic()
+    print("ok")
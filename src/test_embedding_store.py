@@ -0,0 +1,84 @@
+# src/test_embedding_store.py
+import hashlib
+import multiprocessing as mp
+import tempfile
+from pathlib import Path
+
+import numpy as np
+
+from src.embedding_store import EmbeddingStore
+
+DIM = 8
+
+
+def _keys(lo: int, hi: int):
+    return [f"k{i:05d}" for i in range(lo, hi)]
+
+
+def _vecs(keys) -> np.ndarray:
+    """A vector that can only belong to its key."""
+    return np.stack(
+        [np.frombuffer(hashlib.sha256(k.encode()).digest()[: 4 * DIM], dtype=np.uint32) % 1000 for k in keys]
+    ).astype(np.float32)
+
+
+def _writer(root: str, offset: int, n: int, batch: int) -> None:
+    store = EmbeddingStore("m", root=Path(root))
+    for lo in range(offset, offset + n, batch):
+        keys = _keys(lo, lo + batch)
+        store.add_many(keys, _vecs(keys))
+
+
+def _assert_rows(store: EmbeddingStore, keys) -> None:
+    X, found = store.get_many(keys)
+    assert found.all()
+    assert np.array_equal(X, _vecs(keys))
+
+
+def test_two_stores_share_a_directory() -> None:
+    with tempfile.TemporaryDirectory() as tmp:
+        a = EmbeddingStore("m", root=Path(tmp))
+        b = EmbeddingStore("m", root=Path(tmp))
+        a.add_many(_keys(0, 10), _vecs(_keys(0, 10)))
+        b.add_many(_keys(5, 20), _vecs(_keys(5, 20)))  # overlaps a's rows, which b has not read yet
+        a.add_many(_keys(20, 1500), _vecs(_keys(20, 1500)))  # a grows the file under b's memmap
+        b.add_many(_keys(1500, 1600), _vecs(_keys(1500, 1600)))
+
+        for store in (a, b, EmbeddingStore("m", root=Path(tmp))):
+            _assert_rows(store, _keys(0, 1600) if store is not a else _keys(0, 1500))
+        assert len(EmbeddingStore("m", root=Path(tmp))) == 1600
+        assert len(a.index_path.read_text().splitlines()) == 1600
+
+
+def test_concurrent_writers() -> None:
+    ctx = mp.get_context("fork")
+    with tempfile.TemporaryDirectory() as tmp:
+        # overlapping key ranges, small batches, so appends and file growth interleave
+        procs = [ctx.Process(target=_writer, args=(tmp, offset, 1200, 7)) for offset in (0, 600, 900)]
+        for p in procs:
+            p.start()
+        for p in procs:
+            p.join(60)
+            assert p.exitcode == 0
+        store = EmbeddingStore("m", root=Path(tmp))
+        assert len(store) == len(store.index_path.read_text().splitlines())
+        _assert_rows(store, _keys(0, 2100))
+
+
+def test_torn_index_line_is_dropped() -> None:
+    with tempfile.TemporaryDirectory() as tmp:
+        store = EmbeddingStore("m", root=Path(tmp))
+        store.add_many(_keys(0, 3), _vecs(_keys(0, 3)))
+        with store.index_path.open("a") as f:
+            f.write("k000")  # interrupted append: no row count, no newline
+        reopened = EmbeddingStore("m", root=Path(tmp))
+        assert len(reopened) == 3
+        reopened.add_many(_keys(3, 5), _vecs(_keys(3, 5)))
+        _assert_rows(EmbeddingStore("m", root=Path(tmp)), _keys(0, 5))
+
+
+if __name__ == "__main__":
+    test_two_stores_share_a_directory()
+    test_concurrent_writers()
+    test_torn_index_line_is_dropped()
+    print("ok")
@@ -1,6 +1,18 @@
 # src/test_identity_guard.py
 from src.personality import get_profile
-from src.response_guards import enforce_identity
+from src.response_guards import StreamingGuard, enforce_identity, reality_guard, strip_questions
+
+REPLIES = [
+    "I'm Alex. Nice to meet you!",
+    "I'm good. I'm Alex, by the way.",  # false-name token first: names are left alone
+    "I'm Alex. I'm good, thanks.",  # a real claim first: every "I'm X" is rewritten
+    "Hey there. My name is Alex. I'm sure you'll like it.",
+    "I'm not sure. I am a woman and my pronouns are they/them.",
+    "I am a man. Later I'm a woman again? I am a man, honestly.",
+    "My name is Sam. I'm Alex. Ever climbed Everest? I was in the CIA. What about you?",
+    "Where are you from? What do you do?",
+    "I'm okay. I climbed Everest last year. I'm Alex!",
+]
 
 
 def test_name_lock() -> None:
@@ -24,8 +36,38 @@ def test_nonbinary_lock() -> None:
     assert "nonbinary" in fixed.lower(), fixed
 
 
+def _batch(reply: str, profile, ask_question: bool) -> str:
+    # the non-streaming path of TurnEngine
+    reply = reality_guard(enforce_identity(reply, profile), profile)
+    return reply if ask_question else strip_questions(reply)
+
+
+def _stream(reply: str, profile, ask_question: bool, step: int) -> str:
+    guard = StreamingGuard(profile, ask_question=ask_question)
+    for i in range(0, len(reply), step):
+        guard.feed(reply[i : i + step])
+    guard.finish()
+    return guard.text()
+
+
+def test_streaming_guard_matches_batch_guards() -> None:
+    for profile_id, gender in (("steady_anchor_f", "female"), ("warm_confident_m", "male"), ("nonbinary_nerd", "nonbinary")):
+        profile = get_profile(profile_id, gender)
+        for reply in REPLIES:
+            for ask_question in (True, False):
+                expected = _batch(reply, profile, ask_question)
+                for step in (1, 3, len(reply)):
+                    assert _stream(reply, profile, ask_question, step) == expected, (profile_id, reply, step)
+
+    profile = get_profile("steady_anchor_f", "female")
+    assert enforce_identity(REPLIES[1], profile) == REPLIES[1]
+    assert enforce_identity(REPLIES[2], profile) == "my name is June. my name is June, thanks."
+    assert enforce_identity("I'm not sure. I am a man.", profile) == "I'm not sure. I am a woman."
+
+
 if __name__ == "__main__":
     test_name_lock()
     test_gender_lock()
     test_nonbinary_lock()
+    test_streaming_guard_matches_batch_guards()
     print("[OK] identity guard tests passed")
@@ -0,0 +1,67 @@
+# src/test_intent_heads.py
+import tempfile
+from pathlib import Path
+
+import numpy as np
+from sklearn.linear_model import LogisticRegression
+
+from src.conversation_phase import ConversationPhase, ConversationPhaseTracker, intent_hits
+from src.intent_heads import INTENT_HEADS, IntentHeads, fit_heads, weak_labels
+
+
+def _clusters(seed: int = 0):
+    rng = np.random.default_rng(seed)
+    centers = rng.normal(size=(2, 16))
+    X = np.vstack([centers[0] + 0.1 * rng.normal(size=(20, 16)), centers[1] + 0.1 * rng.normal(size=(20, 16))])
+    Y = np.zeros((40, len(INTENT_HEADS)), dtype=bool)
+    Y[20:, INTENT_HEADS.index("flirt")] = True
+    Y[:3, INTENT_HEADS.index("consent")] = True  # too few positives to fit
+    return X.astype(np.float32), Y
+
+
+def test_weak_labels_add_category_priors() -> None:
+    Y = weak_labels(["you're cute", "you have a nice energy", "where do you live?"], ["", "mild_flirt", None])
+    flirt, loc = INTENT_HEADS.index("flirt"), INTENT_HEADS.index("location_request")
+    assert Y[:, flirt].tolist() == [True, True, False]
+    assert Y[:, loc].tolist() == [False, False, True]
+
+
+def test_heads_match_sklearn_and_round_trip() -> None:
+    X, Y = _clusters()
+    heads = fit_heads(X, Y, min_positives=5)
+    assert heads.heads == ["flirt"]  # consent has 3 positives, the rest none
+
+    clf = LogisticRegression(C=1.0, class_weight="balanced", max_iter=2000, random_state=42)
+    clf.fit(X, Y[:, INTENT_HEADS.index("flirt")].astype(np.int32))
+    assert np.allclose(heads.proba_many(X)[:, 0], clf.predict_proba(X)[:, 1], atol=1e-5)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        heads.save(Path(tmp) / "heads.joblib")
+        loaded = IntentHeads.load(Path(tmp) / "heads.joblib")
+    assert loaded.predict(X[25])["flirt"] > 0.5 > loaded.predict(X[5])["flirt"]
+    assert loaded.predict(None) is None and loaded.predict(np.zeros(8)) is None  # other embedder size
+
+
+def test_tracker_uses_intents_for_covered_families() -> None:
+    assert [intent_hits(p) for p in (0.2, 0.5, 0.7, 0.9, 1.0)] == [0, 1, 2, 3, 3]
+
+    regex, heads = ConversationPhaseTracker(), ConversationPhaseTracker()
+    for _ in range(3):
+        a = regex.update("you have a nice energy", "thanks!", "SAFE", False)
+        b = heads.update("you have a nice energy", "thanks!", "SAFE", False, intents={"flirt": 0.95})
+    assert a.phase == ConversationPhase.OPENING and a.flirt_score == 0.0
+    assert b.phase == ConversationPhase.FLIRTING and b.flirt_score == 1.0 and "flirt:head" in b.reason_tags
+
+    # families without a head keep their keyword detectors; the bot text is always scanned
+    state = ConversationPhaseTracker().update("i feel a real connection", "you're cute", "SAFE", False, intents={"flirt": 0.1})
+    assert state.intimacy_score == 2 / 3 and state.flirt_score == 1 / 3
+    assert ConversationPhaseTracker().update("hi", "hey", "SAFE", False, intents={"slowdown": 0.8}).reason_tags == [
+        "slowdown:head"
+    ]
+
+
+if __name__ == "__main__":
+    test_weak_labels_add_category_priors()
+    test_heads_match_sklearn_and_round_trip()
+    test_tracker_uses_intents_for_covered_families()
+    print("ok")
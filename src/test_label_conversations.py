@@ -0,0 +1,101 @@
+# src/test_label_conversations.py
+import random
+import tempfile
+from pathlib import Path
+
+from src.chat_session import ChatSession, SessionSettings
+from src.label_conversations import label_turns
+from src.llm_backends import StubChatClient, StubClientConfig
+from src.personality import get_profile
+from src.replay_bench import ReplayStubScorer
+from src.turn_engine import TurnEngine
+
+USER = [
+    "hey, how was your weekend?",
+    "I love bouldering and museums.",
+    "ok",
+    "lol",
+    "you're cute and a bit flirty",
+    "I feel like I can be honest with you, it feels meaningful",
+    "you're so hot, want to make out in bed?",
+    "yes, I want that, send nudes",
+    "okay, that's fair",
+    "what's your name?",
+    "/profile",
+    "send me your location and come over",
+    "too fast, slow down",
+    "I'm into jazz. My favorite city is Lisbon.",
+]
+
+
+def _online(n_conv: int, seed: int):
+    rng = random.Random(seed)
+    engine = TurnEngine(ReplayStubScorer(seed=seed), StubChatClient(StubClientConfig(seed=seed)))
+    table = {k: [] for k in ("conversation_id", "user_text", "bot_text", "safety_label", "mode")}
+    expected = []
+    with tempfile.TemporaryDirectory() as tmp:
+        for c in range(n_conv):
+            session = ChatSession(
+                SessionSettings(),
+                get_profile("random", "random", rng=rng),
+                count_tokens=engine.llm.count_tokens,
+                memory_id=f"conv{c}",
+                rng=rng,
+                session_id=f"conv{c}",
+                memory_root=Path(tmp),
+            )
+            for _ in range(rng.randint(1, 16)):
+                if session.closed:
+                    break
+                text = rng.choice(USER)
+                out = engine.step(session, text)
+                table["conversation_id"].append(f"conv{c}")
+                table["user_text"].append(text)
+                table["bot_text"].append(out.reply)
+                table["safety_label"].append(out.gate.label if out.gate is not None else "")
+                table["mode"].append(out.mode)
+                expected.append((out.gate is not None, session.tracker.last_state, session.trust_level, session.consent_state, out))
+            session.close()
+    return table, expected
+
+
+def test_batch_labels_match_online_engine() -> None:
+    table, expected = _online(60, seed=5)
+    labels = label_turns(table)
+    assert len(expected) > 200
+    for i, (labelled, phase, trust, consent, out) in enumerate(expected):
+        assert labels["labelled"][i] == labelled
+        assert labels["phase"][i] == phase.phase.value, i
+        assert labels["flirt_score"][i] == phase.flirt_score
+        assert labels["intimacy_score"][i] == phase.intimacy_score
+        assert labels["erotic_score"][i] == phase.erotic_score
+        assert labels["trust_level"][i] == trust, i
+        assert labels["consent_state"][i] == consent
+        if labelled:
+            assert labels["trust_reason"][i] == out.trust.last_reason
+            assert labels["memory_added"][i] == bool(out.added_items)
+
+
+def test_interleaved_rows_label_like_grouped_rows() -> None:
+    table, _ = _online(20, seed=9)
+    grouped = label_turns(table)
+    # round-robin over conversations, keeping each conversation's turn order
+    by_conv = {}
+    for i, cid in enumerate(table["conversation_id"]):
+        by_conv.setdefault(cid, []).append(i)
+    interleaved = []
+    while any(by_conv.values()):
+        for rows in by_conv.values():
+            if rows:
+                interleaved.append(rows.pop(0))
+    shuffled = {k: [v[i] for i in interleaved] for k, v in table.items()}
+    labels = label_turns(shuffled)
+    for j, i in enumerate(interleaved):
+        assert labels["phase"][j] == grouped["phase"][i]
+        assert labels["trust_level"][j] == grouped["trust_level"][i]
+
+
+if __name__ == "__main__":
+    test_batch_labels_match_online_engine()
+    test_interleaved_rows_label_like_grouped_rows()
+    print("ok")
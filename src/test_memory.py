@@ -0,0 +1,165 @@
+# src/test_memory.py
+import json
+import shutil
+import tempfile
+import time
+from pathlib import Path
+
+import numpy as np
+
+from src.memory import SemanticMemoryStore, SQLiteMemoryStore, top_k_similar
+
+TEXTS = [
+    "I love bouldering and museums.",
+    "I'm into jazz. My favorite city is Lisbon.",
+    "i LOVE BOULDERING and museums!",
+    "I work as a nurse. Please slow down a bit.",
+]
+
+VOCAB = ["bouldering", "museums", "jazz", "lisbon", "nurse", "climb", "music", "city", "hospital"]
+
+
+class _BagEmbedder:
+    """Deterministic stand-in for embed_many: vocabulary counts, with a few related words sharing a dimension."""
+
+    RELATED = {"climb": "bouldering", "music": "jazz", "city": "lisbon", "hospital": "nurse"}
+
+    def __init__(self) -> None:
+        self.calls = 0
+
+    def __call__(self, texts):
+        self.calls += 1
+        out = np.zeros((len(texts), len(VOCAB)), dtype=np.float32)
+        for row, text in enumerate(texts):
+            for word in text.lower().replace("?", " ").replace(":", " ").split():
+                word = self.RELATED.get(word, word)
+                if word in VOCAB:
+                    out[row, VOCAB.index(word)] += 1.0
+        return out + 0.01
+
+
+def test_write_behind_defers_and_flushes() -> None:
+    with tempfile.TemporaryDirectory() as tmp:
+        root = Path(tmp)
+        store = SemanticMemoryStore("wb", root=root, write_behind=True, flush_interval=60.0, flush_ops=1000)
+        added = store.update_from_text("I love bouldering and museums.")
+        store.update_trust(0.3, "none", "safe_turn")
+        assert added and not store.path.exists()
+
+        store.close()
+        saved = json.loads(store.path.read_text(encoding="utf-8"))
+        assert saved["meta"]["trust_level"] == 0.3
+        assert [i["value"] for i in saved["items"]] == [i.value for i in store.items]
+
+        reloaded = SemanticMemoryStore("wb", root=root)
+        assert [i.as_dict() for i in reloaded.items] == [i.as_dict() for i in store.items]
+
+
+def test_write_behind_flushes_at_op_threshold() -> None:
+    with tempfile.TemporaryDirectory() as tmp:
+        store = SemanticMemoryStore("ops", root=Path(tmp), write_behind=True, flush_interval=60.0, flush_ops=3)
+        for i in range(3):
+            store.update_trust(0.1 + i / 10, "none", "safe_turn")
+        deadline = time.monotonic() + 5.0
+        while not store.path.exists() and time.monotonic() < deadline:
+            time.sleep(0.01)
+        assert store.path.exists()
+        store.close()
+
+
+def test_write_behind_survives_a_failed_flush() -> None:
+    with tempfile.TemporaryDirectory() as tmp:
+        root = Path(tmp) / "memory"
+        store = SemanticMemoryStore("fail", root=root, write_behind=True, flush_interval=0.05, flush_ops=1000)
+        shutil.rmtree(root)  # every write fails until the directory is back
+        store.update_trust(0.4, "none", "safe_turn")
+        time.sleep(0.2)
+        assert store._dirty_ops == 1 and not store.path.exists()
+
+        root.mkdir()
+        store.update_trust(0.5, "none", "safe_turn")
+        deadline = time.monotonic() + 5.0
+        while not store.path.exists() and time.monotonic() < deadline:
+            time.sleep(0.01)
+        assert json.loads(store.path.read_text(encoding="utf-8"))["meta"]["trust_level"] == 0.5
+        store.close()
+
+
+def test_sqlite_store_matches_json_store() -> None:
+    with tempfile.TemporaryDirectory() as tmp:
+        root = Path(tmp)
+        js = SemanticMemoryStore("u1", root=root / "json")
+        db = SQLiteMemoryStore("u1", root=root / "db")
+        for text in TEXTS:
+            assert [i.value for i in js.update_from_text(text)] == [i.value for i in db.update_from_text(text)]
+            assert js.update_boundary(text) == db.update_boundary(text)
+            js.update_trust(0.2, "none", "safe_turn")
+            db.update_trust(0.2, "none", "safe_turn")
+        assert [(i.key, i.value) for i in js.items] == [(i.key, i.value) for i in db.items]
+        assert js.get_hooks(k=3) == db.get_hooks(k=3)
+        db.close()
+
+        reopened = SQLiteMemoryStore("u1", root=root / "db")
+        assert len(reopened.items) == len(js.items)
+        assert reopened.meta["boundaries"] == js.meta["boundaries"]
+        reopened.clear()
+        assert reopened.items == [] and SQLiteMemoryStore("u1", root=root / "db").items == []
+
+
+def test_sqlite_store_imports_json_memory() -> None:
+    with tempfile.TemporaryDirectory() as tmp:
+        root = Path(tmp)
+        js = SemanticMemoryStore("u2", root=root)
+        js.update_from_text(TEXTS[1])
+        js.update_trust(0.4, "implicit", "safe_turn")
+        db = SQLiteMemoryStore("u2", root=root)
+        assert [i.as_dict() for i in db.items] == [i.as_dict() for i in js.items]
+        assert db.meta["trust_level"] == 0.4
+        db.close()
+
+
+def test_top_k_similar_orders_by_cosine() -> None:
+    m = np.eye(3, dtype=np.float16)
+    assert top_k_similar(m, np.array([0.1, 0.9, 0.4]), 2) == [1, 2]
+    assert top_k_similar(m, np.array([1.0, 1.0, 0.0]), 5) == [0, 1, 2]  # ties keep row order
+    assert top_k_similar(m[:0], np.ones(3), 2) == []
+
+
+def test_hooks_follow_the_current_turn() -> None:
+    with tempfile.TemporaryDirectory() as tmp:
+        root = Path(tmp)
+        embed = _BagEmbedder()
+        for store in (SemanticMemoryStore("r", root=root / "json"), SQLiteMemoryStore("r", root=root / "db")):
+            store.update_from_text(TEXTS[0], embed=embed)
+            store.update_from_text(TEXTS[1])  # stored without embeddings, filled in on retrieval
+            store.update_from_text("I work as a nurse.", embed=embed)
+            assert store.items[0].embedding.dtype == np.float16
+
+            assert store.get_hooks(k=1, query="do you climb much?", embed=embed) == ["likes: bouldering and museums"]
+            assert store.get_hooks(k=1, query="what music do you play?", embed=embed) == ["likes: jazz"]
+            assert store.get_hooks(k=2, query="any hospital stories?") == store.get_highlights(k=2)  # no embedder
+            assert store.get_hooks(k=1, query="any hospital stories?", embed=embed) == ["job: nurse"]
+            assert all(i.embedding is not None for i in store.items)
+            store.close()
+
+        calls = embed.calls
+        for reopened in (SemanticMemoryStore("r", root=root / "json"), SQLiteMemoryStore("r", root=root / "db")):
+            assert reopened.get_hooks(k=1, query="best city for a weekend?", embed=embed) == ["favorite: Lisbon"]
+        assert embed.calls == calls + 2  # only the queries; item embeddings came back from disk
+
+        # a query vector from the safety gate is used as is: no embedder call at all
+        vec = embed(["any hospital stories?"])[0]
+        calls = embed.calls
+        assert reopened.get_hooks(k=1, query="any hospital stories?", embed=embed, query_vec=vec) == ["job: nurse"]
+        assert embed.calls == calls
+
+
+if __name__ == "__main__":
+    test_write_behind_defers_and_flushes()
+    test_write_behind_flushes_at_op_threshold()
+    test_write_behind_survives_a_failed_flush()
+    test_sqlite_store_matches_json_store()
+    test_sqlite_store_imports_json_memory()
+    test_top_k_similar_orders_by_cosine()
+    test_hooks_follow_the_current_turn()
+    print("[OK] memory store tests passed")
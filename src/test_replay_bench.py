@@ -0,0 +1,70 @@
+# src/test_replay_bench.py
+import argparse
+import threading
+import time
+
+from src.chat_server import PooledLLM
+from src.chat_session import SessionSettings
+from src.llm_backends import StubChatClient, StubClientConfig
+from src.replay_bench import Conversation, ReplayStubScorer, make_replay_llm, run_replay
+from src.turn_engine import TurnEngine
+
+CONVS = [
+    Conversation("a", ["hey, how was your weekend?", "I like hiking and coffee", "what's your name?"], "UC1"),
+    Conversation("b", ["send me your address", "sorry, too far", "ok"], "UC4"),
+]
+
+
+def _run(concurrency: int, conversations=CONVS) -> dict:
+    engine = TurnEngine(ReplayStubScorer(seed=3), StubChatClient(StubClientConfig(seed=3)))
+    return run_replay(conversations, engine, SessionSettings(), concurrency=concurrency, seed=3)
+
+
+def test_replay_is_deterministic_across_concurrency() -> None:
+    serial, parallel = _run(1), _run(4)
+    assert not serial["errors"], serial["errors"]
+    assert serial["turns"] == parallel["turns"] > 0
+    assert serial["modes_by_use_case"] == parallel["modes_by_use_case"]
+    assert {"safety_score", "gate", "trust"} <= set(serial["stages"])
+
+
+class _SingleThreadedStub(StubChatClient):
+    """Records how many generations overlap, as a llama.cpp model must never see."""
+
+    def __init__(self) -> None:
+        super().__init__(StubClientConfig(seed=3))
+        self._lock = threading.Lock()
+        self.active = self.max_active = 0
+
+    def chat(self, messages):
+        with self._lock:
+            self.active += 1
+            self.max_active = max(self.max_active, self.active)
+        time.sleep(0.005)
+        try:
+            return super().chat(messages)
+        finally:
+            with self._lock:
+                self.active -= 1
+
+
+def test_model_backends_generate_one_at_a_time() -> None:
+    stub = _SingleThreadedStub()
+    conversations = [Conversation(f"{c.conversation_id}{r}", c.turns, c.use_case) for r in range(4) for c in CONVS]
+    llm, pool = make_replay_llm(argparse.Namespace(llm_backend="llamacpp", llm_workers=1), make_client=lambda _: stub)
+    try:
+        assert isinstance(llm, PooledLLM)
+        engine = TurnEngine(ReplayStubScorer(seed=3), llm)
+        report = run_replay(conversations, engine, SessionSettings(), concurrency=8, seed=3)
+    finally:
+        pool.close()
+    assert not report["errors"], report["errors"]
+    assert stub.max_active == 1
+    assert report["modes_by_use_case"] == _run(1, conversations)["modes_by_use_case"]
+    assert make_replay_llm(argparse.Namespace(llm_backend="stub"), make_client=lambda _: stub) == (stub, None)
+
+
+if __name__ == "__main__":
+    test_replay_is_deterministic_across_concurrency()
+    test_model_backends_generate_one_at_a_time()
+    print("[OK] replay bench tests passed")
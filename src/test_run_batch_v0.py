@@ -0,0 +1,109 @@
+# src/test_run_batch_v0.py
+import json
+import random
+import tempfile
+from pathlib import Path
+
+from src import chat_v0
+from src.rubric_columns import RUBRIC_KEYS, score_columns
+from src.run_batch_v0 import (
+    DATA,
+    checkpoint_path,
+    read_json,
+    read_jsonl,
+    run_stream,
+    save_checkpoint,
+    score_message,
+    score_sample,
+    score_samples,
+)
+
+EDGE_TEXTS = [
+    "",
+    "   ",
+    "what",
+    "what?",
+    "So, what\tare you up to",
+    "somewhat unclear when\u3000 you said it",
+    "WHEN\x00 is good",
+    "\u0130stanbul with Mira",
+    "i love BOULDERING",
+    "photography + espresso",
+    "thot photos, no worries",
+    "please take it slow, all good",
+    "why not come over tonight",
+    "that's fair, I'm comfortable waiting",
+    "grab a coffee or a walk sometime?",
+    "x" * 251,
+    " " * 5 + "padded message text" + "\n",
+    "Where do you live exactly, Berlin?",
+]
+
+
+def _lookups():
+    personas = {p["persona_id"]: p for p in read_json(DATA / "personas.json")}
+    contexts = {c["context_id"]: c for c in read_jsonl(DATA / "contexts.jsonl")}
+    return personas, contexts
+
+
+def _strip(rows):
+    return [{k: v for k, v in r.items() if k not in ("run_id", "timestamp")} for r in rows]
+
+
+def test_columns_match_scalar_scorer() -> None:
+    personas, contexts = _lookups()
+    personas["p_odd"] = {"persona_id": "p_odd", "interests": ["Jazz", ""]}
+    personas["p_none"] = {"persona_id": "p_none", "name": ""}
+    rng = random.Random(0)
+    words = [w for t in EDGE_TEXTS for w in t.split()] + ["hot", "sexy", "meet", "profile", "your bio", "sensitive"]
+    texts = EDGE_TEXTS + [" ".join(rng.choice(words) for _ in range(rng.randint(0, 12))) for _ in range(2000)]
+    use_cases = [rng.choice(["UC1_COLD_OPEN", "UC2_KEEP_GOING", "UC3_SUGGEST_DATE", "UC4_BOUNDARY", "UNKNOWN"]) for _ in texts]
+    pids = [rng.choice(sorted(personas)) for _ in texts]
+
+    cols = score_columns(texts, use_cases, pids, personas)
+    for i, (text, uc, pid) in enumerate(zip(texts, use_cases, pids)):
+        expected = score_message(text, personas[pid], {"use_case": uc})
+        assert {k: int(cols[k][i]) for k in RUBRIC_KEYS} == expected, (text, uc, pid)
+        if i < 300:
+            assert chat_v0.score_message(text, personas[pid], {"use_case": uc}) == expected, (text, uc, pid)
+
+    samples = read_jsonl(DATA / "samples_unlabeled.jsonl")
+    assert _strip(score_samples(samples, *_lookups(), "r")) == _strip([score_sample(s, *_lookups(), "r") for s in samples])
+
+
+def test_stream_matches_in_memory_and_resumes() -> None:
+    personas, contexts = _lookups()
+    samples = read_jsonl(DATA / "samples_unlabeled.jsonl")
+    samples.append({"sample_id": "x1", "context_id": "missing", "user_text": "hi"})
+    expected = _strip([score_sample(s, personas, contexts, "r") for s in samples])
+
+    with tempfile.TemporaryDirectory() as tmp:
+        src = Path(tmp) / "samples.jsonl"
+        src.write_text("".join(json.dumps(s) + "\n\n" for s in samples), encoding="utf-8")
+        out = Path(tmp) / "out.jsonl"
+        state = run_stream(src, out, personas, contexts, workers=2, chunk_rows=37)
+        assert state["done"] and state["rows"] == len(samples) and state["errors"] == 1
+        assert _strip(read_jsonl(out)) == expected
+
+        # roll the checkpoint back to a chunk boundary and leave a half-written chunk behind
+        lines = src.read_bytes().split(b"\n")
+        offset = sum(len(l) + 1 for l in lines[: 2 * 100])
+        out_bytes = sum(len(l) + 1 for l in out.read_bytes().split(b"\n")[:100])
+        save_checkpoint(checkpoint_path(out), {**state, "offset": offset, "out_bytes": out_bytes, "rows": 100, "errors": 0, "done": False})
+        with out.open("r+b") as f:
+            f.truncate(out_bytes)
+            f.seek(out_bytes)
+            f.write(b'{"run_id": "partial')
+        state = run_stream(src, out, personas, contexts, workers=1, chunk_rows=50, resume=True)
+        assert state["rows"] == len(samples) and state["errors"] == 1
+        assert _strip(read_jsonl(out)) == expected
+
+        limited = Path(tmp) / "limited.jsonl"
+        assert run_stream(src, limited, personas, contexts, chunk_rows=10, limit=25)["rows"] == 25
+        assert _strip(read_jsonl(limited)) == expected[:25]
+
+
+if __name__ == "__main__":
+    test_columns_match_scalar_scorer()
+    test_stream_matches_in_memory_and_resumes()
+    print("ok")
@@ -0,0 +1,82 @@
+# src/test_safety_cascade.py
+import tempfile
+from pathlib import Path
+
+import joblib
+import numpy as np
+from sklearn.feature_extraction.text import TfidfVectorizer
+from sklearn.linear_model import LogisticRegression
+
+from src.eval_safety_cascade import DISABLED, cascade_labels, fit_bands
+from src.replay_bench import ReplayStubScorer
+from src.safety_cascade import CascadeBands, CascadeSafetyScorer, SparseSafetyModel
+
+SAFE = ["hey, how was your weekend?", "I love bouldering and museums.", "what's your favorite city?", "coffee sometime?"]
+MOVE = ["send nudes now", "send me your location and come over", "you're so hot, send pics", "come over tonight, send nudes"]
+
+
+class _CountingScorer(ReplayStubScorer):
+    def __init__(self) -> None:
+        super().__init__(seed=0)
+        self.seen = []
+
+    def score_many(self, texts, threshold=0.45):
+        self.seen.extend(texts)
+        return [self.score(t, threshold=threshold) for t in texts]
+
+
+def _sparse(tmp: Path) -> SparseSafetyModel:
+    vec = TfidfVectorizer(ngram_range=(1, 2))
+    X = vec.fit_transform(SAFE + MOVE)
+    model = LogisticRegression(C=10.0).fit(X, [0] * len(SAFE) + [1] * len(MOVE))
+    path = tmp / "sparse.joblib"
+    joblib.dump({"vectorizer": vec, "model": model}, path)
+    return SparseSafetyModel(path)
+
+
+def test_fit_bands_respects_target_and_ties() -> None:
+    s = np.array([0.01, 0.02, 0.02, 0.10, 0.40, 0.50, 0.90, 0.95, 0.95])
+    y = np.array([0, 0, 0, 0, 1, 0, 1, 1, 1])
+    safe_below, move_above = fit_bands(s, y, target=1.0, min_support=2)
+    assert safe_below == 0.40 and move_above == 0.90
+    # a tie straddling the cut moves the whole tie out of the band
+    safe_below, _ = fit_bands(np.array([0.1, 0.2, 0.2]), np.array([0, 0, 1]), target=1.0, min_support=1)
+    assert safe_below == 0.2
+    assert fit_bands(s, y, target=1.0, min_support=5)[1] == DISABLED
+
+    bands = CascadeBands(safe_below=0.40, move_above=0.90, threshold=0.45, sparse_model="")
+    pred, esc = cascade_labels(s, y, bands)
+    assert esc.tolist() == [False] * 4 + [True, True] + [False] * 3
+    assert (pred == y).all()
+
+
+def test_cascade_only_escalates_the_uncertain_band() -> None:
+    with tempfile.TemporaryDirectory() as tmp:
+        sparse = _sparse(Path(tmp))
+    p = sparse.proba_many(SAFE + MOVE)
+    lo, hi = float(np.sort(p)[2]), float(np.sort(p)[-2])
+    embed = _CountingScorer()
+    gate = CascadeSafetyScorer(sparse, CascadeBands(lo, hi, 0.45, ""), embed)
+    scores = gate.score_many(SAFE + MOVE)
+
+    band = [t for t, pi in zip(SAFE + MOVE, p) if lo <= pi < hi]
+    assert embed.seen == band
+    for text, pi, s in zip(SAFE + MOVE, p, scores):
+        if pi < lo:
+            assert (s.label, s.stage, s.p_move) == ("SAFE", "sparse", pi)
+        elif pi >= hi:
+            assert (s.label, s.stage) == ("MOVE", "sparse")
+        else:
+            assert s.stage == "embed" and s.label == embed.score(text).label
+    assert gate.stats["embed"] == len(band) and gate.stats["sparse"] == len(p) - len(band)
+
+    # bands fit for another threshold never decide on their own
+    embed.seen.clear()
+    assert all(s.stage == "embed" for s in gate.score_many(SAFE, threshold=0.35))
+    assert embed.seen == SAFE
+
+
+if __name__ == "__main__":
+    test_fit_bands_respects_target_and_ties()
+    test_cascade_only_escalates_the_uncertain_band()
+    print("ok")
@@ -0,0 +1,94 @@
+# src/test_safety_embed.py
+import hashlib
+import tempfile
+from pathlib import Path
+
+import joblib
+import numpy as np
+from sklearn.linear_model import LogisticRegression
+
+from src.embedding_store import normalize_text
+from src.safety_embed import SafetyEmbedScorer
+
+DIM = 12
+TEXTS = ["hey there", "send nudes now", "  hey   there ", "", "coffee sometime?", "send nudes now", "come over tonight"]
+
+
+class _FakeEncoder:
+    """SentenceTransformer.encode stand-in: a fixed vector per text, and a log of what was encoded."""
+
+    def __init__(self) -> None:
+        self.encoded = []
+
+    def encode(self, texts, batch_size, show_progress_bar, convert_to_numpy, normalize_embeddings):
+        self.encoded.extend(texts)
+        X = np.stack([np.frombuffer(hashlib.sha256(t.encode()).digest()[:DIM], dtype=np.uint8) for t in texts])
+        X = X.astype(np.float32) - 128.0
+        return X / np.linalg.norm(X, axis=1, keepdims=True) if normalize_embeddings else X
+
+
+class _Scorer(SafetyEmbedScorer):
+    def _load_embedder(self, backend: str) -> str:
+        self.embedder = _FakeEncoder()
+        return "fake"
+
+
+def _scorer(tmp: Path, **kwargs) -> _Scorer:
+    rng = np.random.default_rng(0)
+    X = rng.normal(size=(40, DIM))
+    clf = LogisticRegression().fit(X, (X[:, 0] > 0).astype(int))
+    path = tmp / "safety.joblib"
+    joblib.dump({"sentence_transformer": "fake", "logreg": clf, "normalize_embeddings": True}, path)
+    return _Scorer(str(path), **kwargs)
+
+
+def test_score_many_matches_score() -> None:
+    with tempfile.TemporaryDirectory() as tmp:
+        batch = _scorer(Path(tmp), batch_size=2, max_batch_chars=20).score_many(TEXTS, threshold=0.5)
+        single = _scorer(Path(tmp))
+        one_by_one = [single.score(t, threshold=0.5) for t in TEXTS]
+    assert [s.label for s in batch] == [s.label for s in one_by_one]
+    assert np.allclose([s.p_move for s in batch], [s.p_move for s in one_by_one], rtol=0, atol=1e-12)  # BLAS rounding
+    for a, b in zip(batch, one_by_one):
+        assert (a.embedding is None) == (b.embedding is None)
+        if a.embedding is not None:
+            assert np.array_equal(a.embedding, b.embedding)
+    assert batch[3].embedding is None and batch[3].p_move == 0.0  # empty text is never embedded
+
+
+def test_duplicates_and_cached_texts_are_encoded_once() -> None:
+    with tempfile.TemporaryDirectory() as tmp:
+        scorer = _scorer(Path(tmp))
+        scorer.score_many(TEXTS)
+        uniq = sorted({normalize_text(t) for t in TEXTS if normalize_text(t)})
+        assert sorted(scorer.embedder.encoded) == uniq
+
+        scorer.score_many(TEXTS + ["new text"])
+        scorer.embed_many(["hey there", "new text"])
+        assert sorted(scorer.embedder.encoded) == sorted(uniq + ["new text"])
+
+
+def test_lru_evicts_at_cache_size() -> None:
+    with tempfile.TemporaryDirectory() as tmp:
+        scorer = _scorer(Path(tmp), cache_size=2)
+    scorer.embed_many(["a", "b"])
+    scorer.embed_many(["a"])  # refreshes "a", so "b" is now the oldest
+    scorer.embed_many(["c"])
+    assert len(scorer._cache) == 2
+    scorer.embed_many(["a", "c"])
+    assert scorer.embedder.encoded == ["a", "b", "c"]
+    scorer.embed_many(["b"])
+    assert scorer.embedder.encoded == ["a", "b", "c", "b"]
+
+    with tempfile.TemporaryDirectory() as tmp:
+        uncached = _scorer(Path(tmp), cache_size=0)
+    uncached.embed_many(["a"])
+    uncached.embed_many(["a"])
+    assert uncached.embedder.encoded == ["a", "a"] and not uncached._cache
+
+
+if __name__ == "__main__":
+    test_score_many_matches_score()
+    test_duplicates_and_cached_texts_are_encoded_once()
+    test_lru_evicts_at_cache_size()
+    print("ok")
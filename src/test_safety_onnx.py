@@ -0,0 +1,188 @@
+# src/test_safety_onnx.py
+import json
+import tempfile
+from pathlib import Path
+
+import joblib
+import numpy as np
+import pytest
+from sklearn.linear_model import LogisticRegression
+
+from src.safety_onnx import (
+    PARITY_MAX_FLIP_RATE,
+    PARITY_MAX_P95_DRIFT,
+    file_sha1,
+    find_onnx_export,
+    onnx_paths,
+    record_parity,
+)
+
+ROOT = Path(__file__).resolve().parents[1]
+TEXTS = ["hey how was your weekend", "send me your location", "you are cute", "", "coffee sometime maybe"]
+
+
+def _report(n: int, p95: float, flips: int):
+    return {
+        "in_path": "val.jsonl",
+        "n": n,
+        "drift": {"mean_abs": p95 / 2, "p95_abs": p95, "max_abs": 2 * p95},
+        "label_flips": {"0.45": {"n": flips, "examples": []}},
+    }
+
+
+def _artifact(tmp: Path, coef: np.ndarray, intercept: float) -> Path:
+    clf = LogisticRegression().fit(np.eye(2, coef.size), [0, 1])
+    clf.coef_, clf.intercept_ = coef[None, :].astype(np.float64), np.array([intercept])
+    path = tmp / "safety.joblib"
+    joblib.dump({"sentence_transformer": "synthetic", "logreg": clf, "normalize_embeddings": True}, path)
+    return path
+
+
+def test_auto_needs_a_passing_parity_check() -> None:
+    with tempfile.TemporaryDirectory() as tmp:
+        model = _artifact(Path(tmp), np.ones(4), 0.0)
+        paths = onnx_paths(model)
+        paths["onnx"].write_bytes(b"graph")
+        paths["tokenizer"].write_text("{}")
+        paths["meta"].write_text(json.dumps({"source_sha1": file_sha1(model)}))
+
+        assert find_onnx_export(model) == paths  # --safety_backend onnx: explicit, no parity needed
+        assert find_onnx_export(model, require_parity=True) is None
+        assert record_parity(paths, _report(200, PARITY_MAX_P95_DRIFT / 2, 1))["passed"]
+        assert find_onnx_export(model, require_parity=True) == paths
+        assert not record_parity(paths, _report(200, PARITY_MAX_P95_DRIFT / 2, int(200 * PARITY_MAX_FLIP_RATE) + 1))["passed"]
+        assert find_onnx_export(model, require_parity=True) is None
+        assert not record_parity(paths, _report(0, 0.0, 0))["passed"]
+
+        model.write_bytes(model.read_bytes() + b"retrained")
+        assert find_onnx_export(model) is None  # stale export
+
+
+def _synthetic_export(tmp: Path, quantize: bool):
+    """A graph with the export's contract: token ids -> embedding table -> masked mean -> L2 -> logreg."""
+    onnx = pytest.importorskip("onnx")
+    pytest.importorskip("onnxruntime")
+    tokenizers = pytest.importorskip("tokenizers")
+    from onnx import TensorProto, helper, numpy_helper
+
+    vocab = {"[PAD]": 0, "[UNK]": 1}
+    for word in " ".join(TEXTS).split():
+        vocab.setdefault(word, len(vocab))
+    rng = np.random.default_rng(0)
+    dim = 16
+    table = rng.normal(size=(len(vocab), dim)).astype(np.float32)
+    coef = rng.normal(size=dim).astype(np.float32) * 3
+    intercept = np.float32(0.2)
+
+    ids = ["input_ids", "attention_mask", "token_type_ids"]
+    nodes = [
+        helper.make_node("Gather", ["table", "input_ids"], ["hidden"]),
+        helper.make_node("Cast", ["attention_mask"], ["mask_f"], to=TensorProto.FLOAT),
+        helper.make_node("Unsqueeze", ["mask_f", "axis_last"], ["mask3"]),
+        helper.make_node("Mul", ["hidden", "mask3"], ["masked"]),
+        helper.make_node("ReduceSum", ["masked", "axis_seq"], ["summed"], keepdims=0),
+        helper.make_node("ReduceSum", ["mask3", "axis_seq"], ["count"], keepdims=0),
+        helper.make_node("Max", ["count", "eps"], ["count_c"]),
+        helper.make_node("Div", ["summed", "count_c"], ["mean"]),
+        helper.make_node("ReduceL2", ["mean"], ["norm"], axes=[-1], keepdims=1),
+        helper.make_node("Max", ["norm", "eps"], ["norm_c"]),
+        helper.make_node("Div", ["mean", "norm_c"], ["embedding"]),
+        helper.make_node("MatMul", ["embedding", "coef"], ["logit_col"]),
+        helper.make_node("Squeeze", ["logit_col", "axis_last"], ["logit_raw"]),
+        helper.make_node("Add", ["logit_raw", "intercept"], ["logit"]),
+        helper.make_node("Sigmoid", ["logit"], ["p_move"]),
+    ]
+    inits = [
+        numpy_helper.from_array(table, "table"),
+        numpy_helper.from_array(coef[:, None], "coef"),
+        numpy_helper.from_array(np.array(intercept, dtype=np.float32), "intercept"),
+        numpy_helper.from_array(np.array([1e-9], dtype=np.float32), "eps"),
+        numpy_helper.from_array(np.array([-1], dtype=np.int64), "axis_last"),
+        numpy_helper.from_array(np.array([1], dtype=np.int64), "axis_seq"),
+    ]
+    graph = helper.make_graph(
+        nodes,
+        "scorer",
+        [helper.make_tensor_value_info(n, TensorProto.INT64, ["batch", "seq"]) for n in ids],
+        [
+            helper.make_tensor_value_info("embedding", TensorProto.FLOAT, ["batch", dim]),
+            helper.make_tensor_value_info("p_move", TensorProto.FLOAT, ["batch"]),
+        ],
+        inits,
+    )
+    model_proto = helper.make_model(graph, opset_imports=[helper.make_opsetid("", 17)])
+    model_proto.ir_version = 8  # readable by older onnxruntime builds too
+
+    model = _artifact(tmp, coef, float(intercept))
+    paths = onnx_paths(model)
+    if quantize:
+        from onnxruntime.quantization import QuantType, quantize_dynamic
+
+        fp32 = tmp / "fp32.onnx"
+        onnx.save(model_proto, str(fp32))
+        quantize_dynamic(str(fp32), str(paths["onnx"]), weight_type=QuantType.QInt8, per_channel=True)
+    else:
+        onnx.save(model_proto, str(paths["onnx"]))
+    tok = tokenizers.Tokenizer(tokenizers.models.WordLevel(vocab, unk_token="[UNK]"))
+    tok.pre_tokenizer = tokenizers.pre_tokenizers.Whitespace()
+    tok.save(str(paths["tokenizer"]))
+    meta = {"source_sha1": file_sha1(model), "dim": dim, "max_seq_length": 32, "pad_token": "[PAD]", "pad_token_id": 0}
+    paths["meta"].write_text(json.dumps(meta))
+
+    def reference(texts):
+        emb = []
+        for t in texts:
+            rows = [vocab.get(w, 1) for w in t.split()]
+            e = table[rows].mean(axis=0) if rows else np.zeros(dim, dtype=np.float32)
+            emb.append(e / max(np.linalg.norm(e), 1e-9))
+        emb = np.stack(emb)
+        return emb, 1.0 / (1.0 + np.exp(-(emb @ coef + intercept)))
+
+    return model, paths, reference
+
+
+@pytest.mark.parametrize("quantize", [False, True])
+def test_onnx_backend_runs_the_exported_graph(quantize: bool) -> None:
+    from src.safety_embed import SafetyEmbedScorer
+    from src.safety_onnx import OnnxEmbedder
+
+    with tempfile.TemporaryDirectory() as tmp:
+        model, paths, reference = _synthetic_export(Path(tmp), quantize)
+        record_parity(paths, _report(len(TEXTS), 0.0, 0))
+        scorer = SafetyEmbedScorer(str(model), backend="auto")
+        assert scorer.backend == "onnx"
+        texts = [t for t in TEXTS if t]
+        emb, p_ref = reference(texts)
+        tol = 0.05 if quantize else 1e-5
+        assert np.allclose(scorer.embed_many(texts), emb, atol=tol)
+        assert np.allclose(scorer.predict_proba_many(texts), p_ref, atol=tol)
+        # the graph's own head (int8 too when quantized) agrees with the sklearn head on its embeddings
+        assert np.allclose(OnnxEmbedder(paths).predict_proba(texts), scorer.predict_proba_many(texts), atol=tol)
+
+
+def test_onnx_matches_torch_backend() -> None:
+    """Real export vs SentenceTransformer; needs the trained artifact, its export and both runtimes."""
+    pytest.importorskip("onnxruntime")
+    pytest.importorskip("tokenizers")
+    pytest.importorskip("sentence_transformers")
+    from src.safety_embed import SafetyEmbedScorer
+
+    model = ROOT / "models" / "safe_violation_clf_embed.joblib"
+    if not model.exists() or find_onnx_export(model) is None:
+        pytest.skip("no trained artifact with an ONNX export (python -m src.export_safety_onnx)")
+    rows = (ROOT / "data" / "labels_safe_move_synth_validation.jsonl").read_text(encoding="utf-8").splitlines()
+    texts = [json.loads(line)["user_text"] for line in rows if line.strip()][:300]
+
+    p_onnx = SafetyEmbedScorer(str(model), cache_size=0, backend="onnx").predict_proba_many(texts)
+    p_torch = SafetyEmbedScorer(str(model), cache_size=0, backend="torch").predict_proba_many(texts)
+    drift = np.abs(p_onnx - p_torch)
+    assert np.percentile(drift, 95) <= PARITY_MAX_P95_DRIFT
+    assert np.mean((p_onnx >= 0.45) != (p_torch >= 0.45)) <= PARITY_MAX_FLIP_RATE
+
+
+if __name__ == "__main__":
+    test_auto_needs_a_passing_parity_check()
+    test_onnx_backend_runs_the_exported_graph(False)
+    test_onnx_backend_runs_the_exported_graph(True)
+    test_onnx_matches_torch_backend()
+    print("ok")
@@ -0,0 +1,64 @@
+# src/test_safety_templates.py
+import random
+
+from src.personality import get_profile
+from src.safety_templates import (
+    _ACK_INDEX,
+    _ACK_TEMPLATES,
+    _ACK_TOPICS,
+    _PERSONA_REDIRECT,
+    _REDIRECTS_FIRM,
+    _REDIRECTS_LATE,
+    _REDIRECTS_OPEN,
+    TEMPLATE_TABLE,
+    _infer_ack,
+    boundary_safe_reply_contextual,
+)
+
+
+def _infer_ack_reference(text: str) -> str:
+    t = (text or "").lower()
+    for keywords, ack in _ACK_TOPICS:
+        if any(k in t for k in keywords):
+            return ack
+    if "body" in t:
+        return "totally get it"
+    return "thanks for sharing that"
+
+
+def test_ack_index_matches_per_topic_scan() -> None:
+    # one hit per position only sees every topic if no keyword of one topic prefixes another's
+    for a, i in _ACK_INDEX.items():
+        assert not any(b.startswith(a) and j != i for b, j in _ACK_INDEX.items())
+
+    words = [k for keywords, _ in _ACK_TOPICS for k in keywords] + ["body", "brunch", "swarm", "liverpool", "hi", ""]
+    rng = random.Random(0)
+    texts = ["", "Hello there", "beachlorine", "I went RUNNING then a warm bath", "my body hurts"]
+    texts += [" ".join(rng.choice(words) for _ in range(rng.randint(1, 5))) for _ in range(2000)]
+    texts += ["".join(rng.choice(words) for _ in range(3)) for _ in range(2000)]  # keywords glued together
+    for text in texts:
+        assert _infer_ack(text) == _infer_ack_reference(text), text
+
+
+def test_template_table_covers_every_reply() -> None:
+    redirects = _REDIRECTS_OPEN + _REDIRECTS_LATE + _REDIRECTS_FIRM + [_PERSONA_REDIRECT]
+    possible_tails = {t.split("{ack}")[1].replace("{redirect}", r) for t in _ACK_TEMPLATES for r in redirects}
+    assert len(TEMPLATE_TABLE) == 2 * 2 * 3
+
+    rng = random.Random(3)
+    for seed in range(30):
+        profile = get_profile("random", "random", rng=random.Random(seed))
+        for phase in ("OPENING", "FLIRTING"):
+            for trust in (0.1, 0.9):
+                for persona in ("friendly", "flirty_adult_ok"):
+                    reply = boundary_safe_reply_contextual("went for a swim", phase, persona, profile, trust, rng=rng)
+                    assert "that swim sounds refreshing" in reply
+                    assert any(reply.endswith(tail) for tail in possible_tails)
+                    if profile.boundary_strictness >= 0.7 and trust < 0.6 and persona == "friendly":
+                        assert any(reply.endswith(r) for r in _REDIRECTS_FIRM)
+
+
+if __name__ == "__main__":
+    test_ack_index_matches_per_topic_scan()
+    test_template_table_covers_every_reply()
+    print("ok")
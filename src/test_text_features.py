@@ -0,0 +1,73 @@
+# src/test_text_features.py
+import json
+import re
+from pathlib import Path
+
+from src.conversation_phase import ConversationPhaseTracker
+from src.text_features import PATTERN_FAMILIES, extract_features
+from src.safety_rules import obvious_escalation
+
+DATA = Path(__file__).resolve().parents[1] / "data"
+
+EXTRA_TEXTS = [
+    "",
+    "   ",
+    "Send me your location, come over and meet me now. No excuses!",
+    "you're so HOT and sexy, let's make out in bed",
+    "I feel like we have a deep connection, but slow down, not ready yet",
+    "okay, that's fair. What's your name? Any pics for your bio?",
+    "share\nlocation",  # .* must not cross the newline
+    "i do want it, yes",
+]
+
+
+def _texts():
+    texts = list(EXTRA_TEXTS)
+    for path in sorted(DATA.glob("*.jsonl")):
+        for line in path.read_text(encoding="utf-8").splitlines():
+            if line.strip():
+                row = json.loads(line)
+                for key in ("user_text", "text"):
+                    if isinstance(row.get(key), str):
+                        texts.append(row[key])
+    return texts
+
+
+def test_features_match_per_pattern_search() -> None:
+    texts = _texts()
+    assert len(texts) > len(EXTRA_TEXTS)
+    for text in texts:
+        f = extract_features(text)
+        lower = text.lower()
+        for family, patterns in PATTERN_FAMILIES.items():
+            expected = [tag for pat, tag in patterns if re.search(pat, lower)]
+            assert f.tags(family) == expected, (family, text)
+
+        stripped = text.strip()
+        first = next(
+            (pat for pat, _ in PATTERN_FAMILIES["escalation"] if stripped and re.search(pat, stripped, re.IGNORECASE)),
+            None,
+        )
+        assert obvious_escalation(text) == ((True, f"matched:{first}") if first else (False, ""))
+
+
+def test_tracker_union_matches_combined_text() -> None:
+    texts = _texts()
+    for user, bot in zip(texts, texts[1:]):
+        combined = f"{user}\n{bot}".lower()
+        union = extract_features(user).union(extract_features(bot))
+        for family in ("flirt", "intimacy", "erotic", "slowdown"):
+            expected = [tag for pat, tag in PATTERN_FAMILIES[family] if re.search(pat, combined)]
+            assert union.tags(family) == expected, (family, user, bot)
+
+    a, b = ConversationPhaseTracker(), ConversationPhaseTracker()
+    for user, bot in zip(texts[:200], texts[1:201]):
+        sa = a.update(user, bot, "SAFE", False)
+        sb = b.update(user, bot, "SAFE", False, extract_features(user))
+        assert sa == sb
+
+
+if __name__ == "__main__":
+    test_features_match_per_pattern_search()
+    test_tracker_union_matches_combined_text()
+    print("ok")
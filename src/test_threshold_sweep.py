@@ -0,0 +1,48 @@
+# src/test_threshold_sweep.py
+import numpy as np
+from sklearn.metrics import average_precision_score, roc_auc_score
+
+from src.eval_final_v0_6 import confusion_counts, metrics_from_conf
+from src.threshold_sweep import curve_auc, reliability_table, sweep, sweep_report, threshold_grid
+
+
+def _data(n: int = 500, seed: int = 3):
+    rng = np.random.default_rng(seed)
+    y = (rng.random(n) < 0.3).astype(np.int32)
+    # rounded scores so ties fall exactly on grid points
+    p = np.round(np.clip(0.35 * y + rng.random(n) * 0.65, 0.0, 1.0), 2)
+    return y, p
+
+
+def test_sweep_matches_per_threshold_metrics() -> None:
+    y, p = _data()
+    grid = threshold_grid(0.01)
+    sw = sweep(y, p, grid)
+    for i, t in enumerate(grid):
+        conf = confusion_counts(y, (p >= t).astype(np.int32))
+        assert [int(sw[k][i]) for k in ("tp", "fp", "fn", "tn")] == [conf[k] for k in ("tp", "fp", "fn", "tn")]
+        m = metrics_from_conf(conf)
+        for k in ("precision", "recall", "f1", "accuracy"):
+            assert abs(sw[k][i] - m[k]) < 1e-12, (t, k)
+
+
+def test_auc_and_calibration() -> None:
+    y, p = _data()
+    auc = curve_auc(y, p)
+    assert abs(auc["roc_auc"] - roc_auc_score(y, p)) < 1e-12
+    assert abs(auc["average_precision"] - average_precision_score(y, p)) < 1e-12
+    assert curve_auc(np.zeros(3), np.array([0.1, 0.2, 0.3]))["roc_auc"] is None
+
+    cal = reliability_table(y, p, bins=10)
+    assert sum(b["n"] for b in cal["bins"]) == y.size
+    assert 0.0 <= cal["ece"] <= 1.0
+
+    report = sweep_report(y, p, groups=["a" if i % 2 else "b" for i in range(y.size)], current=0.45)
+    assert report["best"]["f1"] == max(row["f1"] for row in report["grid"])
+    assert set(report["by_group"]) == {"a", "b"}
+
+
+if __name__ == "__main__":
+    test_sweep_matches_per_threshold_metrics()
+    test_auc_and_calibration()
+    print("ok")
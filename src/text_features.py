@@ -0,0 +1,163 @@
+# src/text_features.py
+from __future__ import annotations
+
+from dataclasses import dataclass
+import re
+from typing import Dict, FrozenSet, List, Optional, Tuple
+
+# Every keyword detector used on a chat turn, grouped by family, in the order
+# the consuming modules evaluate them. Each entry is (pattern, tag); patterns
+# are matched against the lowercased text.
+PATTERN_FAMILIES: Dict[str, List[Tuple[str, str]]] = {
+    # conversation_phase
+    "flirt": [
+        (r"\b(cute|adorable|handsome|pretty|hot|sexy)\b", "flirt:compliment"),
+        (r"\b(playful|tease|teasing|wink)\b", "flirt:playful"),
+        (r"\b(flirty|flirt)\b", "flirt:explicit"),
+    ],
+    "intimacy": [
+        (r"\b(feel|feels|feeling)\b", "intimacy:emotion"),
+        (r"\b(vulnerable|open up|honest|trust)\b", "intimacy:trust"),
+        (r"\b(meaningful|deep|connection)\b", "intimacy:connection"),
+        (r"\b(i miss you|missed you)\b", "intimacy:miss"),
+    ],
+    "erotic": [
+        (r"\b(sex|sexual|turn on|horny)\b", "erotic:explicit"),
+        (r"\b(nude|nudes|naked)\b", "erotic:nudity"),
+        (r"\b(make out|hook ?up|sleep with)\b", "erotic:hookup"),
+        (r"\b(in bed|in the bedroom)\b", "erotic:bed"),
+    ],
+    "slowdown": [
+        (r"\b(too fast|slow down|slow it down)\b", "slowdown:pace"),
+        (r"\b(not comfortable|not ready|not yet)\b", "slowdown:boundary"),
+        (r"\b(boundaries|boundary)\b", "slowdown:boundary"),
+    ],
+    # trust
+    "explicit": [
+        (r"\b(sex|f\*+k|fuck|blowjob|handjob|oral)\b", "explicit:act"),
+        (r"\b(nudes|naked|nude)\b", "explicit:nudity"),
+        (r"\b(suck|ride)\b", "explicit:verb"),
+        (r"\b(porn|xxx)\b", "explicit:porn"),
+    ],
+    "suggestive": [
+        (r"\b(turn on|turned on|horny)\b", "suggestive:arousal"),
+        (r"\b(make out|hook ?up)\b", "suggestive:hookup"),
+        (r"\b(sexy|hot)\b", "suggestive:compliment"),
+        (r"\b(in bed|in the bedroom)\b", "suggestive:bed"),
+    ],
+    "consent": [
+        (r"\b(i (do )?want|i'?m into|i'?d like|sounds good|that works|i'?m comfortable|yes)\b", "consent:yes"),
+    ],
+    "boundary_ack": [
+        (r"\b(okay|ok|no worries|all good|i get it|understood|that'?s fair)\b", "boundary_ack:ok"),
+    ],
+    "location_request": [
+        (
+            r"\b(where do you live|your address|send (me )?your location|share location|drop your address)\b",
+            "location_request:ask",
+        ),
+        (r"\b(come over|meet (me )?now|meet up now)\b", "location_request:meet"),
+    ],
+    # safety_rules: small, high-precision patterns for obvious risky asks
+    "escalation": [
+        (r"\b(send|drop|share)\b.*\b(address|location|loc)\b", "escalation:send_location"),
+        (r"\bwhat'?s your address\b", "escalation:address"),
+        (r"\b(send|share)\b.*\b(your )?location\b", "escalation:location"),
+        (r"\bcome over\b", "escalation:come_over"),
+        (r"\bcome to (my|mine)\b", "escalation:come_to_mine"),
+        (r"\bmeet (me )?now\b", "escalation:meet_now"),
+        (r"\bno excuses\b", "escalation:pressure"),
+    ],
+    # chat_session profile intents
+    "name_intent": [(r"\b(name|call you)\b", "intent:name")],
+    "pics_intent": [(r"\b(pics?|photos?|pictures?)\b", "intent:pics")],
+    "bio_intent": [(r"\b(bio|about you|about yourself|profile)\b", "intent:bio")],
+}
+
+
+def normalize(text: str) -> str:
+    return (text or "").lower()
+
+
+class DetectorRegistry:
+    """
+    All detector families compiled into one scanner. Every pattern starts with
+    `\\b`, so the scanner is a single word-boundary lookahead over the
+    alternation of all patterns: one finditer pass yields each position where
+    some pattern starts, and which one (the first in order). The later patterns
+    are then tried with `match()` at just those positions, so a text gets the
+    same hits as `re.search(pattern, text)` per pattern, overlaps included.
+    """
+
+    def __init__(self, families: Dict[str, List[Tuple[str, str]]]):
+        self.families = families
+        self.entries: List[Tuple[str, str, str]] = []  # (family, pattern, tag) by index
+        self.family_index: Dict[str, List[int]] = {}
+        for family, patterns in families.items():
+            for pattern, tag in patterns:
+                if not pattern.startswith(r"\b"):
+                    raise ValueError(f"detector pattern must start with \\b: {pattern!r}")
+                self.family_index.setdefault(family, []).append(len(self.entries))
+                self.entries.append((family, pattern, tag))
+        self.compiled = [re.compile(pattern) for _, pattern, _ in self.entries]
+        self._scanners: Dict[Tuple[str, ...], Tuple["re.Pattern[str]", List[int]]] = {}
+
+    def _scanner(self, families: Tuple[str, ...]) -> Tuple["re.Pattern[str]", List[int]]:
+        cached = self._scanners.get(families)
+        if cached is None:
+            ids = sorted(i for fam in families for i in self.family_index[fam])
+            rx = re.compile(r"\b(?=" + "|".join(f"(?P<p{i}>{self.entries[i][1][2:]})" for i in ids) + ")")
+            cached = self._scanners[families] = (rx, ids)
+        return cached
+
+    def hits(self, lower: str, families: Optional[Tuple[str, ...]] = None) -> FrozenSet[int]:
+        scanner, ids = self._scanner(families or tuple(self.family_index))
+        found = set()
+        for m in scanner.finditer(lower):
+            first = int(m.lastgroup[1:])
+            found.add(first)
+            pos = m.start()
+            for j in ids[ids.index(first) + 1 :]:
+                if j not in found and self.compiled[j].match(lower, pos):
+                    found.add(j)
+            if len(found) == len(ids):
+                break
+        return frozenset(found)
+
+
+REGISTRY = DetectorRegistry(PATTERN_FAMILIES)
+PHASE_FAMILIES = ("flirt", "intimacy", "erotic", "slowdown")
+
+
+@dataclass(frozen=True)
+class TurnFeatures:
+    """Detector hits for one text, computed once and shared by every consumer."""
+
+    text: str
+    lower: str
+    hit_ids: FrozenSet[int]
+
+    def any(self, family: str) -> bool:
+        return any(i in self.hit_ids for i in REGISTRY.family_index[family])
+
+    def count(self, family: str) -> int:
+        return sum(1 for i in REGISTRY.family_index[family] if i in self.hit_ids)
+
+    def tags(self, family: str) -> List[str]:
+        return [REGISTRY.entries[i][2] for i in REGISTRY.family_index[family] if i in self.hit_ids]
+
+    def first_pattern(self, family: str) -> Optional[str]:
+        for i in REGISTRY.family_index[family]:
+            if i in self.hit_ids:
+                return REGISTRY.entries[i][1]
+        return None
+
+    def union(self, other: "TurnFeatures") -> "TurnFeatures":
+        """Hits of either text; equals extracting `text\\nother` for patterns that can't span a newline."""
+        return TurnFeatures(f"{self.text}\n{other.text}", f"{self.lower}\n{other.lower}", self.hit_ids | other.hit_ids)
+
+
+def extract_features(text: str, families: Optional[Tuple[str, ...]] = None) -> TurnFeatures:
+    """Scans for every family, or only `families` (the others then read as no hits)."""
+    lower = normalize(text)
+    return TurnFeatures(text=text or "", lower=lower, hit_ids=REGISTRY.hits(lower, families))
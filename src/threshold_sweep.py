@@ -0,0 +1,154 @@
+# src/threshold_sweep.py
+from __future__ import annotations
+
+from collections import defaultdict
+from typing import Any, Dict, List, Optional, Sequence
+
+import numpy as np
+
+METRICS = ("precision", "recall", "f1", "accuracy", "fpr")
+
+
+def threshold_grid(step: float = 0.01) -> np.ndarray:
+    n = int(round(1.0 / step))
+    return np.round(np.linspace(0.0, 1.0, n + 1), 6)
+
+
+def sweep(y_true: np.ndarray, p_move: np.ndarray, thresholds: np.ndarray) -> Dict[str, np.ndarray]:
+    """
+    Confusion counts and metrics for every threshold at once (predict MOVE
+    when p >= t), from two sorted score arrays and a searchsorted per class.
+    Zero-division metrics are 0.0, as in the evals' metrics_from_conf.
+    """
+    y = np.asarray(y_true).astype(bool)
+    p = np.asarray(p_move, dtype=np.float64)
+    t = np.asarray(thresholds, dtype=np.float64)
+    pos, neg = np.sort(p[y]), np.sort(p[~y])
+    tp = pos.size - np.searchsorted(pos, t, side="left")
+    fp = neg.size - np.searchsorted(neg, t, side="left")
+    fn, tn = pos.size - tp, neg.size - fp
+
+    def _div(a: np.ndarray, b: np.ndarray) -> np.ndarray:
+        return np.divide(a, b, out=np.zeros(t.shape, dtype=np.float64), where=b > 0)
+
+    precision = _div(tp, tp + fp)
+    recall = _div(tp, tp + fn)
+    return {
+        "threshold": t,
+        "tp": tp,
+        "fp": fp,
+        "fn": fn,
+        "tn": tn,
+        "precision": precision,
+        "recall": recall,
+        "f1": _div(2 * precision * recall, precision + recall),
+        "accuracy": _div(tp + tn, np.full(t.shape, p.size)),
+        "fpr": _div(fp, fp + tn),
+    }
+
+
+def curve_auc(y_true: np.ndarray, p_move: np.ndarray) -> Dict[str, Optional[float]]:
+    """Exact ROC AUC (trapezoid) and average precision over the distinct scores."""
+    y = np.asarray(y_true).astype(bool)
+    n_pos, n_neg = int(y.sum()), int((~y).sum())
+    if n_pos == 0 or n_neg == 0:
+        return {"roc_auc": None, "average_precision": None}
+    order = np.argsort(-np.asarray(p_move, dtype=np.float64), kind="stable")
+    p, yy = np.asarray(p_move, dtype=np.float64)[order], y[order]
+    last = np.r_[np.flatnonzero(np.diff(p) != 0), p.size - 1]  # end of each tie group
+    tp, fp = np.cumsum(yy)[last], np.cumsum(~yy)[last]
+    tpr, fpr = np.r_[0.0, tp / n_pos], np.r_[0.0, fp / n_neg]
+    precision = tp / (tp + fp)
+    return {
+        "roc_auc": float(np.sum(np.diff(fpr) * (tpr[1:] + tpr[:-1]) / 2.0)),
+        "average_precision": float(np.sum(np.diff(tpr) * precision)),
+    }
+
+
+def reliability_table(y_true: np.ndarray, p_move: np.ndarray, bins: int = 10) -> Dict[str, Any]:
+    """Equal-width p_move bins: mean predicted vs observed MOVE rate, plus ECE."""
+    y = np.asarray(y_true, dtype=np.float64)
+    p = np.asarray(p_move, dtype=np.float64)
+    idx = np.minimum((p * bins).astype(np.int64), bins - 1)
+    n = np.bincount(idx, minlength=bins)
+    p_sum = np.bincount(idx, weights=p, minlength=bins)
+    y_sum = np.bincount(idx, weights=y, minlength=bins)
+    rows, ece = [], 0.0
+    for b in range(bins):
+        if n[b] == 0:
+            continue
+        mean_p, rate = p_sum[b] / n[b], y_sum[b] / n[b]
+        ece += n[b] / max(1, p.size) * abs(mean_p - rate)
+        rows.append({"bin": [b / bins, (b + 1) / bins], "n": int(n[b]), "mean_p_move": mean_p, "move_rate": rate})
+    return {"bins": rows, "ece": float(ece)}
+
+
+def best_threshold(sw: Dict[str, np.ndarray], metric: str = "f1") -> Optional[Dict[str, float]]:
+    """Grid point with the highest `metric` (lowest threshold on ties); None if it is 0 everywhere."""
+    values = sw[metric]
+    if values.size == 0 or values.max() <= 0.0:
+        return None
+    i = int(np.argmax(values))
+    return {"threshold": float(sw["threshold"][i]), **{m: float(sw[m][i]) for m in METRICS}}
+
+
+def sweep_report(
+    y_true: np.ndarray,
+    p_move: np.ndarray,
+    groups: Optional[Sequence[str]] = None,
+    step: float = 0.01,
+    bins: int = 10,
+    metric: str = "f1",
+    current: Optional[float] = None,
+) -> Dict[str, Any]:
+    """Grid metrics (the PR/ROC curve points), AUCs, reliability table and best thresholds overall and per group."""
+    grid = threshold_grid(step)
+    sw = sweep(y_true, p_move, grid)
+    report: Dict[str, Any] = {
+        "metric": metric,
+        "grid": [
+            {"threshold": float(sw["threshold"][i]), **{m: float(sw[m][i]) for m in METRICS}}
+            for i in range(grid.size)
+        ],
+        "auc": curve_auc(y_true, p_move),
+        "calibration": reliability_table(y_true, p_move, bins=bins),
+        "best": best_threshold(sw, metric),
+        "by_group": {},
+    }
+    if current is not None:
+        cur = sweep(y_true, p_move, np.asarray([current]))
+        report["current"] = {"threshold": float(current), **{m: float(cur[m][0]) for m in METRICS}}
+    if groups is not None:
+        members: Dict[str, List[int]] = defaultdict(list)
+        for i, g in enumerate(groups):
+            members[str(g)].append(i)
+        y, p = np.asarray(y_true), np.asarray(p_move)
+        for g, idx in sorted(members.items()):
+            gy, gp = y[idx], p[idx]
+            report["by_group"][g] = {
+                "n": len(idx),
+                "n_move": int(np.sum(gy)),
+                "best": best_threshold(sweep(gy, gp, grid), metric),
+            }
+    return report
+
+
+def _fmt(v: Optional[float]) -> str:
+    return "n/a" if v is None else f"{v:.3f}"
+
+
+def print_sweep(report: Dict[str, Any]) -> None:
+    auc, cal, best = report["auc"], report["calibration"], report["best"]
+    print(f"Sweep: ROC AUC={_fmt(auc['roc_auc'])} AP={_fmt(auc['average_precision'])} ECE={cal['ece']:.3f}")
+    if "current" in report:
+        c = report["current"]
+        print(f"- current thr={c['threshold']:.2f}: P={c['precision']:.3f} R={c['recall']:.3f} F1={c['f1']:.3f}")
+    if best is not None:
+        print(
+            f"- best {report['metric']} thr={best['threshold']:.2f}: "
+            f"P={best['precision']:.3f} R={best['recall']:.3f} F1={best['f1']:.3f}"
+        )
+    for g, info in report["by_group"].items():
+        b = info["best"]
+        tail = "no MOVE rows" if b is None else f"thr={b['threshold']:.2f} F1={b['f1']:.3f}"
+        print(f"  - {g}: n={info['n']} move={info['n_move']} {tail}")
@@ -0,0 +1,78 @@
+# src/train_intent_heads.py
+from __future__ import annotations
+
+import argparse
+import json
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from src.embedding_store import DEFAULT_ROOT, embed_texts, normalize_text
+from src.intent_heads import DEFAULT_HEADS, INTENT_HEADS, fit_heads, weak_labels
+
+DEFAULT_TRAIN = [
+    "data/labels_safe_move_synth_merged.jsonl",
+    "data/labels_safe_move_gold.jsonl",
+]
+
+
+def read_labelled_texts(paths: List[str]) -> Tuple[List[str], List[Optional[str]]]:
+    """Distinct user texts across the label files, each with the first synth category seen for it."""
+    by_text: Dict[str, Optional[str]] = {}
+    for path in paths:
+        with Path(path).open("r", encoding="utf-8") as f:
+            for line in f:
+                if not line.strip():
+                    continue
+                row = json.loads(line)
+                text = normalize_text(row.get("user_text", ""))
+                if text and not by_text.get(text):
+                    by_text[text] = row.get("category") or None
+    return list(by_text), list(by_text.values())
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--train_jsonl", nargs="+", default=DEFAULT_TRAIN)
+    ap.add_argument("--out_model", default=str(DEFAULT_HEADS))
+    ap.add_argument("--embed_model", default="sentence-transformers/all-MiniLM-L6-v2")
+    ap.add_argument("--embed_store", default=str(DEFAULT_ROOT), help="Shared embedding store dir ('' disables)")
+    ap.add_argument("--min_positives", type=int, default=5, help="Heads with fewer positives (or negatives) stay regex")
+    ap.add_argument("--C", type=float, default=1.0)
+    ap.add_argument("--seed", type=int, default=42)
+    args = ap.parse_args()
+
+    texts, categories = read_labelled_texts(args.train_jsonl)
+    Y = weak_labels(texts, categories)
+    for k, head in enumerate(INTENT_HEADS):
+        print(f"[INFO] {head}: {int(Y[:, k].sum())}/{len(texts)} weak positives")
+
+    X = embed_texts(texts, args.embed_model, normalize=True, store_root=args.embed_store or None)
+    heads = fit_heads(
+        X,
+        Y,
+        min_positives=args.min_positives,
+        C=args.C,
+        seed=args.seed,
+        meta={
+            "type": "intent_heads",
+            "sentence_transformer": args.embed_model,
+            "normalize_embeddings": True,
+            "train_source": args.train_jsonl,
+            "n_train": len(texts),
+            "n_positive": {h: int(Y[:, k].sum()) for k, h in enumerate(INTENT_HEADS)},
+            "min_positives": args.min_positives,
+            "C": args.C,
+            "seed": args.seed,
+        },
+    )
+    skipped = [h for h in INTENT_HEADS if h not in heads.heads]
+    if skipped:
+        print(f"[WARN] too few weak labels for: {', '.join(skipped)} (these stay on their keyword detectors)")
+    heads.save(args.out_model)
+    print(f"[OK] Saved intent heads ({', '.join(heads.heads) or 'none'}) to: {args.out_model}")
+
+
+if __name__ == "__main__":
+    main()
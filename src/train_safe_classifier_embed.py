@@ -6,10 +6,11 @@ from typing import Any, Dict, List, Optional, Tuple
 
 import joblib
 import numpy as np
-from sentence_transformers import SentenceTransformer
 from sklearn.linear_model import LogisticRegression
 from sklearn.utils.class_weight import compute_class_weight
 
+from src.embedding_store import DEFAULT_ROOT, embed_texts
+
 
 def read_jsonl(path: Path) -> List[Dict[str, Any]]:
     rows: List[Dict[str, Any]] = []
@@ -108,6 +109,7 @@ def main():
     ap.add_argument("--move_threshold", type=int, default=2, help="Label as MOVE if MOVE score >= this value")
     ap.add_argument("--out_model", default="models/safe_violation_clf_embed.joblib")
     ap.add_argument("--embed_model", default="sentence-transformers/all-MiniLM-L6-v2")
+    ap.add_argument("--embed_store", default=str(DEFAULT_ROOT), help="Shared embedding store dir ('' disables)")
     ap.add_argument("--max_iter", type=int, default=2000)
     ap.add_argument("--C", type=float, default=1.0)
     ap.add_argument("--seed", type=int, default=42)
@@ -126,13 +128,13 @@ def main():
         move_threshold=args.move_threshold,
     )
 
-    embedder = SentenceTransformer(args.embed_model)
-    X = embedder.encode(
+    X = embed_texts(
         texts,
+        args.embed_model,
+        normalize=True,
+        store_root=args.embed_store or None,
         batch_size=64,
         show_progress_bar=True,
-        convert_to_numpy=True,
-        normalize_embeddings=True,
     )
 
     classes = np.array([0, 1], dtype=np.int32)
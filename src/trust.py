@@ -2,8 +2,9 @@
 from __future__ import annotations
 
 from dataclasses import dataclass
-import re
-from typing import List, Tuple
+from typing import Optional
+
+from src.text_features import TurnFeatures, extract_features
 
 
 TRUST_TIERS = [
@@ -27,60 +28,29 @@ class TrustState:
         return "T3"
 
 
-_EXPLICIT_PATTERNS = [
-    r"\b(sex|f\*+k|fuck|blowjob|handjob|oral)\b",
-    r"\b(nudes|naked|nude)\b",
-    r"\b(suck|ride)\b",
-    r"\b(porn|xxx)\b",
-]
-
-_SUGGESTIVE_PATTERNS = [
-    r"\b(turn on|turned on|horny)\b",
-    r"\b(make out|hook ?up)\b",
-    r"\b(sexy|hot)\b",
-    r"\b(in bed|in the bedroom)\b",
-]
-
-_CONSENT_PATTERNS = [
-    r"\b(i (do )?want|i'?m into|i'?d like|sounds good|that works|i'?m comfortable|yes)\b",
-]
-
-_BOUNDARY_OK_PATTERNS = [
-    r"\b(okay|ok|no worries|all good|i get it|understood|that'?s fair)\b",
-]
-
-_LOCATION_REQUEST_PATTERNS = [
-    r"\b(where do you live|your address|send (me )?your location|share location|drop your address)\b",
-    r"\b(come over|meet (me )?now|meet up now)\b",
-]
-
-
-def classify_erotic_intent(text: str) -> str:
-    t = (text or "").lower()
-    if any(re.search(p, t) for p in _EXPLICIT_PATTERNS):
+def classify_erotic_intent(text: str, features: Optional[TurnFeatures] = None) -> str:
+    f = features or extract_features(text, ("explicit", "suggestive"))
+    if f.any("explicit"):
         return "explicit"
-    if any(re.search(p, t) for p in _SUGGESTIVE_PATTERNS):
+    if f.any("suggestive"):
         return "suggestive"
     return "none"
 
 
-def detect_consent(text: str, erotic_level: str) -> str:
-    t = (text or "").lower()
+def detect_consent(text: str, erotic_level: str, features: Optional[TurnFeatures] = None) -> str:
     if erotic_level == "none":
         return "none"
-    if any(re.search(p, t) for p in _CONSENT_PATTERNS):
+    if (features or extract_features(text, ("consent",))).any("consent"):
         return "explicit" if erotic_level == "explicit" else "suggestive"
     return "none"
 
 
-def detect_boundary_ack(text: str) -> bool:
-    t = (text or "").lower()
-    return any(re.search(p, t) for p in _BOUNDARY_OK_PATTERNS)
+def detect_boundary_ack(text: str, features: Optional[TurnFeatures] = None) -> bool:
+    return (features or extract_features(text, ("boundary_ack",))).any("boundary_ack")
 
 
-def detect_location_request(text: str) -> bool:
-    t = (text or "").lower()
-    return any(re.search(p, t) for p in _LOCATION_REQUEST_PATTERNS)
+def detect_location_request(text: str, features: Optional[TurnFeatures] = None) -> bool:
+    return (features or extract_features(text, ("location_request",))).any("location_request")
 
 
 def clamp_trust(value: float) -> float:
@@ -0,0 +1,499 @@
+# src/turn_engine.py
+from __future__ import annotations
+
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+import time
+from typing import Any, Callable, Dict, Iterator, List, Optional
+
+from src.chat_session import (
+    BLOCK_REPLY,
+    ChatSession,
+    asked_question,
+    build_turn_messages,
+    is_bio_intent,
+    is_low_engagement,
+    is_name_intent,
+    is_pics_intent,
+    system_context_parts,
+)
+from src.conversation_phase import ConversationPhase, PhaseState
+from src.intent_heads import INTENT_THRESHOLD, IntentHeads
+from src.memory import Embedder, MemoryItem
+from src.response_guards import StreamingGuard, enforce_identity, reality_guard, strip_questions
+from src.response_planner import plan_response, StylePlan
+from src.safety_rules import obvious_escalation
+from src.safety_templates import boundary_safe_reply_contextual, soft_deflect_reply
+from src.text_features import TurnFeatures, extract_features
+from src.trust import (
+    TrustState,
+    classify_erotic_intent,
+    detect_boundary_ack,
+    detect_consent,
+    detect_location_request,
+    update_trust,
+)
+
+# stage names in execution order; a turn records only the stages it ran
+STAGES = (
+    "features",
+    "command",
+    "safety_score",
+    "detect",
+    "gate",
+    "block",
+    "plan",
+    "llm",
+    "guards",
+    "phase",
+    "memory",
+    "trust",
+)
+
+StageHook = Callable[[str, float], None]
+
+
+@dataclass
+class TurnResult:
+    reply: str
+    mode: str
+    gate: Optional[Any] = None  # SafetyScore; None for commands and intents
+    rule_reason: str = ""
+    phase: Optional[PhaseState] = None
+    style_plan: Optional[StylePlan] = None
+    trust: Optional[TrustState] = None
+    added_items: List[MemoryItem] = field(default_factory=list)
+    extra: str = ""
+    trace: Dict[str, float] = field(default_factory=dict)  # stage -> seconds, plus "total"
+
+    def as_dict(self) -> Dict[str, Any]:
+        out: Dict[str, Any] = {"reply": self.reply, "mode": self.mode}
+        if self.gate is not None:
+            out["gate"] = self.gate.as_dict()
+        if self.rule_reason:
+            out["rule"] = self.rule_reason
+        if self.phase is not None:
+            out["phase"] = {
+                "phase": self.phase.phase.value,
+                "flirt": self.phase.flirt_score,
+                "intimacy": self.phase.intimacy_score,
+                "erotic": self.phase.erotic_score,
+            }
+        if self.style_plan is not None:
+            out["style_plan"] = {"plan": self.style_plan.plan, "ask_question": self.style_plan.ask_question}
+        if self.trust is not None:
+            out["trust"] = {
+                "level": self.trust.level,
+                "tier": self.trust.tier(),
+                "consent": self.trust.consent_state,
+                "reason": self.trust.last_reason,
+            }
+        if self.added_items:
+            out["memory_added"] = [i.as_dict() for i in self.added_items]
+        if self.extra:
+            out["extra"] = self.extra.strip()
+        out["trace_ms"] = {k: round(v * 1000.0, 3) for k, v in self.trace.items()}
+        return out
+
+
+@dataclass
+class _Turn:
+    """Scratch state handed from stage to stage within one step()."""
+
+    user: str
+    trace: Dict[str, float]
+    features: Optional[TurnFeatures] = None
+    s: Any = None
+    rule_hit: bool = False
+    rule_reason: str = ""
+    location_request: bool = False
+    phase_before: Optional[PhaseState] = None
+    erotic_level: str = "none"
+    erotic_intent: bool = False
+    trust_state: Optional[TrustState] = None
+    allow_erotic: bool = True
+    erotic_block_reasons: List[str] = field(default_factory=list)
+    allow_city_share: bool = False
+    trust_relax_reason: str = ""
+    block_reasons: List[str] = field(default_factory=list)
+    mode: str = "NORMAL"
+    reply: str = ""
+    style_plan: Optional[StylePlan] = None
+    messages: List[Dict[str, str]] = field(default_factory=list)
+    new_state: Optional[PhaseState] = None
+    added_items: List[MemoryItem] = field(default_factory=list)
+    intents: Optional[Dict[str, float]] = None
+
+
+class TurnEngine:
+    """
+    The v0.5 chat turn as explicit stages:
+
+      features -> command -> safety_score -> detect -> gate -> block -> plan -> llm ->
+      guards -> phase -> memory -> trust
+
+    Each stage is timed with perf_counter into `TurnResult.trace`, and every
+    `stage_hooks` callback gets (stage, seconds) as it finishes. Models are
+    shared; all conversation state lives on the ChatSession passed to step().
+    `llm` needs chat() and count_tokens(), plus chat_stream() for streaming.
+    """
+
+    def __init__(
+        self,
+        scorer: Any,
+        llm: Any = None,
+        stage_hooks: Optional[List[StageHook]] = None,
+        intent_heads: Optional[IntentHeads] = None,
+    ):
+        self.scorer = scorer
+        self.llm = llm
+        self.stage_hooks: List[StageHook] = list(stage_hooks or [])
+        self.intent_heads = intent_heads
+
+    @contextmanager
+    def _stage(self, trace: Dict[str, float], name: str) -> Iterator[None]:
+        t0 = time.perf_counter()
+        try:
+            yield
+        finally:
+            dt = time.perf_counter() - t0
+            trace[name] = trace.get(name, 0.0) + dt
+            for hook in self.stage_hooks:
+                hook(name, dt)
+
+    def _embedder(self) -> Optional[Embedder]:
+        # memory hooks are ranked with the safety scorer's sentence embedder when it has
+        # one; the user turn itself reuses SafetyScore.embedding when the gate set it
+        return getattr(self.scorer, "embed_many", None)
+
+    def step(
+        self,
+        session: ChatSession,
+        user_text: str,
+        on_sentence: Optional[Callable[[str], None]] = None,
+        llm: Any = None,
+    ) -> TurnResult:
+        """
+        Runs one user message. With `on_sentence`, the reply is streamed and
+        each guarded sentence is passed to it as it completes. `llm` overrides
+        the engine's client for this call (the server passes a per-session
+        handle onto its shared pool).
+        """
+        t0 = time.perf_counter()
+        t = _Turn(user=user_text, trace={})
+
+        with self._stage(t.trace, "features"):
+            # every keyword detector of the turn, in one pass over the text
+            t.features = extract_features(user_text)
+        with self._stage(t.trace, "command"):
+            quick = self._command(session, user_text, t.features)
+        if quick is not None:
+            quick.trace = t.trace
+            t.trace["total"] = time.perf_counter() - t0
+            return quick
+
+        with self._stage(t.trace, "safety_score"):
+            t.s = self.scorer.score(user_text, threshold=session.settings.threshold)
+        with self._stage(t.trace, "detect"):
+            self._detect(session, t)
+        with self._stage(t.trace, "gate"):
+            self._gate(session, t)
+        with self._stage(t.trace, "block"):
+            self._block(session, t)
+        if t.mode == "NORMAL":
+            self._generate(session, t, llm or self.llm, on_sentence)
+        session.history.add("assistant", t.reply)
+        with self._stage(t.trace, "phase"):
+            if t.mode != "BLOCK":
+                t.new_state = session.tracker.update(
+                    user_text, t.reply, t.s.label, t.rule_hit, t.features, intents=t.intents
+                )
+            else:
+                t.new_state = session.tracker.last_state
+        with self._stage(t.trace, "memory"):
+            if t.mode != "BLOCK" and t.s.label == "SAFE" and not t.rule_hit:
+                t.added_items = session.memory.update_from_text(user_text, embed=self._embedder())
+                session.memory.update_boundary(user_text)
+        with self._stage(t.trace, "trust"):
+            self._trust(session, t)
+
+        result = self._result(session, t)
+        t.trace["total"] = time.perf_counter() - t0
+        return result
+
+    # ---- stages ------------------------------------------------------------
+
+    def _command(self, session: ChatSession, user: str, features: Optional[TurnFeatures] = None) -> Optional[TurnResult]:
+        if user.startswith("/"):
+            return handle_command(session, user)
+        return intent_reply(session, user, features)
+
+    def _detect(self, session: ChatSession, t: _Turn) -> None:
+        user, f = t.user, t.features
+        t.rule_hit, t.rule_reason = obvious_escalation(user, f)
+        t.location_request = detect_location_request(user, f)
+        if self.intent_heads is not None:
+            # one matmul on the gate's embedding; regex-only when the gate did not embed the turn
+            t.intents = self.intent_heads.predict(getattr(t.s, "embedding", None))
+            if t.intents and t.intents.get("location_request", 0.0) >= INTENT_THRESHOLD:
+                t.location_request = True
+
+        session.history.add("user", user)
+
+        t.phase_before = session.tracker.last_state
+        t.erotic_level = classify_erotic_intent(user, f)
+        t.erotic_intent = t.erotic_level != "none"
+        consent_update = detect_consent(user, t.erotic_level, f)
+        if consent_update != "none":
+            session.consent_state = consent_update
+
+    def _gate(self, session: ChatSession, t: _Turn) -> None:
+        bot_profile = session.bot_profile
+        phase_before = t.phase_before
+        trust_state = t.trust_state = TrustState(session.trust_level, session.consent_state)
+
+        if phase_before.phase in {
+            ConversationPhase.OPENING,
+            ConversationPhase.RAPPORT,
+            ConversationPhase.FLIRTING,
+        }:
+            t.allow_erotic = False
+            t.erotic_block_reasons.append("phase_early")
+        if bot_profile.erotic_openness < 0.45:
+            t.allow_erotic = False
+            t.erotic_block_reasons.append("low_openness")
+        if bot_profile.pace == "slow" and phase_before.intimacy_score < 0.40:
+            t.allow_erotic = False
+            t.erotic_block_reasons.append("slow_pace")
+        if bot_profile.pace == "medium" and phase_before.intimacy_score < 0.30:
+            t.allow_erotic = False
+            t.erotic_block_reasons.append("mid_pace")
+
+        t.allow_city_share = trust_state.level >= 0.8
+        erotic_allowed_by_trust = False
+        if t.erotic_level == "none":
+            erotic_allowed_by_trust = True
+        elif t.erotic_level == "suggestive":
+            erotic_allowed_by_trust = trust_state.level >= 0.3
+        elif t.erotic_level == "explicit":
+            erotic_allowed_by_trust = (
+                trust_state.level >= 0.6
+                and trust_state.consent_state == "explicit"
+                and phase_before.phase in {ConversationPhase.INTIMATE, ConversationPhase.EROTIC}
+            )
+
+        def _repair() -> str:
+            return boundary_safe_reply_contextual(
+                user_text=t.user,
+                phase=phase_before.phase.value,
+                persona=session.settings.persona,
+                bot_profile=bot_profile,
+                trust=trust_state.level,
+                rng=session.rng,
+            )
+
+        if t.rule_hit or (t.location_request and not t.allow_city_share):
+            t.reply, t.mode = _repair(), "SAFETY_REPAIR"
+        elif t.s.label == "MOVE":
+            if trust_state.level < 0.3:
+                t.reply, t.mode = _repair(), "SAFETY_REPAIR"
+            elif t.erotic_level == "none":
+                t.trust_relax_reason = "trust_false_positive"
+            elif t.erotic_level == "suggestive" and erotic_allowed_by_trust:
+                t.trust_relax_reason = "trust_suggestive"
+            elif t.erotic_level == "explicit" and erotic_allowed_by_trust:
+                t.trust_relax_reason = "trust_explicit_consent"
+            else:
+                t.reply, t.mode = _repair(), "SAFETY_REPAIR"
+        elif t.erotic_intent and (not t.allow_erotic or not erotic_allowed_by_trust):
+            t.reply, t.mode = soft_deflect_reply(session.rng), "SOFT_DEFLECT"
+
+    def _block(self, session: ChatSession, t: _Turn) -> None:
+        bot_profile = session.bot_profile
+        if t.mode == "SAFETY_REPAIR":
+            session.safety_repair_count += 1
+        if t.mode == "SOFT_DEFLECT":
+            session.soft_deflect_count += 1
+        if is_low_engagement(t.user):
+            session.low_engagement_count += 1
+        else:
+            session.low_engagement_count = max(0, session.low_engagement_count - 1)
+
+        if t.rule_hit and bot_profile.boundary_strictness >= 0.6:
+            t.block_reasons.append("rule_hit")
+        if session.safety_repair_count >= 2 and bot_profile.boundary_strictness >= 0.7:
+            t.block_reasons.append("repeat_boundary")
+        if session.soft_deflect_count >= 3 and t.erotic_intent:
+            t.block_reasons.append("repeat_escalation")
+        if session.low_engagement_count >= 3 and bot_profile.directness >= 0.6:
+            t.block_reasons.append("low_engagement")
+        if t.block_reasons:
+            t.reply, t.mode = BLOCK_REPLY, "BLOCK"
+
+    def _generate(
+        self,
+        session: ChatSession,
+        t: _Turn,
+        llm: Any,
+        on_sentence: Optional[Callable[[str], None]],
+    ) -> None:
+        bot_profile = session.bot_profile
+        trust_state = t.trust_state
+        with self._stage(t.trace, "plan"):
+            allow_erotic = t.allow_erotic and trust_state.level >= 0.6 and trust_state.consent_state == "explicit"
+            t.style_plan = plan_response(
+                t.user, t.phase_before.phase, bot_profile, session.last_asked_question, session.rng
+            )
+            parts = system_context_parts(
+                t.phase_before,
+                bot_profile,
+                session.memory.get_hooks(
+                    k=2, query=t.user, embed=self._embedder(), query_vec=getattr(t.s, "embedding", None)
+                ),
+                allow_erotic,
+                session.settings.user_gender,
+                session.settings.attraction,
+                trust_state,
+                t.allow_city_share,
+                t.style_plan,
+            )
+            system_context = "".join(parts)
+            history = session.history.messages(reserve_tokens=session.system_context_tokens(parts))
+            t.messages = build_turn_messages(history, system_context)
+
+        if on_sentence is not None:
+            # guards run per sentence inside the stream, so they are part of "llm"
+            with self._stage(t.trace, "llm"):
+                guard = StreamingGuard(bot_profile, ask_question=t.style_plan.ask_question)
+                for chunk in llm.chat_stream(t.messages):
+                    for sentence in guard.feed(chunk):
+                        on_sentence(sentence)
+                for sentence in guard.finish():
+                    on_sentence(sentence)
+                t.reply = guard.text()
+            return
+
+        with self._stage(t.trace, "llm"):
+            reply = llm.chat(t.messages)
+        with self._stage(t.trace, "guards"):
+            reply = enforce_identity(reply, bot_profile)
+            reply = reality_guard(reply, bot_profile)
+            if not t.style_plan.ask_question:
+                reply = strip_questions(reply)
+        t.reply = reply
+
+    def _trust(self, session: ChatSession, t: _Turn) -> None:
+        s = t.s
+        new_state = t.new_state
+        trust_delta = 0.0
+        trust_reason = "baseline"
+        if s.label == "SAFE" and not t.rule_hit:
+            trust_delta += 0.01
+            trust_reason = "safe_turn"
+        if new_state.intimacy_score >= 0.3:
+            trust_delta += 0.01
+        if new_state.flirt_score >= 0.3:
+            trust_delta += 0.01
+        if t.added_items:
+            trust_delta += 0.01
+        if t.mode == "SAFETY_REPAIR":
+            trust_delta -= 0.05
+            trust_reason = "repair"
+        if t.rule_hit:
+            trust_delta -= 0.08
+            trust_reason = "rule_hit"
+        if t.mode == "SOFT_DEFLECT" and t.erotic_intent:
+            trust_delta -= 0.02
+            trust_reason = "deflect"
+        if detect_boundary_ack(t.user, t.features) and session.last_mode == "SAFETY_REPAIR":
+            trust_delta += 0.02
+            trust_reason = "boundary_ack"
+        if session.low_engagement_count >= 2:
+            trust_delta -= 0.01
+            trust_reason = "low_engagement"
+
+        session.trust_level = update_trust(session.trust_level, trust_delta)
+        t.trust_state = TrustState(session.trust_level, session.consent_state, trust_reason)
+        session.memory.update_trust(session.trust_level, session.consent_state, trust_reason)
+
+    def _result(self, session: ChatSession, t: _Turn) -> TurnResult:
+        extra = f" rule={t.rule_reason}" if t.rule_hit else ""
+        if t.mode == "SOFT_DEFLECT" and t.erotic_block_reasons:
+            extra = f"{extra} deflect={','.join(t.erotic_block_reasons)}"
+        if t.mode == "BLOCK" and t.block_reasons:
+            extra = f"{extra} block={','.join(t.block_reasons)}"
+        if t.trust_relax_reason:
+            extra = f"{extra} relax={t.trust_relax_reason}"
+
+        session.last_mode = t.mode
+        session.last_asked_question = asked_question(t.reply)
+        if t.mode == "BLOCK":
+            session.closed = True
+
+        return TurnResult(
+            reply=t.reply,
+            mode=t.mode,
+            gate=t.s,
+            rule_reason=t.rule_reason if t.rule_hit else "",
+            phase=t.new_state,
+            style_plan=t.style_plan,
+            trust=t.trust_state,
+            added_items=t.added_items,
+            extra=extra,
+            trace=t.trace,
+        )
+
+
+def handle_command(session: ChatSession, cmd: str) -> TurnResult:
+    bot_profile = session.bot_profile
+    cmd = cmd.strip().lower()
+    if cmd == "/profile":
+        return TurnResult(f"{bot_profile.profile_card()} | traits: {bot_profile.trait_summary()}", "PROFILE")
+    if cmd == "/pics":
+        return TurnResult(bot_profile.photos_detail(), "PICS")
+    if cmd == "/name":
+        return TurnResult(f"I'm {bot_profile.name} ({bot_profile.pronouns}).", "NAME")
+    if cmd == "/switch":
+        session.switch_profile()
+        bot_profile = session.bot_profile
+        return TurnResult(f"Switched to {bot_profile.name}. {bot_profile.profile_card()}", "SWITCH")
+    return TurnResult("Commands: /profile /pics /name /switch", "HELP")
+
+
+def intent_reply(session: ChatSession, user: str, features: Optional[TurnFeatures] = None) -> Optional[TurnResult]:
+    bot_profile = session.bot_profile
+    features = features or extract_features(user)
+    if is_name_intent(user, features):
+        return TurnResult(f"I'm {bot_profile.name} ({bot_profile.pronouns}).", "NAME")
+    if is_pics_intent(user, features):
+        return TurnResult(bot_profile.photos_detail(), "PICS")
+    if is_bio_intent(user, features):
+        return TurnResult(f"{bot_profile.profile_card()} | traits: {bot_profile.trait_summary()}", "BIO")
+    return None
+
+
+def format_turn_debug(out: TurnResult, memory_total: int, show_trace: bool = False) -> List[str]:
+    if out.gate is None:
+        return []
+    s = out.gate
+    new_state = out.phase
+    trust_state = out.trust
+    lines = [
+        f"     [gate={s.label} p_move={s.p_move:.3f} thr={s.threshold:.2f}"
+        f"{f' via={s.stage}' if s.stage else ''} mode={out.mode}{out.extra}]",
+        f"     [phase={new_state.phase.value} flirt={new_state.flirt_score:.2f} "
+        f"intimate={new_state.intimacy_score:.2f} erotic={new_state.erotic_score:.2f}]",
+    ]
+    if out.style_plan:
+        lines.append(
+            f"     [style plan={out.style_plan.plan} ask_question={'yes' if out.style_plan.ask_question else 'no'}]"
+        )
+    lines.append(
+        f"     [trust={trust_state.level:.2f} tier={trust_state.tier()} consent={trust_state.consent_state} reason={trust_state.last_reason}]"
+    )
+    if out.added_items:
+        lines.append(f"     [memory:+{len(out.added_items)} items total={memory_total}]")
+    if show_trace and out.trace:
+        stages = " ".join(f"{k}={v * 1000.0:.1f}" for k, v in out.trace.items())
+        lines.append(f"     [trace_ms {stages}]")
+    return lines